@@ -0,0 +1,103 @@
+"""
+Result cache with request coalescing for DataLab analyses.
+
+Results are keyed by the content hash of the dataset(s) they were computed from
+plus the analysis parameters, so every session that points at the same data
+shares them. While a result is being computed, identical requests await the
+same in-flight computation (single-flight) instead of starting their own.
+If the request that started a computation is cancelled, its waiters are
+released and retry rather than waiting forever. Computations run in the
+threadpool so the event loop stays responsive.
+"""
+
+import asyncio
+import os
+import threading
+from collections import OrderedDict
+
+from starlette.concurrency import run_in_threadpool
+
+DEFAULT_MAX_ENTRIES = int(os.environ.get("DATALAB_ANALYSIS_CACHE_ENTRIES", 128))
+
+
+class AnalysisCache:
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._results = OrderedDict()  # key -> result
+        self._inflight = {}  # key -> asyncio.Future
+        self._hits = 0
+        self._misses = 0
+        self._coalesced = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key in self._results:
+                self._results.move_to_end(key)
+                return self._results[key]
+        return None
+
+    def set(self, key, result):
+        with self._lock:
+            self._results[key] = result
+            self._results.move_to_end(key)
+            while len(self._results) > self.max_entries:
+                self._results.popitem(last=False)
+
+    async def get_or_compute(self, key, compute):
+        """
+        Returns the cached result for ``key`` or runs ``compute()`` (a blocking
+        callable) exactly once, however many requests ask for it concurrently.
+        Cached results are shared and must not be mutated by callers.
+        """
+        result = self.get(key)
+        if result is not None:
+            self._hits += 1
+            return result
+
+        future = self._inflight.get(key)
+        if future is not None:
+            self._coalesced += 1
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                # Cancelled ourselves, or the owner was: only the latter is retried
+                if not future.cancelled() or asyncio.current_task().cancelling():
+                    raise
+            return await self.get_or_compute(key, compute)
+
+        self._misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result = await run_in_threadpool(compute)
+        except Exception as e:
+            future.set_exception(e)
+            # Mark as retrieved: waiters (if any) re-raise it, nobody else should log it
+            future.exception()
+            raise
+        except BaseException:
+            # The owner was cancelled (e.g. the client disconnected): release the waiters
+            future.cancel()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+        self.set(key, result)
+        future.set_result(result)
+        return result
+
+    def stats(self):
+        with self._lock:
+            entries = len(self._results)
+        return {
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "hits": self._hits,
+            "misses": self._misses,
+            "coalesced": self._coalesced,
+            "in_flight": len(self._inflight),
+        }
+
+
+analysis_cache = AnalysisCache()
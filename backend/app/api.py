@@ -1,12 +1,26 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request, Response
+from fastapi.concurrency import run_in_threadpool
 from .schema import (
-    WaterQualityInput, PredictionResponse, StatsResponse,
-    HealthResponse, pHForecastInput, pHForecastResponse, IoTReading
+    WaterQualityInput, PredictionResponse, StatsResponse, FeatureImportanceResponse,
+    HealthResponse, pHForecastInput, pHForecastResponse, NetworkPHForecastResponse, IoTReading,
+    FeedbackInput, FeedbackResponse, ShadowCandidateInput
 )
-from .services import model_service
+from .services import model_service, MODEL_DIR
+from .shadow import shadow_scorer
+from .training import model_path_for
+from .ph_forecaster import get_forecaster
+from .online_eval import online_evaluator
+from .http_cache import make_etag, is_fresh, not_modified, cache_headers
+from . import feedback
+import logging
+import os
+import time
 import numpy as np
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
+
+PH_FORECAST_BUDGET_MS = float(os.environ.get("PH_FORECAST_BUDGET_MS", 50))
 
 
 @router.get("/health", response_model=HealthResponse)
@@ -29,17 +43,129 @@ async def predict_water_quality(input_data: WaterQualityInput):
 
 
 @router.get("/stats", response_model=StatsResponse)
-async def get_model_stats():
-    # Resume stats as requested
+async def get_model_stats(request: Request, response: Response):
+    """
+    Live metrics of the deployed model: predictions joined with their lab labels,
+    over sliding windows. Answered from precomputed aggregates.
+    Revalidate with If-None-Match: the ETag changes with the model and with new evaluation events.
+    """
+    now = time.time()
+    etag = make_etag("stats", model_service.version, online_evaluator.version(now))
+    if is_fresh(request, etag):
+        return not_modified(etag)
+    response.headers.update(cache_headers(etag))
     return {
-        "r2_score": 0.8329,
-        "rmse": 0.012,
-        "recall_optimized": 0.90,
-        "model_name": "Random Forest (Balanced)",
+        "model_name": model_service.model_name(),
+        "threshold": model_service.threshold,
+        **online_evaluator.snapshot(now),
         "feature_importance": model_service.get_global_feature_importance()
     }
 
 
+@router.get("/feature-importance", response_model=FeatureImportanceResponse)
+async def get_feature_importance(request: Request, response: Response):
+    """Global SHAP feature importance; the ETag only changes when the model does."""
+    etag = make_etag("feature-importance", model_service.version)
+    if is_fresh(request, etag):
+        return not_modified(etag)
+    response.headers.update(cache_headers(etag))
+    return {
+        "model_name": model_service.model_name(),
+        "model_version": model_service.version,
+        "feature_importance": model_service.get_global_feature_importance()
+    }
+
+
+@router.post("/feedback", response_model=FeedbackResponse)
+async def submit_feedback(item: FeedbackInput):
+    """
+    Stores a lab-confirmed sample for the next incremental refresh.
+    """
+    sample = item.model_dump(exclude={"potable", "predicted_score", "prediction_id"})
+    # The score comes from the joined prediction when the client only sent its id
+    score = online_evaluator.record_label(
+        item.potable, item.prediction_id, item.predicted_score, model_service.threshold
+    )
+    pending = await run_in_threadpool(
+        feedback.feedback_store.append, sample, item.potable, score
+    )
+    return {"status": "stored", "pending_rows": pending}
+
+
+@router.get("/feedback/status")
+async def feedback_status():
+    state = feedback.feedback_store.state()
+    return {**state, "pending_rows": state["total_rows"] - state["consumed_rows"]}
+
+
+@router.post("/feedback/refresh")
+async def refresh_from_feedback():
+    """
+    Grows the model with trees fit on new feedback, retires the oldest trees
+    and re-tunes the threshold; the service switches to the refreshed model.
+    """
+    try:
+        result = await run_in_threadpool(feedback.refresh_model, feedback.feedback_store, MODEL_DIR)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if result["status"] == "refreshed":
+        model_service.reload()
+    return result
+
+
+@router.post("/shadow/candidates")
+async def register_shadow_candidate(item: ShadowCandidateInput):
+    """
+    Starts scoring a fraction of live /predict traffic with a candidate model, off the response path.
+    """
+    if (item.session_id is None) == (item.model_file is None):
+        raise HTTPException(status_code=400, detail="Provide exactly one of session_id or model_file")
+    if item.session_id is not None:
+        path = model_path_for(os.path.basename(item.session_id))
+    else:
+        # Only files inside the model directory can be loaded
+        path = os.path.join(MODEL_DIR, os.path.basename(item.model_file))
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Candidate model not found")
+
+    try:
+        candidate = await run_in_threadpool(
+            shadow_scorer.register, item.name, path, item.fraction, item.threshold,
+            list(WaterQualityInput.model_fields)
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return candidate.to_dict()
+
+
+@router.get("/shadow/candidates")
+async def get_shadow_stats():
+    """Agreement, score deltas and latency of every candidate against production."""
+    return shadow_scorer.stats()
+
+
+@router.delete("/shadow/candidates/{name}")
+async def remove_shadow_candidate(name: str):
+    if not shadow_scorer.remove(name):
+        raise HTTPException(status_code=404, detail="Candidate not found")
+    return {"status": "removed", "name": name}
+
+
+@router.post("/shadow/candidates/{name}/promote")
+async def promote_shadow_candidate(name: str):
+    """
+    Makes a candidate the production model once it has enough shadow samples.
+    """
+    try:
+        candidate = await run_in_threadpool(shadow_scorer.promote, name, MODEL_DIR, model_service.reference_rows())
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Candidate not found")
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    model_service.reload()
+    return {"status": "promoted", **candidate.to_dict()}
+
+
 @router.get("/sample", response_model=WaterQualityInput)
 async def get_random_sample():
     try:
@@ -90,6 +216,44 @@ async def forecast_ph(input_data: pHForecastInput):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/predict-ph/network", response_model=NetworkPHForecastResponse)
+async def forecast_ph_network(date_index: int | None = None):
+    """
+    Next-step pH for all monitoring locations of the spatio-temporal dataset in one
+    batched call. ``date_index`` forecasts the date after it (default: the latest date).
+    """
+    # The first call converts the dataset and trains the model; keep that off the event loop
+    forecaster = await run_in_threadpool(get_forecaster)
+    start = time.perf_counter()
+    try:
+        predicted, actual = forecaster.forecast(date_index)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    latency_ms = (time.perf_counter() - start) * 1000
+
+    store = forecaster.store
+    index = store.shape[0] - 1 if date_index is None else date_index
+    last = store.ph[index]
+    forecasts = [
+        {
+            "location_id": location_id,
+            "predicted_ph": round(float(predicted[i]), 6),
+            "last_ph": round(float(last[i]), 6),
+            "actual_ph": None if actual is None else round(float(actual[i]), 6),
+        }
+        for i, location_id in enumerate(store.location_ids)
+    ]
+    if latency_ms > PH_FORECAST_BUDGET_MS:
+        logger.warning("Network pH forecast took %.1f ms (budget %s ms)", latency_ms, PH_FORECAST_BUDGET_MS)
+    return {
+        "date_index": index,
+        "forecasts": forecasts,
+        "latency_ms": round(latency_ms, 3),
+        "budget_ms": PH_FORECAST_BUDGET_MS,
+        "within_budget": latency_ms <= PH_FORECAST_BUDGET_MS,
+        "model_metrics": forecaster.metrics,
+    }
+
 
 # In-memory store for the latest sensor reading (Simulator/ESP32 pushes here)
 latest_sensor_data = {}
@@ -0,0 +1,398 @@
+"""
+Typed columnar storage for DataLab datasets.
+
+A dataset is stored as a directory holding one ``.npy`` file per column plus a
+``schema.json`` manifest. Numeric columns are downcast (float64 -> float32,
+int64 -> smallest integer type) only when the round trip is exact, and every
+file can be opened memory-mapped, so loading a dataset or a subset of its
+columns costs almost nothing compared to re-parsing CSV text.
+
+Text columns are stored as their UTF-8 bytes back to back plus an int64 offsets
+array (row i is ``bytes[offsets[i]:offsets[i + 1]]``). Their size follows the
+total length of the text, so one long free-text value does not widen every row
+the way a fixed-width unicode array would.
+
+``ColumnarWriter`` builds the same layout from a stream of DataFrame chunks
+(e.g. an upload being parsed) while holding only one chunk in memory.
+"""
+
+import json
+import os
+import shutil
+import uuid
+
+import numpy as np
+import pandas as pd
+
+SCHEMA_FILE = "schema.json"
+
+
+def _downcast(values):
+    """Returns the most compact dtype that reproduces the column exactly."""
+    if values.dtype == np.float64:
+        as_f32 = values.astype(np.float32)
+        if np.array_equal(as_f32.astype(np.float64), values, equal_nan=True):
+            return as_f32
+        return values
+    if np.issubdtype(values.dtype, np.integer) and len(values):
+        return pd.to_numeric(pd.Series(values), downcast="integer").to_numpy()
+    return values
+
+
+def _encode_column(series):
+    """Returns (values, text offsets or None, null_mask or None, logical kind) for a column."""
+    if pd.api.types.is_bool_dtype(series) and not series.isna().any():
+        return series.to_numpy(dtype=bool), None, None, "bool"
+    if pd.api.types.is_numeric_dtype(series):
+        if series.isna().any():
+            values = series.to_numpy(dtype=np.float64, na_value=np.nan)
+        else:
+            values = np.asarray(series.to_numpy())
+            if values.dtype == object:
+                values = values.astype(np.float64)
+        return _downcast(values), None, None, "numeric"
+    # Text columns: UTF-8 bytes plus offsets, nulls kept in a side mask
+    mask = series.isna().to_numpy()
+    data, offsets = _encode_text(series.astype(object).where(~mask, ""))
+    return data, offsets, (mask if mask.any() else None), "text"
+
+
+def _encode_text(values):
+    """Returns (utf-8 bytes as uint8, int64 offsets of length rows + 1)."""
+    encoded = [str(v).encode("utf-8") for v in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+
+def _decode_text(data, offsets):
+    """Object array of the strings between consecutive offsets (relative to offsets[0])."""
+    offsets = np.asarray(offsets) - offsets[0]
+    raw = np.asarray(data).tobytes()
+    out = np.empty(len(offsets) - 1, dtype=object)
+    if not raw or np.asarray(data).max() < 0x80:
+        # ASCII: byte offsets are character offsets, so decode once and slice
+        text = raw.decode("ascii")
+        out[:] = [text[a:b] for a, b in zip(offsets[:-1].tolist(), offsets[1:].tolist())]
+    else:
+        out[:] = [raw[a:b].decode("utf-8") for a, b in zip(offsets[:-1].tolist(), offsets[1:].tolist())]
+    return out
+
+
+def write_columnar(df, directory):
+    """
+    Writes a DataFrame as a columnar dataset directory.
+    The directory is built under a temporary name and swapped in atomically.
+    """
+    parent = os.path.dirname(os.path.abspath(directory))
+    os.makedirs(parent, exist_ok=True)
+    staging = os.path.join(parent, f".{os.path.basename(directory)}.{uuid.uuid4().hex}.tmp")
+    os.makedirs(staging)
+
+    try:
+        columns = []
+        for i, name in enumerate(df.columns):
+            values, offsets, mask, kind = _encode_column(df[name])
+            entry = {"name": str(name), "file": f"{i}.npy", "dtype": values.dtype.str, "kind": kind}
+            np.save(os.path.join(staging, entry["file"]), values)
+            if offsets is not None:
+                entry["offsets"] = f"{i}.offsets.npy"
+                np.save(os.path.join(staging, entry["offsets"]), offsets)
+            if mask is not None:
+                entry["mask"] = f"{i}.mask.npy"
+                np.save(os.path.join(staging, entry["mask"]), mask)
+            columns.append(entry)
+
+        with open(os.path.join(staging, SCHEMA_FILE), "w") as f:
+            json.dump({"rows": int(len(df)), "columns": columns}, f)
+
+        if os.path.isdir(directory):
+            shutil.rmtree(directory)
+        os.replace(staging, directory)
+    except Exception:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+
+def _smallest_int(lo, hi):
+    for dtype in (np.int8, np.int16, np.int32, np.int64):
+        info = np.iinfo(dtype)
+        if info.min <= lo and hi <= info.max:
+            return np.dtype(dtype)
+    return np.dtype(np.uint64)
+
+
+def _chunk_kind(series):
+    if series.isna().all():
+        return "empty"  # says nothing about the column's type
+    if pd.api.types.is_bool_dtype(series):
+        return "bool"
+    if pd.api.types.is_integer_dtype(series):
+        return "int"
+    if pd.api.types.is_float_dtype(series):
+        return "float"
+    return "text"
+
+
+def _resolve_kind(kinds):
+    """Type of a column whose chunks have the given kinds: int and float widen to float, other mixes to text."""
+    present = set(kinds) - {"empty"}
+    nullable = "empty" in kinds
+    if not present:
+        return "float"
+    if present == {"int"}:
+        return "float" if nullable else "int"
+    if present <= {"int", "float"}:
+        return "float"
+    if present == {"bool"} and not nullable:
+        return "bool"
+    return "text"
+
+
+class ColumnarWriter:
+    """
+    Builds a columnar dataset from consecutive DataFrame chunks.
+
+    Each appended chunk is written to a staging directory right away, one file
+    per column, so memory use is bounded by a single chunk. ``commit`` settles
+    each column's type over all chunks (as ``pd.concat`` would), concatenates
+    the parts into the final files one column at a time and swaps the directory
+    in atomically. ``abort`` discards everything written so far.
+    """
+
+    def __init__(self, parent):
+        os.makedirs(parent, exist_ok=True)
+        self.staging = os.path.join(parent, f".writer.{uuid.uuid4().hex}.tmp")
+        os.makedirs(self.staging)
+        self.columns = None
+        self.rows = 0
+        self._parts = []  # per column: [(kind, rows), ...] in chunk order
+
+    def _part(self, i, n, suffix="npy"):
+        return os.path.join(self.staging, f"part.{i}.{n}.{suffix}")
+
+    def append(self, df):
+        if self.columns is None:
+            self.columns = [str(c) for c in df.columns]
+            self._parts = [[] for _ in self.columns]
+        n = len(self._parts[0])
+        for i, name in enumerate(df.columns):
+            series = df[name]
+            kind = _chunk_kind(series)
+            if kind == "text":
+                mask = series.isna().to_numpy()
+                data, offsets = _encode_text(series.astype(object).where(~mask, ""))
+                np.save(self._part(i, n), data)
+                np.save(self._part(i, n, "offsets.npy"), offsets)
+                np.save(self._part(i, n, "mask.npy"), mask)
+            elif kind != "empty":
+                np.save(self._part(i, n), series.to_numpy())
+            self._parts[i].append((kind, len(series)))
+        self.rows += len(df)
+
+    def kinds(self):
+        """Column name -> "int", "float", "bool" or "text" over all chunks appended so far."""
+        return {name: _resolve_kind([k for k, _ in parts]) for name, parts in zip(self.columns or [], self._parts)}
+
+    def commit(self, directory):
+        """Finalizes the dataset into ``directory``; the writer cannot be used afterwards."""
+        try:
+            columns = []
+            for i, name in enumerate(self.columns or []):
+                kind = _resolve_kind([k for k, _ in self._parts[i]])
+                if kind == "text":
+                    columns.append(self._finish_text(i, name))
+                else:
+                    columns.append(self._finish_values(i, name, kind))
+                for path in os.listdir(self.staging):
+                    if path.startswith(f"part.{i}."):
+                        os.remove(os.path.join(self.staging, path))
+
+            with open(os.path.join(self.staging, SCHEMA_FILE), "w") as f:
+                json.dump({"rows": int(self.rows), "columns": columns}, f)
+
+            if os.path.isdir(directory):
+                shutil.rmtree(directory)
+            os.replace(self.staging, directory)
+        except Exception:
+            self.abort()
+            raise
+
+    def abort(self):
+        shutil.rmtree(self.staging, ignore_errors=True)
+
+    def _load_parts(self, i):
+        """Yields (kind, values or None, rows) per chunk of column i."""
+        for n, (kind, rows) in enumerate(self._parts[i]):
+            yield kind, (None if kind == "empty" else np.load(self._part(i, n))), rows
+
+    def _finish_values(self, i, name, kind):
+        # First pass picks the most compact exact dtype, second pass fills it
+        if kind == "bool":
+            dtype = np.dtype(bool)
+        elif kind == "int":
+            lo = min(int(v.min()) for _, v, rows in self._load_parts(i) if rows)
+            hi = max(int(v.max()) for _, v, rows in self._load_parts(i) if rows)
+            dtype = _smallest_int(lo, hi)
+        else:
+            dtype = np.dtype(np.float32)
+            for _, values, _ in self._load_parts(i):
+                if values is not None:
+                    values = values.astype(np.float64)
+                    if not np.array_equal(values.astype(np.float32).astype(np.float64), values, equal_nan=True):
+                        dtype = np.dtype(np.float64)
+                        break
+
+        entry = {"name": name, "file": f"{i}.npy", "dtype": dtype.str, "kind": "bool" if kind == "bool" else "numeric"}
+        out = np.lib.format.open_memmap(os.path.join(self.staging, entry["file"]), mode="w+",
+                                        dtype=dtype, shape=(self.rows,))
+        start = 0
+        for _, values, rows in self._load_parts(i):
+            out[start:start + rows] = np.nan if values is None else values
+            start += rows
+        out.flush()
+        del out
+        return entry
+
+    def _text_parts(self, i):
+        """Yields (utf-8 bytes, offsets, mask) per chunk, stringifying chunks that parsed as numbers."""
+        for n, (kind, values, rows) in enumerate(self._load_parts(i)):
+            if kind == "text":
+                yield values, np.load(self._part(i, n, "offsets.npy")), np.load(self._part(i, n, "mask.npy"))
+            elif kind == "empty":
+                yield np.zeros(0, dtype=np.uint8), np.zeros(rows + 1, dtype=np.int64), np.ones(rows, dtype=bool)
+            else:
+                mask = pd.isna(values) if kind == "float" else np.zeros(rows, dtype=bool)
+                data, offsets = _encode_text(["" if m else str(v) for v, m in zip(values.tolist(), mask)])
+                yield data, offsets, mask
+
+    def _finish_text(self, i, name):
+        nbytes, has_nulls = 0, False
+        for data, _, mask in self._text_parts(i):
+            nbytes += len(data)
+            has_nulls = has_nulls or bool(mask.any())
+
+        entry = {"name": name, "file": f"{i}.npy", "dtype": np.dtype(np.uint8).str, "kind": "text",
+                 "offsets": f"{i}.offsets.npy"}
+        if has_nulls:
+            entry["mask"] = f"{i}.mask.npy"
+        data_out = np.lib.format.open_memmap(os.path.join(self.staging, entry["file"]), mode="w+",
+                                             dtype=np.uint8, shape=(nbytes,))
+        offsets_out = np.lib.format.open_memmap(os.path.join(self.staging, entry["offsets"]), mode="w+",
+                                                dtype=np.int64, shape=(self.rows + 1,))
+        mask_out = np.zeros(self.rows, dtype=bool) if has_nulls else None
+        offsets_out[0] = 0
+        row, byte = 0, 0
+        for data, offsets, mask in self._text_parts(i):
+            rows = len(offsets) - 1
+            data_out[byte:byte + len(data)] = data
+            offsets_out[row + 1:row + rows + 1] = offsets[1:] + byte
+            if mask_out is not None:
+                mask_out[row:row + rows] = mask
+            row += rows
+            byte += len(data)
+        data_out.flush()
+        offsets_out.flush()
+        del data_out, offsets_out
+        if mask_out is not None:
+            np.save(os.path.join(self.staging, entry["mask"]), mask_out)
+        return entry
+
+
+def columnar_exists(directory):
+    return os.path.exists(os.path.join(directory, SCHEMA_FILE))
+
+
+def read_schema(directory):
+    with open(os.path.join(directory, SCHEMA_FILE), "r") as f:
+        return json.load(f)
+
+
+def _load_column(directory, entry, mmap, rows=None):
+    """rows: None for the whole column or a contiguous slice."""
+    values = np.load(os.path.join(directory, entry["file"]), mmap_mode="r" if mmap else None)
+    if "offsets" in entry:
+        offsets = np.load(os.path.join(directory, entry["offsets"]), mmap_mode="r" if mmap else None)
+        if rows is not None:
+            offsets = offsets[rows.start:rows.stop + 1]
+        values = _decode_text(values[offsets[0]:offsets[-1]], offsets)
+    elif rows is not None:
+        values = values[rows]
+    if entry["kind"] != "text":
+        # Plain ndarray view over the mapping, so pandas never sees the memmap subclass
+        return np.asarray(values)
+    # Datasets written before the offsets layout hold fixed-width unicode
+    values = values.astype(object)
+    if "mask" in entry:
+        mask = np.load(os.path.join(directory, entry["mask"]))
+        values[mask if rows is None else mask[rows]] = None
+    return values
+
+
+def _take_column(directory, entry, rows):
+    """Values of a column at the given row positions, read through the memory map."""
+    values = np.load(os.path.join(directory, entry["file"]), mmap_mode="r")
+    if "offsets" in entry:
+        offsets = np.load(os.path.join(directory, entry["offsets"]), mmap_mode="r")
+        out = np.empty(len(rows), dtype=object)
+        out[:] = [values[a:b].tobytes().decode("utf-8")
+                  for a, b in zip(offsets[rows].tolist(), offsets[rows + 1].tolist())]
+    else:
+        out = np.asarray(values[rows])
+    if entry["kind"] != "text":
+        return out
+    out = out.astype(object)
+    if "mask" in entry:
+        out[np.load(os.path.join(directory, entry["mask"]), mmap_mode="r")[rows]] = None
+    return out
+
+
+def read_columnar(directory, columns=None, mmap=True):
+    """
+    Loads a columnar dataset as a DataFrame.
+    Numeric columns are zero-copy views over read-only memory maps; pass
+    ``columns`` to touch only the files that are actually needed.
+    """
+    schema = read_schema(directory)
+    entries = schema["columns"]
+    if columns is not None:
+        wanted = set(columns)
+        entries = [e for e in entries if e["name"] in wanted]
+
+    data = {e["name"]: _load_column(directory, e, mmap) for e in entries}
+    return pd.DataFrame(data, copy=False)
+
+
+def take_columnar(directory, rows, columns=None):
+    """
+    Loads only the given row positions (e.g. a sample) of a columnar dataset.
+    Each column is read through its memory map, so the cost follows len(rows),
+    not the size of the dataset.
+    """
+    rows = np.asarray(rows, dtype=np.int64)
+    entries = read_schema(directory)["columns"]
+    if columns is not None:
+        wanted = set(columns)
+        entries = [e for e in entries if e["name"] in wanted]
+    return pd.DataFrame({e["name"]: _take_column(directory, e, rows) for e in entries}, copy=False)
+
+
+def iter_columnar_chunks(directory, chunk_rows, columns=None):
+    """Yields the dataset as consecutive DataFrame chunks of at most chunk_rows rows."""
+    schema = read_schema(directory)
+    entries = schema["columns"]
+    if columns is not None:
+        wanted = set(columns)
+        entries = [e for e in entries if e["name"] in wanted]
+
+    for start in range(0, schema["rows"], chunk_rows):
+        rows = slice(start, min(start + chunk_rows, schema["rows"]))
+        yield pd.DataFrame({e["name"]: _load_column(directory, e, True, rows) for e in entries}, copy=False)
+
+
+def columnar_nbytes(directory):
+    """Returns the on-disk size of a columnar dataset."""
+    total = 0
+    for name in os.listdir(directory):
+        total += os.path.getsize(os.path.join(directory, name))
+    return total
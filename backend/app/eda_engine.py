@@ -0,0 +1,485 @@
+"""
+EDA computations for DataLab datasets.
+
+``compute_eda`` works on an in-memory DataFrame and is exact. For datasets that
+should not be materialised at once, ``compute_eda_streaming`` builds the same
+response from a stream of chunks:
+
+* pass 1 - counts, nulls, min/max, Welford mean/variance, a pairwise-complete
+  covariance matrix for correlations, class counts and a reservoir quantile
+  sketch per column (exact while a column fits in the reservoir);
+* pass 2 - fixed-bin histograms over the pass 1 range (identical bins to
+  ``np.histogram(values, bins=20)``) and exact outlier counts against the
+  sketched IQR bounds.
+
+``compute_eda_progressive`` answers within a time budget from a stratified
+row sample, with error bounds, while the exact result is computed elsewhere.
+``compute_comparison`` builds the before/after cleaning histograms.
+"""
+
+import time
+
+import numpy as np
+import pandas as pd
+
+HISTOGRAM_BINS = 20
+QUANTILE_SKETCH_SIZE = 100_000
+DESCRIBE_QUANTILES = (0.25, 0.5, 0.75)
+
+
+def target_column(columns):
+    """Name of the class label column: Potability if present, else the last column."""
+    return 'Potability' if 'Potability' in columns else columns[-1]
+
+
+def _format_histogram(counts, bin_edges):
+    return [
+        {"name": f"{bin_edges[i]:.1f}-{bin_edges[i+1]:.1f}", "count": int(counts[i])}
+        for i in range(len(counts))
+    ]
+
+
+def _correlation_list(cols, matrix):
+    # Flat list for easier frontend mapping
+    return [
+        {"x": row_col, "y": col_col, "value": float(matrix[i][j])}
+        for i, row_col in enumerate(cols)
+        for j, col_col in enumerate(cols)
+    ]
+
+
+def _class_distribution(dist_counts, total):
+    return [
+        {"label": str(k), "count": v, "percentage": round((v/total)*100, 1)}
+        for k, v in dist_counts.items()
+    ]
+
+
+def compute_eda(df):
+    """Returns statistics and chart data for an in-memory dataset."""
+    # Basic Stats
+    null_counts = df.isnull().sum().to_dict()
+    description = df.describe().to_dict()
+
+    # 1. Histograms for numerical columns
+    histograms = {}
+    numerical_cols = df.select_dtypes(include=[np.number]).columns.tolist()
+
+    for col in numerical_cols:
+        data = df[col].dropna().values
+        if len(data) > 0:
+            counts, bin_edges = np.histogram(data, bins=HISTOGRAM_BINS)
+            histograms[col] = _format_histogram(counts, bin_edges)
+        else:
+            histograms[col] = []
+
+    # 2. Correlation Matrix
+    corr = df.corr().fillna(0)
+    corr_list = _correlation_list(list(corr.columns), corr.values)
+
+    # 3. Class Distribution (Target)
+    target_col = target_column(df.columns)
+    total = len(df)
+    class_distribution = _class_distribution(df[target_col].value_counts().to_dict(), total)
+
+    # 4. Boxplot Stats & Outliers
+    boxplot_data = {}
+    for col in numerical_cols:
+        if col == target_col: continue
+        col_data = df[col].dropna()
+        if len(col_data) == 0: continue
+
+        q1 = col_data.quantile(0.25)
+        q3 = col_data.quantile(0.75)
+        iqr = q3 - q1
+        lower_bound = q1 - 1.5 * iqr
+        upper_bound = q3 + 1.5 * iqr
+
+        outliers = col_data[(col_data < lower_bound) | (col_data > upper_bound)]
+
+        boxplot_data[col] = {
+            "min": float(col_data.min()),
+            "q1": float(q1),
+            "median": float(col_data.median()),
+            "q3": float(q3),
+            "max": float(col_data.max()),
+            "outlier_count": len(outliers),
+            "outlier_percentage": round((len(outliers) / len(col_data)) * 100, 1)
+        }
+
+    return {
+        "total_rows": total,
+        "total_columns": len(df.columns),
+        "columns": list(df.columns),
+        "null_counts": null_counts,
+        "description": description,
+        "histograms": histograms,
+        "correlation_matrix": corr_list,
+        "class_distribution": class_distribution,
+        "boxplot_data": boxplot_data,
+        "target_col": target_col
+    }
+
+
+class ReservoirSketch:
+    """Uniform fixed-size sample of a stream, used to estimate quantiles."""
+
+    def __init__(self, size=QUANTILE_SKETCH_SIZE, seed=0):
+        self.size = size
+        self.seen = 0
+        self.sample = np.empty(0, dtype=np.float64)
+        self._rng = np.random.default_rng(seed)
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        free = self.size - len(self.sample)
+        if free > 0:
+            self.sample = np.concatenate([self.sample, values[:free]])
+            self.seen += min(free, len(values))
+            values = values[free:]
+        if len(values) == 0:
+            return
+
+        # Algorithm R, vectorised: item t (1-based) replaces a random slot with probability size/t
+        t = self.seen + np.arange(1, len(values) + 1)
+        accepted = np.nonzero(self._rng.random(len(values)) < self.size / t)[0]
+        slots = self._rng.integers(0, self.size, len(accepted))
+        # Later items win when they land on the same slot, as in the sequential algorithm
+        self.sample[slots] = values[accepted]
+        self.seen += len(values)
+
+    @property
+    def exact(self):
+        return self.seen <= self.size
+
+    def quantiles(self, qs):
+        if len(self.sample) == 0:
+            return [np.nan] * len(qs)
+        return [float(v) for v in np.quantile(self.sample, qs)]
+
+
+class StreamingEDA:
+    """Accumulates the ``compute_eda`` response over a two-pass stream of chunks."""
+
+    def __init__(self):
+        self.columns = None
+        self.numeric_cols = None
+        self.total = 0
+        self.null_counts = None
+        self.class_counts = {}
+
+    def _init_from_chunk(self, chunk):
+        self.columns = list(chunk.columns)
+        self.numeric_cols = chunk.select_dtypes(include=[np.number]).columns.tolist()
+        self.target_col = target_column(self.columns)
+        p = len(self.numeric_cols)
+        self.null_counts = np.zeros(len(self.columns), dtype=np.int64)
+        self.count = np.zeros(p, dtype=np.int64)
+        self.mean = np.zeros(p)
+        self.m2 = np.zeros(p)
+        self.min = np.full(p, np.inf)
+        self.max = np.full(p, -np.inf)
+        # Pairwise-complete co-moment sums, centred on a per-column shift for stability
+        self.shift = np.nan_to_num(chunk[self.numeric_cols].mean().to_numpy(dtype=np.float64))
+        self.pair_n = np.zeros((p, p))
+        self.pair_sx = np.zeros((p, p))
+        self.pair_sxx = np.zeros((p, p))
+        self.pair_sxy = np.zeros((p, p))
+        self.sketches = [ReservoirSketch() for _ in range(p)]
+
+    def update_first_pass(self, chunk):
+        if self.columns is None:
+            self._init_from_chunk(chunk)
+        self.total += len(chunk)
+        self.null_counts += chunk.isnull().sum().to_numpy(dtype=np.int64)
+
+        target_counts = chunk[self.target_col].value_counts()
+        for k, v in target_counts.items():
+            self.class_counts[k] = self.class_counts.get(k, 0) + int(v)
+
+        if not self.numeric_cols:
+            return
+        X = chunk[self.numeric_cols].to_numpy(dtype=np.float64)
+        present = ~np.isnan(X)
+
+        # Chan et al. merge of per-chunk (count, mean, M2) into the running totals
+        n_b = present.sum(axis=0)
+        has = n_b > 0
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean_b = np.where(has, np.nansum(X, axis=0) / np.maximum(n_b, 1), 0.0)
+            m2_b = np.nansum((X - mean_b) ** 2, axis=0)
+        n_a = self.count
+        n = n_a + n_b
+        delta = mean_b - self.mean
+        safe_n = np.maximum(n, 1)
+        self.mean = self.mean + delta * n_b / safe_n
+        self.m2 = self.m2 + m2_b + delta ** 2 * n_a * n_b / safe_n
+        self.count = n
+        if has.any():
+            self.min[has] = np.minimum(self.min[has], np.nanmin(X[:, has], axis=0))
+            self.max[has] = np.maximum(self.max[has], np.nanmax(X[:, has], axis=0))
+
+        X0 = np.where(present, X - self.shift, 0.0)
+        M = present.astype(np.float64)
+        self.pair_n += M.T @ M
+        self.pair_sx += X0.T @ M
+        self.pair_sxx += (X0 * X0).T @ M
+        self.pair_sxy += X0.T @ X0
+
+        for i in range(len(self.numeric_cols)):
+            self.sketches[i].update(X[present[:, i], i])
+
+    def finish_first_pass(self):
+        self.quantiles = [s.quantiles(DESCRIBE_QUANTILES) for s in self.sketches]
+        self.hist_counts = [np.zeros(HISTOGRAM_BINS, dtype=np.int64) for _ in self.numeric_cols]
+        self.hist_ranges = []
+        self.outlier_bounds = []
+        self.outlier_counts = np.zeros(len(self.numeric_cols), dtype=np.int64)
+        for i in range(len(self.numeric_cols)):
+            lo, hi = self.min[i], self.max[i]
+            if lo == hi:
+                # Same widening np.histogram applies to constant data
+                lo, hi = lo - 0.5, hi + 0.5
+            self.hist_ranges.append((lo, hi))
+            q1, _, q3 = self.quantiles[i]
+            iqr = q3 - q1
+            self.outlier_bounds.append((q1 - 1.5 * iqr, q3 + 1.5 * iqr))
+
+    def update_second_pass(self, chunk):
+        if not self.numeric_cols:
+            return
+        X = chunk[self.numeric_cols].to_numpy(dtype=np.float64)
+        for i in range(len(self.numeric_cols)):
+            if self.count[i] == 0:
+                continue
+            values = X[:, i]
+            values = values[~np.isnan(values)]
+            counts, _ = np.histogram(values, bins=HISTOGRAM_BINS, range=self.hist_ranges[i])
+            self.hist_counts[i] += counts
+            lower, upper = self.outlier_bounds[i]
+            self.outlier_counts[i] += int(((values < lower) | (values > upper)).sum())
+
+    def _correlation_matrix(self):
+        n, sx, sxx, sxy = self.pair_n, self.pair_sx, self.pair_sxx, self.pair_sxy
+        with np.errstate(invalid="ignore", divide="ignore"):
+            cov = n * sxy - sx * sx.T
+            var_x = n * sxx - sx ** 2
+            corr = cov / np.sqrt(var_x * var_x.T)
+        corr[(n < 2) | ~np.isfinite(corr)] = 0.0
+        return np.clip(corr, -1.0, 1.0)
+
+    def result(self):
+        description = {}
+        histograms = {}
+        boxplot_data = {}
+        for i, col in enumerate(self.numeric_cols):
+            count = int(self.count[i])
+            std = float(np.sqrt(self.m2[i] / (count - 1))) if count > 1 else np.nan
+            q1, median, q3 = self.quantiles[i]
+            if count == 0:
+                description[col] = {"count": 0.0, "mean": np.nan, "std": np.nan, "min": np.nan,
+                                    "25%": np.nan, "50%": np.nan, "75%": np.nan, "max": np.nan}
+                histograms[col] = []
+                continue
+
+            description[col] = {
+                "count": float(count), "mean": float(self.mean[i]), "std": std,
+                "min": float(self.min[i]), "25%": q1, "50%": median, "75%": q3,
+                "max": float(self.max[i]),
+            }
+            edges = np.linspace(self.hist_ranges[i][0], self.hist_ranges[i][1], HISTOGRAM_BINS + 1)
+            histograms[col] = _format_histogram(self.hist_counts[i], edges)
+
+            if col == self.target_col:
+                continue
+            outlier_count = int(self.outlier_counts[i])
+            boxplot_data[col] = {
+                "min": float(self.min[i]),
+                "q1": q1,
+                "median": median,
+                "q3": q3,
+                "max": float(self.max[i]),
+                "outlier_count": outlier_count,
+                "outlier_percentage": round((outlier_count / count) * 100, 1)
+            }
+
+        dist_counts = dict(sorted(self.class_counts.items(), key=lambda kv: kv[1], reverse=True))
+        return {
+            "total_rows": self.total,
+            "total_columns": len(self.columns),
+            "columns": self.columns,
+            "null_counts": {c: int(v) for c, v in zip(self.columns, self.null_counts)},
+            "description": description,
+            "histograms": histograms,
+            "correlation_matrix": _correlation_list(self.numeric_cols, self._correlation_matrix()),
+            "class_distribution": _class_distribution(dist_counts, self.total),
+            "boxplot_data": boxplot_data,
+            "target_col": self.target_col
+        }
+
+
+def compute_eda_streaming(make_chunks):
+    """
+    Computes the ``compute_eda`` response without materialising the dataset.
+    make_chunks: zero-argument callable returning a fresh iterator of DataFrame chunks.
+    """
+    engine = StreamingEDA()
+    for chunk in make_chunks():
+        engine.update_first_pass(chunk)
+    if engine.columns is None:
+        raise ValueError("Dataset is empty")
+    engine.finish_first_pass()
+    for chunk in make_chunks():
+        engine.update_second_pass(chunk)
+    return engine.result()
+
+
+def compute_comparison(df_raw, df_clean):
+    """Returns 'Before vs After' histogram data for every numeric column of the cleaned dataset."""
+    comparison_data = {}
+
+    for col in df_clean.select_dtypes(include=[np.number]).columns:
+        if col not in df_raw.columns:
+            continue
+
+        raw_vals = df_raw[col].dropna().values
+        clean_vals = df_clean[col].dropna().values
+
+        if len(raw_vals) == 0 or len(clean_vals) == 0:
+            continue
+
+        # Use fixed bins based on the full range (raw + clean) to align charts
+        min_val = min(raw_vals.min(), clean_vals.min())
+        max_val = max(raw_vals.max(), clean_vals.max())
+        bins = np.linspace(min_val, max_val, HISTOGRAM_BINS + 1)
+
+        raw_hist, _ = np.histogram(raw_vals, bins=bins)
+        clean_hist, _ = np.histogram(clean_vals, bins=bins)
+
+        comparison_data[col] = [
+            {"name": f"{bins[i]:.1f}-{bins[i+1]:.1f}", "Raw": int(raw_hist[i]), "Cleaned": int(clean_hist[i])}
+            for i in range(len(raw_hist))
+        ]
+
+    return {"comparisons": comparison_data}
+
+
+class TargetStrata:
+    """
+    The target column grouped into strata, plus its exact class counts.
+    Computed once per dataset, so each sampling round only draws rows instead
+    of re-scanning the target. Missing target values form their own stratum.
+    """
+
+    def __init__(self, target):
+        codes, _ = pd.factorize(target, use_na_sentinel=False)
+        self.total = len(codes)
+        order = np.argsort(codes, kind="stable")
+        self.members = np.split(order, np.flatnonzero(np.diff(codes[order])) + 1)
+        self.class_counts = pd.Series(target).value_counts().to_dict()
+
+    def sample(self, sample_size, seed=0):
+        """Sorted row positions of a proportionally stratified sample."""
+        rng = np.random.default_rng(seed)
+        picked = []
+        for members in self.members:
+            take = max(1, int(round(sample_size * len(members) / self.total)))
+            picked.append(rng.choice(members, size=min(take, len(members)), replace=False))
+        return np.sort(np.concatenate(picked))
+
+
+def stratified_sample_indices(target, sample_size, seed=0):
+    """
+    Returns sorted row positions of a proportionally stratified sample on ``target``.
+    Missing target values form their own stratum.
+    """
+    return TargetStrata(target).sample(sample_size, seed)
+
+
+def _scale_count(value, scale):
+    return int(round(value * scale))
+
+
+def compute_eda_sampled(df, sample_size, seed=0, strata=None):
+    """
+    Approximates ``compute_eda`` from a stratified row sample, scaled to the full dataset.
+    The class distribution is exact (the target column is read in full to stratify);
+    the response gains ``approximate``, ``sample_size`` and 95% ``error_bounds``.
+    """
+    if strata is None:
+        strata = TargetStrata(df[target_column(df.columns)])
+    return _eda_from_sample(df.iloc[strata.sample(sample_size, seed)], strata)
+
+
+def _eda_from_sample(sample, strata):
+    """Sampled EDA response from sample rows and the strata they were drawn from."""
+    total = strata.total
+    n = len(sample)
+    scale = total / n
+    # Finite population correction: the bounds shrink to zero as the sample reaches the whole dataset
+    fpc = np.sqrt(max(0.0, (total - n) / max(total - 1, 1)))
+    z = 1.96
+
+    result = compute_eda(sample)
+    result["total_rows"] = total
+    result["class_distribution"] = _class_distribution(strata.class_counts, total)
+    result["null_counts"] = {c: _scale_count(v, scale) for c, v in result["null_counts"].items()}
+    for stats in result["description"].values():
+        stats["count"] = float(_scale_count(stats["count"], scale))
+    for hist in result["histograms"].values():
+        for bucket in hist:
+            bucket["count"] = _scale_count(bucket["count"], scale)
+    for stats in result["boxplot_data"].values():
+        stats["outlier_count"] = _scale_count(stats["outlier_count"], scale)
+
+    mean_bounds = {}
+    for col, stats in result["description"].items():
+        col_n = sample[col].notna().sum()
+        std = stats.get("std")
+        mean_bounds[col] = float(z * std / np.sqrt(col_n) * fpc) if col_n > 1 and std == std else None
+
+    null_bounds = {}
+    for col in sample.columns:
+        p = sample[col].isna().mean()
+        null_bounds[col] = int(np.ceil(z * np.sqrt(p * (1 - p) / n) * fpc * total))
+
+    # Fisher z-transform interval for the widest correlation estimate
+    corr_half_width = 0.0
+    if n > 3:
+        r = np.clip(np.array([c["value"] for c in result["correlation_matrix"]]), -0.999999, 0.999999)
+        if len(r):
+            zr = np.arctanh(r)
+            delta = z / np.sqrt(n - 3) * fpc
+            corr_half_width = float(np.max(np.maximum(np.tanh(zr + delta) - r, r - np.tanh(zr - delta))))
+
+    result["approximate"] = n < total
+    result["sample_size"] = n
+    result["error_bounds"] = {
+        "confidence": 0.95,
+        "mean": mean_bounds,
+        "null_counts": null_bounds,
+        "correlation": corr_half_width,
+        # Rank error of sample quantiles (q1/median/q3), as a fraction of the column
+        "quantile_rank": float(z * np.sqrt(0.25 / n) * fpc),
+    }
+    return result
+
+
+def compute_eda_progressive(strata, take_rows, time_budget, initial_sample=2000, growth=4, seed=0):
+    """
+    Returns the most accurate sampled EDA that fits in ``time_budget`` seconds.
+    ``strata`` is the dataset's ``TargetStrata`` and ``take_rows(positions)``
+    loads just those rows, so no round reads the whole dataset. Sample sizes
+    grow geometrically while the next, ``growth`` times larger round is
+    predicted to still finish inside the budget.
+    """
+    start = time.perf_counter()
+    size = min(initial_sample, strata.total)
+    while True:
+        round_start = time.perf_counter()
+        result = _eda_from_sample(take_rows(strata.sample(size, seed)), strata)
+        elapsed = time.perf_counter() - start
+        round_time = time.perf_counter() - round_start
+        if size >= strata.total or elapsed + round_time * growth > time_budget:
+            return result
+        size = min(strata.total, size * growth)
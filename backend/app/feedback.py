@@ -0,0 +1,222 @@
+"""
+Labeled field feedback and incremental model refresh.
+
+Lab results that confirm or contradict a prediction are appended to a CSV
+retraining store. A refresh reads only the rows added since the previous one
+(from a saved byte offset), grows the Random Forest with warm-started trees fit
+on them, retires the oldest trees so the forest keeps its size, and re-tunes the
+decision threshold on a rolling holdout of recent feedback. Its cost therefore
+scales with the amount of new feedback, not with the full training history.
+"""
+
+import json
+import os
+import threading
+import time
+from io import BytesIO
+
+import joblib
+import pandas as pd
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.utils.class_weight import compute_class_weight
+
+from .schema import WaterQualityInput
+from .threshold_analysis import ThresholdAnalysis, DEFAULT_MIN_RECALL
+
+FEEDBACK_DIR = os.environ.get(
+    "FEEDBACK_DIR", os.path.join(os.path.dirname(__file__), '../../Data/feedback')
+)
+FEATURES = list(WaterQualityInput.model_fields)
+TARGET = "Potability"
+COLUMNS = FEATURES + [TARGET, "predicted_score", "received_at"]
+
+# Every HOLDOUT_EVERY-th feedback row is kept out of training for threshold tuning
+HOLDOUT_EVERY = 5
+HOLDOUT_MAX_ROWS = 2000
+# The threshold is only re-tuned once the holdout has this many rows of both classes
+MIN_HOLDOUT_ROWS = 30
+MIN_REFRESH_ROWS = int(os.environ.get("FEEDBACK_MIN_REFRESH_ROWS", 20))
+TREES_PER_REFRESH = int(os.environ.get("FEEDBACK_TREES_PER_REFRESH", 30))
+
+
+class FeedbackStore:
+    def __init__(self, directory=FEEDBACK_DIR):
+        self.directory = directory
+        self.samples_path = os.path.join(directory, "labeled_samples.csv")
+        self.holdout_path = os.path.join(directory, "holdout.csv")
+        self.state_path = os.path.join(directory, "state.json")
+        self._lock = threading.Lock()
+
+    def append(self, sample, label, predicted_score=None):
+        """Appends one labeled sample and returns the number of rows awaiting a refresh."""
+        row = {**{f: sample.get(f) for f in FEATURES}, TARGET: int(label),
+               "predicted_score": predicted_score, "received_at": time.time()}
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            new_file = not os.path.exists(self.samples_path)
+            pd.DataFrame([row], columns=COLUMNS).to_csv(
+                self.samples_path, mode="a", header=new_file, index=False
+            )
+            state = self.state()
+            state["total_rows"] += 1
+            self._write_state(state)
+            return state["total_rows"] - state["consumed_rows"]
+
+    def state(self):
+        if not os.path.exists(self.state_path):
+            return {"offset": 0, "total_rows": 0, "consumed_rows": 0, "refreshes": 0}
+        with open(self.state_path, "r") as f:
+            return json.load(f)
+
+    def _write_state(self, state):
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.state_path)
+
+    def unconsumed(self):
+        """
+        Returns (rows added since the last refresh, end byte offset), reading only those rows.
+        The read holds the append lock and stops at the last complete line, so a row
+        being written concurrently is left for the next refresh instead of being split.
+        """
+        with self._lock:
+            if not os.path.exists(self.samples_path):
+                return pd.DataFrame(columns=COLUMNS), 0
+            state = self.state()
+            with open(self.samples_path, "rb") as f:
+                if state["offset"] == 0:
+                    f.readline()  # header
+                else:
+                    f.seek(state["offset"])
+                start = f.tell()
+                data = f.read()
+        data = data[:data.rfind(b"\n") + 1]
+        end = start + len(data)
+        if not data.strip():
+            return pd.DataFrame(columns=COLUMNS), end
+        return pd.read_csv(BytesIO(data), names=COLUMNS, header=None), end
+
+    def mark_consumed(self, end_offset, rows):
+        with self._lock:
+            state = self.state()
+            state["offset"] = end_offset
+            state["consumed_rows"] += rows
+            state["refreshes"] += 1
+            self._write_state(state)
+
+    def rolled_holdout(self, rows):
+        """Returns the holdout with rows appended, keeping the most recent HOLDOUT_MAX_ROWS."""
+        holdout = self.holdout()
+        holdout = pd.concat([holdout, rows], ignore_index=True) if len(holdout) else rows
+        return holdout.tail(HOLDOUT_MAX_ROWS)
+
+    def save_holdout(self, holdout):
+        os.makedirs(self.directory, exist_ok=True)
+        holdout.to_csv(self.holdout_path + ".tmp", index=False)
+        os.replace(self.holdout_path + ".tmp", self.holdout_path)
+
+    def holdout(self):
+        if not os.path.exists(self.holdout_path):
+            return pd.DataFrame(columns=COLUMNS)
+        return pd.read_csv(self.holdout_path)
+
+
+def _dump_atomic(obj, path):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    joblib.dump(obj, tmp_path)
+    os.replace(tmp_path, path)
+
+
+_refresh_lock = threading.Lock()
+
+
+def refresh_model(store, model_dir, trees_per_refresh=TREES_PER_REFRESH, max_trees=None,
+                  min_rows=MIN_REFRESH_ROWS, min_recall=DEFAULT_MIN_RECALL, rebuild_explainer=True):
+    """
+    Incrementally refreshes the production Random Forest from unconsumed feedback.
+    max_trees: forest size after retiring the oldest trees (default: its current size).
+    Returns a summary dict; ``status`` is "refreshed" or "skipped" (with a reason).
+    """
+    model_path = os.path.join(model_dir, 'water_quality_model.pkl')
+    threshold_path = os.path.join(model_dir, 'optimal_threshold.json')
+    imputer_path = os.path.join(model_dir, 'imputer_values.json')
+
+    with _refresh_lock:
+        start = time.perf_counter()
+        new_rows, end_offset = store.unconsumed()
+        if len(new_rows) < min_rows:
+            return {"status": "skipped", "reason": f"{len(new_rows)} new rows, need {min_rows}"}
+
+        model = joblib.load(model_path)
+        if not isinstance(model, RandomForestClassifier):
+            raise ValueError(f"Incremental refresh needs a Random Forest, got {type(model).__name__}")
+
+        with open(imputer_path, "r") as f:
+            imputer_values = json.load(f)
+        new_rows = new_rows.copy()
+        new_rows[FEATURES] = new_rows[FEATURES].fillna(imputer_values)
+
+        # Deterministic split on the global row number, so a row never moves between sets
+        row_numbers = store.state()["consumed_rows"] + pd.RangeIndex(len(new_rows))
+        is_holdout = (row_numbers % HOLDOUT_EVERY) == HOLDOUT_EVERY - 1
+        train, holdout_rows = new_rows[~is_holdout], new_rows[is_holdout]
+
+        if train[TARGET].nunique() < 2:
+            # Trees fit on a single class would change the forest's classes_
+            return {"status": "skipped", "reason": "new feedback contains a single class"}
+
+        n_before = len(model.estimators_)
+        max_trees = max_trees or n_before
+        base_seed = model.random_state if isinstance(model.random_state, int) else 0
+        class_weight = model.class_weight
+        y_train = train[TARGET].astype(int)
+        if class_weight == "balanced":
+            # Balance the new trees on the data they are fit on, explicitly
+            weights = compute_class_weight("balanced", classes=model.classes_, y=y_train)
+            model.set_params(class_weight=dict(zip(model.classes_, weights)))
+        # A fresh seed per refresh: warm start derives tree seeds from the forest size,
+        # which repeats once old trees are retired
+        model.set_params(warm_start=True, n_estimators=n_before + trees_per_refresh,
+                         random_state=base_seed + store.state()["refreshes"] + 1)
+        model.fit(train[FEATURES], y_train)
+        model.set_params(class_weight=class_weight)
+
+        retired = max(0, len(model.estimators_) - max_trees)
+        if retired:
+            model.estimators_ = model.estimators_[retired:]
+        model.set_params(warm_start=False, n_estimators=len(model.estimators_))
+
+        threshold = None
+        holdout = store.rolled_holdout(holdout_rows)
+        if len(holdout) >= MIN_HOLDOUT_ROWS and holdout[TARGET].nunique() == 2:
+            probs = model.predict_proba(holdout[FEATURES])[:, 1]
+            best = ThresholdAnalysis(holdout[TARGET].astype(int), probs).optimal_threshold(min_recall)
+            if best:
+                threshold = best["threshold"]
+
+        _dump_atomic(model, model_path)
+        if threshold is not None:
+            with open(threshold_path + ".tmp", "w") as f:
+                json.dump({"threshold": threshold}, f)
+            os.replace(threshold_path + ".tmp", threshold_path)
+        if rebuild_explainer:
+            from .services import rebuild_explainer as write_explainer
+            write_explainer(model, os.path.join(model_dir, 'shap_explainer.pkl'))
+
+        store.save_holdout(holdout)
+        store.mark_consumed(end_offset, len(new_rows))
+        return {
+            "status": "refreshed",
+            "new_rows": int(len(new_rows)),
+            "train_rows": int(len(train)),
+            "holdout_rows": int(len(holdout)),
+            "trees_added": trees_per_refresh,
+            "trees_retired": retired,
+            "n_estimators": len(model.estimators_),
+            "threshold": threshold,
+            "seconds": round(time.perf_counter() - start, 3),
+        }
+
+
+feedback_store = FeedbackStore()
@@ -0,0 +1,214 @@
+"""
+HTTP revalidation and response compression.
+
+Dashboard views such as ``/api/stats``, EDA and compare results change rarely
+but are fetched on every refresh. Endpoints that serve them build a strong ETag
+from what the response is derived from. For the API that is the model version
+and the evaluator revision; for DataLab it is the content hash of the session's
+datasets plus the response format. The ETag is computed before any work, so a
+matching ``If-None-Match`` is answered with an empty 304:
+
+    etag = make_etag("eda", dataset_key, layout)
+    if is_fresh(request, etag):
+        return not_modified(etag)
+
+``CompressionMiddleware`` compresses complete JSON and text responses above
+``COMPRESSION_MIN_BYTES``. It uses brotli when the client accepts it and the
+``brotli`` package is installed, and gzip otherwise. The encoding is appended
+to the ETag (``"<tag>-gzip"``) so each representation keeps its own strong
+validator. Compressed bodies are kept in a small LRU keyed by that ETag, so a
+new client fetching an unchanged large result costs no compression either.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from fastapi import Response
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+# Bump when the shape of cached responses changes, so old client copies are not revalidated
+ETAG_SCHEMA_VERSION = 1
+CACHE_CONTROL = "private, no-cache"
+COMPRESSION_MIN_BYTES = int(os.environ.get("HTTP_COMPRESSION_MIN_BYTES", 1024))
+COMPRESSED_CACHE_ENTRIES = int(os.environ.get("HTTP_COMPRESSED_CACHE_ENTRIES", 64))
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+# Bodies above this are compressed in the threadpool rather than on the event loop
+THREAD_MIN_BYTES = 128 * 1024
+COMPRESSIBLE_TYPES = ("application/json", "text/")
+
+
+def make_etag(*parts):
+    """Strong ETag for a response fully determined by ``parts``."""
+    payload = json.dumps([ETAG_SCHEMA_VERSION, *parts], default=str, separators=(",", ":"))
+    return '"' + hashlib.sha256(payload.encode()).hexdigest()[:32] + '"'
+
+
+def _base_tag(tag):
+    tag = tag.strip().removeprefix("W/")
+    for encoding in ENCODINGS:
+        suffix = f'-{encoding}"'
+        if tag.endswith(suffix):
+            return tag[:-len(suffix)] + '"'
+    return tag
+
+
+def is_fresh(request, etag):
+    """True when the client's If-None-Match already holds this representation."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    tags = {_base_tag(t) for t in header.split(",")}
+    return "*" in tags or etag in tags
+
+
+def cache_headers(etag):
+    return {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+
+
+def not_modified(etag):
+    return Response(status_code=304, headers=cache_headers(etag))
+
+
+# ---- Compression --------------------------------------------------------------
+
+def _gzip(body):
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def _brotli(body):
+    return brotli.compress(body, quality=BROTLI_QUALITY)
+
+
+ENCODINGS = {"br": _brotli, "gzip": _gzip}
+
+
+def negotiate(accept_encoding):
+    """The preferred available encoding in an Accept-Encoding header, or None."""
+    accepted = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip().lower()] = q
+    available = [e for e in ENCODINGS if e != "br" or brotli is not None]
+    ranked = [(accepted.get(e, accepted.get("*", 0.0)), e) for e in available]
+    # Ties go to the earlier (denser) encoding
+    q, encoding = max(ranked, key=lambda r: (r[0], -available.index(r[1])))
+    return encoding if q > 0 else None
+
+
+class CompressedBodyCache:
+    def __init__(self, max_entries=COMPRESSED_CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self._bodies = OrderedDict()  # encoding-tagged ETag -> compressed body
+        self._lock = threading.Lock()
+
+    def get(self, etag):
+        with self._lock:
+            if etag in self._bodies:
+                self._bodies.move_to_end(etag)
+                return self._bodies[etag]
+        return None
+
+    def set(self, etag, body):
+        with self._lock:
+            self._bodies[etag] = body
+            self._bodies.move_to_end(etag)
+            while len(self._bodies) > self.max_entries:
+                self._bodies.popitem(last=False)
+
+
+compressed_bodies = CompressedBodyCache()
+
+
+class CompressionMiddleware:
+    """
+    Compresses single-message JSON/text responses. Streaming and file responses,
+    already-encoded bodies and bodies under ``minimum_size`` pass through untouched.
+    """
+
+    def __init__(self, app, minimum_size=COMPRESSION_MIN_BYTES, cache=compressed_bodies):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.cache = cache
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        request_headers = Headers(scope=scope)
+        encoding = negotiate(request_headers.get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+        # Validators the client holds, exactly as earlier 200 responses sent them
+        held_tags = {t.strip() for t in request_headers.get("if-none-match", "").split(",")}
+
+        def encoded_tag(etag):
+            return etag[:-1] + f'-{encoding}"' if etag and etag.endswith('"') else None
+
+        async def send_compressed(message):
+            nonlocal start
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                content_type = headers.get("content-type", "")
+                if message["status"] == 304 and "etag" in headers:
+                    # Revalidated: name the representation the client holds. Small bodies were
+                    # sent uncompressed under the plain tag, so only a held encoded tag is echoed.
+                    if encoded_tag(headers["etag"]) in held_tags:
+                        MutableHeaders(raw=message["headers"])["ETag"] = encoded_tag(headers["etag"])
+                    await send(message)
+                elif ("content-encoding" in headers or message["status"] < 200 or message["status"] in (204, 206)
+                        or not content_type.startswith(COMPRESSIBLE_TYPES)):
+                    await send(message)
+                else:
+                    start = message  # held until the body shows whether to compress
+                return
+            if start is None or message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            message_start, start = start, None
+            body = message.get("body", b"")
+            if message.get("more_body", False) or len(body) < self.minimum_size:
+                await send(message_start)
+                await send(message)
+                return
+
+            headers = MutableHeaders(raw=message_start["headers"])
+            tagged = encoded_tag(headers.get("etag"))
+            compressed = self.cache.get(tagged) if tagged else None
+            if compressed is None:
+                compress = ENCODINGS[encoding]
+                if len(body) >= THREAD_MIN_BYTES:
+                    compressed = await run_in_threadpool(compress, body)
+                else:
+                    compressed = compress(body)
+                if tagged:
+                    self.cache.set(tagged, compressed)
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(compressed))
+            headers.add_vary_header("Accept-Encoding")
+            if tagged:
+                headers["ETag"] = tagged
+            await send(message_start)
+            await send({**message, "body": compressed})
+
+        await self.app(scope, receive, send_compressed)
@@ -0,0 +1,196 @@
+"""
+Hyperparameter search for DataLab sessions by successive halving.
+
+``n_trials`` random configurations are first scored on a small stratified
+subsample of the training split. Each rung keeps the best 1/eta of them and
+multiplies the subsample size by eta, so only a handful of configurations are
+ever trained on all the data. With the defaults (27 trials, eta=3) this costs
+about 4/27 of the compute needed to train every configuration fully.
+
+Rungs are trained on part of the training split and scored on an inner
+validation set carved from the rest of it. The hold-out split plays no part in
+selection. Trials within a rung run in parallel processes, and the leaderboard
+is reported through the job progress callback after every finished trial. The
+winner is then retrained on the full training split, evaluated once on the
+hold-out split like /train, and saved as the session model. Its reported
+metrics are therefore not biased by the selection.
+"""
+
+import math
+import os
+import time
+
+import numpy as np
+from joblib import Parallel, delayed
+
+from .training import (
+    RANDOM_STATE, NATIVE_NAN_MODELS, HIST_GRADIENT_BOOSTING, _no_progress, _scalar_metrics,
+    load_training_data, split_data, build_model, thread_limit, fit_model, evaluate_model,
+    save_session_model, append_history
+)
+
+LEADERBOARD_SIZE = 10
+# Smallest subsample a rung trains on
+MIN_RUNG_ROWS = 100
+
+DEFAULT_SPACES = {
+    "Random Forest": {
+        "n_estimators": {"type": "int", "low": 50, "high": 400},
+        "max_depth": {"type": "choice", "choices": ["None", 5, 10, 15, 20]},
+    },
+    "Gradient Boosting": {
+        "n_estimators": {"type": "int", "low": 50, "high": 300},
+        "learning_rate": {"type": "log", "low": 0.01, "high": 0.3},
+    },
+    HIST_GRADIENT_BOOSTING: {
+        "max_iter": {"type": "int", "low": 50, "high": 500},
+        "learning_rate": {"type": "log", "low": 0.01, "high": 0.3},
+    },
+    "Logistic Regression": {
+        "C": {"type": "log", "low": 0.01, "high": 100.0},
+    },
+}
+
+
+def sample_params(space, rng):
+    """Draws one configuration from a space of int / float / log / choice dimensions."""
+    params = {}
+    for name, dim in space.items():
+        kind = dim.get("type", "float")
+        if kind == "choice":
+            params[name] = dim["choices"][rng.integers(len(dim["choices"]))]
+        elif kind == "int":
+            params[name] = int(rng.integers(dim["low"], dim["high"] + 1))
+        elif kind == "log":
+            params[name] = float(math.exp(rng.uniform(math.log(dim["low"]), math.log(dim["high"]))))
+        else:
+            params[name] = float(rng.uniform(dim["low"], dim["high"]))
+    return params
+
+
+def rung_schedule(n_trials, eta, n_rows):
+    """Returns [(n_configs, n_rows)] per rung; the last rung trains on all rows."""
+    rungs = max(0, int(math.floor(math.log(n_trials, eta) + 1e-9)))
+    # Drop early rungs whose subsample would be too small to rank anything
+    while rungs > 0 and n_rows / eta ** rungs < MIN_RUNG_ROWS:
+        rungs -= 1
+    schedule = []
+    for r in range(rungs + 1):
+        n_configs = max(1, n_trials // eta ** r)
+        schedule.append((n_configs, min(n_rows, int(math.ceil(n_rows / eta ** (rungs - r))))))
+    return schedule
+
+
+def _stratified_order(y, rng):
+    """A row order whose every prefix has (about) the class balance of y."""
+    positions = np.empty(len(y))
+    for label in np.unique(y):
+        idx = np.flatnonzero(y == label)
+        positions[rng.permutation(idx)] = (np.arange(len(idx)) + rng.random()) / len(idx)
+    return np.argsort(positions, kind="mergesort")
+
+
+def _run_trial(trial_id, model_type, params, n_jobs, X_train, y_train, X_val, y_val, binary):
+    start = time.perf_counter()
+    model = build_model(model_type, params, n_jobs=n_jobs)
+    with thread_limit(n_jobs):
+        model.fit(X_train, y_train)
+    metrics = _scalar_metrics(y_val, model.predict(X_val), model.predict_proba(X_val)[:, 1], binary)
+    return trial_id, metrics, time.perf_counter() - start, os.getpid()
+
+
+def search_session_hyperparameters(session_id, model_type, space=None, n_trials=27, eta=3,
+                                   metric="auc_score", n_jobs=None, progress=_no_progress):
+    """
+    Runs successive halving over random configurations; returns the leaderboard,
+    the rung schedule and the /train-style metrics of the retrained winner.
+    """
+    space = space or DEFAULT_SPACES.get(model_type, DEFAULT_SPACES["Random Forest"])
+    rng = np.random.default_rng(RANDOM_STATE)
+
+    progress(0.0, "loading data")
+    X, y, target_col = load_training_data(session_id, impute=model_type not in NATIVE_NAN_MODELS)
+    X_train, X_test, y_train, y_test = split_data(X, y)
+    # Rungs are ranked on an inner validation set; X_test is only used for the winner
+    X_fit, X_val, y_fit, y_val = split_data(X_train, y_train)
+    X_fit_values, y_fit_values = X_fit.to_numpy(), y_fit.to_numpy()
+    X_val_values, y_val_values = X_val.to_numpy(), y_val.to_numpy()
+    binary = len(np.unique(y)) == 2
+    # Nested subsamples: every rung trains on a prefix of the same stratified order
+    order = _stratified_order(y_fit_values, rng)
+
+    schedule = rung_schedule(n_trials, eta, len(order))
+    trials = [{"trial": i, "params": sample_params(space, rng)} for i in range(schedule[0][0])]
+    total_cost = sum(n * rows for n, rows in schedule)
+    full_cost = len(trials) * len(order)
+
+    budget = n_jobs if n_jobs and n_jobs > 0 else (os.cpu_count() or 1)
+    done_cost = 0
+    leaderboard = []
+    survivors = trials
+    worker_pids = set()
+    start = time.perf_counter()
+
+    for rung, (n_configs, n_rows) in enumerate(schedule):
+        survivors = survivors[:n_configs]
+        rows = order[:n_rows]
+        X_rung, y_rung = X_fit_values[rows], y_fit_values[rows]
+        n_parallel = max(1, min(len(survivors), budget))
+        threads = max(1, budget // n_parallel)
+        progress(done_cost / total_cost, f"rung {rung + 1}/{len(schedule)}",
+                 rung=rung, rung_rows=n_rows, rung_trials=len(survivors))
+
+        by_id = {t["trial"]: t for t in survivors}
+        outputs = Parallel(n_jobs=n_parallel, backend="loky", return_as="generator_unordered")(
+            delayed(_run_trial)(t["trial"], model_type, t["params"], threads,
+                                X_rung, y_rung, X_val_values, y_val_values, binary)
+            for t in survivors
+        )
+        for trial_id, metrics, seconds, pid in outputs:
+            worker_pids.add(pid)
+            trial = by_id[trial_id]
+            trial.update({"rung": rung, "rows": n_rows, "score": metrics[metric],
+                          "metrics": metrics, "fit_seconds": round(seconds, 3)})
+            done_cost += n_rows
+            # Deeper rungs (more data) rank above shallower ones, then by score
+            leaderboard = sorted(trials, key=lambda t: (t.get("rung", -1), t.get("score", -1)), reverse=True)
+            progress(done_cost / total_cost, f"rung {rung + 1}/{len(schedule)}",
+                     leaderboard=[_entry(t) for t in leaderboard[:LEADERBOARD_SIZE] if "score" in t],
+                     trials_done=sum(1 for t in trials if "score" in t))
+
+        survivors = sorted(survivors, key=lambda t: t["score"], reverse=True)
+
+    best = survivors[0]
+    progress(0.95, "retraining best configuration")
+    model = build_model(model_type, best["params"], n_jobs=n_jobs)
+    with thread_limit(n_jobs):
+        fit_model(model, X_train, y_train)
+    metrics = evaluate_model(model, X.columns, y, X_test, y_test)
+    model_path = save_session_model(session_id, model)
+    history = append_history(session_id, model_type, best["params"], metrics)
+
+    return {
+        **metrics,
+        "target": target_col,
+        "model_path": model_path,
+        "history": history,
+        "best_params": best["params"],
+        "best_score": best["score"],  # on the inner validation set
+        "metric": metric,
+        "leaderboard": [_entry(t) for t in leaderboard[:LEADERBOARD_SIZE]],
+        "rungs": [{"trials": n, "rows": rows} for n, rows in schedule],
+        "compute_fraction": round(total_cost / full_cost, 4),
+        "search_seconds": round(time.perf_counter() - start, 3),
+        # 0 means every trial ran inline in this process
+        "trial_processes": len(worker_pids - {os.getpid()}),
+    }
+
+
+def _entry(trial):
+    return {
+        "trial": trial["trial"],
+        "params": trial["params"],
+        "score": trial.get("score"),
+        "rung": trial.get("rung"),
+        "rows": trial.get("rows"),
+    }
@@ -0,0 +1,279 @@
+"""
+Background job queue for long-running DataLab work (e.g. model training).
+
+Each job runs in its own worker process so it can be cancelled or killed on
+timeout without touching the API process. At most ``max_workers`` jobs run at
+once; the rest wait in FIFO order. Workers report progress and their result
+through a shared queue that a single scheduler thread drains.
+
+Workers are not daemon processes: a daemon process may not start children, and
+joblib would quietly run the parallel folds, candidates or trials of a job one
+after another. Running workers are terminated explicitly instead, on
+cancellation, timeout and interpreter exit. On POSIX each worker leads its own
+process group and the whole group is signalled, so the joblib/loky pools a job
+started stop with it instead of being orphaned. Terminated workers are joined
+after the manager's lock is released, so a slow exit never blocks other requests.
+"""
+
+import atexit
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+import time
+import traceback
+import uuid
+from collections import deque
+
+DEFAULT_MAX_WORKERS = int(os.environ.get("DATALAB_MAX_JOBS", max(1, (os.cpu_count() or 2) // 2)))
+DEFAULT_TIMEOUT_S = float(os.environ.get("DATALAB_JOB_TIMEOUT_S", 600))
+# Finished jobs (and their results) are forgotten after this long
+JOB_RETENTION_S = 3600
+POLL_INTERVAL_S = 0.1
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+TIMED_OUT = "timed_out"
+FINISHED_STATES = {SUCCEEDED, FAILED, CANCELLED, TIMED_OUT}
+
+
+def _job_entry(job_id, target, args, kwargs, messages):
+    """Worker process main: runs target(*args, progress=..., **kwargs) and reports back."""
+    if hasattr(os, "setpgrp"):
+        # Lead a new process group so _terminate also reaches the pools this job starts
+        os.setpgrp()
+
+    def progress(fraction, stage=None, **details):
+        messages.put((job_id, "progress", {"progress": float(fraction), "stage": stage, **details}))
+
+    try:
+        result = target(*args, progress=progress, **kwargs)
+        messages.put((job_id, "result", result))
+    except BaseException as e:
+        messages.put((job_id, "error", f"{type(e).__name__}: {e}\n{traceback.format_exc()}"))
+
+
+def _terminate(process):
+    """Stops a worker and, where process groups exist, every process it started."""
+    if hasattr(os, "killpg") and process.pid:
+        try:
+            os.killpg(process.pid, signal.SIGTERM)
+            return
+        except ProcessLookupError:
+            pass  # exited with no children left, or not yet in its own group
+    if process.is_alive():
+        process.terminate()
+
+
+class Job:
+    def __init__(self, kind, target, args, kwargs, timeout, meta):
+        self.id = str(uuid.uuid4())
+        self.kind = kind
+        self.target = target
+        self.args = args
+        self.kwargs = kwargs
+        self.timeout = timeout
+        self.meta = meta
+        self.status = QUEUED
+        self.progress = 0.0
+        self.stage = None
+        self.details = {}
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.process = None
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "progress": round(self.progress, 4),
+            "stage": self.stage,
+            "details": self.details,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "timeout": self.timeout,
+            **self.meta,
+        }
+
+
+class JobManager:
+    def __init__(self, max_workers=DEFAULT_MAX_WORKERS, default_timeout=DEFAULT_TIMEOUT_S):
+        self.max_workers = max_workers
+        self.default_timeout = default_timeout
+        # spawn: workers never inherit the API process's threads or locks
+        self._ctx = multiprocessing.get_context("spawn")
+        self._messages = None
+        self._jobs = {}
+        self._pending = deque()
+        self._stopping = []  # worker processes to join outside the lock
+        self._lock = threading.Lock()
+        self._scheduler = None
+        # Runs before multiprocessing's own exit handler, which would wait for non-daemon workers
+        atexit.register(self.shutdown)
+
+    def submit(self, kind, target, args=(), kwargs=None, timeout=None, **meta):
+        """
+        Queues target(*args, progress=callback, **kwargs) to run in a worker process.
+        ``target`` must be a module-level function and its arguments picklable.
+        """
+        job = Job(kind, target, tuple(args), kwargs or {}, timeout or self.default_timeout, meta)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._pending.append(job)
+            self._ensure_scheduler()
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self, **filters):
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return [j for j in jobs if all(j.meta.get(k) == v for k, v in filters.items())]
+
+    def cancel(self, job_id):
+        """
+        Cancels a queued or running job. Returns False if it had already finished.
+        Blocks until the worker has exited, so call it off the event loop.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.status in FINISHED_STATES:
+                return False
+            if job.status == QUEUED:
+                self._pending.remove(job)
+            self._finish(job, CANCELLED)
+        self._join_stopped()
+        return True
+
+    def wait(self, job_id, timeout=None):
+        """Blocks until a job finishes (or timeout elapses) and returns it."""
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            job = self.get(job_id)
+            if job is None or job.status in FINISHED_STATES:
+                return job
+            if deadline is not None and time.time() >= deadline:
+                return job
+            time.sleep(POLL_INTERVAL_S)
+
+    def shutdown(self):
+        """Cancels every queued and running job (called at interpreter exit)."""
+        with self._lock:
+            self._pending.clear()
+            for job in self._jobs.values():
+                if job.status not in FINISHED_STATES:
+                    self._finish(job, CANCELLED)
+        self._join_stopped()
+
+    def stats(self):
+        with self._lock:
+            counts = {}
+            for job in self._jobs.values():
+                counts[job.status] = counts.get(job.status, 0) + 1
+        return {"max_workers": self.max_workers, "jobs": counts}
+
+    # ---- Scheduler ----------------------------------------------------------
+
+    def _ensure_scheduler(self):
+        if self._scheduler is None or not self._scheduler.is_alive():
+            if self._messages is None:
+                self._messages = self._ctx.Queue()
+            self._scheduler = threading.Thread(target=self._run, name="datalab-jobs", daemon=True)
+            self._scheduler.start()
+
+    def _run(self):
+        while True:
+            self._drain_messages()
+            with self._lock:
+                self._reap()
+                self._start_pending()
+                self._forget_old()
+            self._join_stopped()
+            time.sleep(POLL_INTERVAL_S)
+
+    def _drain_messages(self):
+        while True:
+            try:
+                job_id, kind, payload = self._messages.get_nowait()
+            except queue.Empty:
+                return
+            with self._lock:
+                job = self._jobs.get(job_id)
+                if job is None or job.status in FINISHED_STATES:
+                    continue
+                if kind == "progress":
+                    job.progress = payload.pop("progress")
+                    job.stage = payload.pop("stage")
+                    job.details.update(payload)
+                elif kind == "result":
+                    job.result = payload
+                    job.progress = 1.0
+                    self._finish(job, SUCCEEDED)
+                else:
+                    job.error = payload
+                    self._finish(job, FAILED)
+
+    def _reap(self):
+        now = time.time()
+        for job in self._jobs.values():
+            if job.status != RUNNING:
+                continue
+            if now - job.started_at > job.timeout:
+                job.error = f"Job exceeded its {job.timeout:.0f}s timeout"
+                self._finish(job, TIMED_OUT)
+            elif not job.process.is_alive() and self._messages.empty():
+                # Exited without reporting (e.g. killed by the OS)
+                job.error = f"Worker exited with code {job.process.exitcode}"
+                self._finish(job, FAILED)
+
+    def _start_pending(self):
+        running = sum(1 for j in self._jobs.values() if j.status == RUNNING)
+        while self._pending and running < self.max_workers:
+            job = self._pending.popleft()
+            job.process = self._ctx.Process(
+                target=_job_entry,
+                args=(job.id, job.target, job.args, job.kwargs, self._messages),
+                daemon=False,
+            )
+            job.process.start()
+            job.status = RUNNING
+            job.started_at = time.time()
+            running += 1
+
+    def _finish(self, job, status):
+        """Marks a job finished and stops its worker; the caller holds the lock, so no joining here."""
+        job.status = status
+        job.finished_at = time.time()
+        process, job.process = job.process, None
+        if process is not None:
+            # Also after a clean exit: pool workers the job started may still be alive
+            _terminate(process)
+            self._stopping.append(process)
+
+    def _join_stopped(self):
+        """Reaps workers stopped by _finish; called without holding the lock."""
+        with self._lock:
+            processes, self._stopping = self._stopping, []
+        for process in processes:
+            process.join(timeout=5)
+
+    def _forget_old(self):
+        cutoff = time.time() - JOB_RETENTION_S
+        for job_id in [j.id for j in self._jobs.values()
+                       if j.status in FINISHED_STATES and j.finished_at < cutoff]:
+            del self._jobs[job_id]
+
+
+job_manager = JobManager()
@@ -4,6 +4,7 @@ from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse
 from .api import router
 from .routers import datalab
+from .http_cache import CompressionMiddleware
 import os
 
 app = FastAPI(title="Water Quality Prediction System", version="1.0.0")
@@ -15,7 +16,9 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],  # Allows GET, POST, etc.
     allow_headers=["*"],  # Allows all headers
+    expose_headers=["ETag"],
 )
+app.add_middleware(CompressionMiddleware)
 
 app.include_router(router, prefix="/api")
 app.include_router(datalab.router, prefix="/api/datalab", tags=["DataLab"])
@@ -0,0 +1,197 @@
+"""
+Online evaluation of the deployed model from live predictions and later labels.
+
+``/api/predict`` registers every prediction (score and the threshold in force)
+under a ``prediction_id``. When a lab-confirmed label arrives through
+``/api/feedback``, the id joins it back to its prediction; a label without an
+id can still be scored from the ``predicted_score`` it carries.
+
+Each labeled prediction updates these running aggregates:
+
+- confusion counts
+- the Brier score sum
+- calibration bins (count, score sum, positives)
+
+They are kept for the whole lifetime and for sliding windows of 1 hour,
+24 hours and 7 days. Each window is a ring of time buckets plus a running
+total. An update touches one bucket and the total, and a bucket that falls out
+of the window is subtracted from the total before it is reused. Both updates
+and ``snapshot`` therefore cost O(1) however much traffic has been seen.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+WINDOWS = {"1h": 3600, "24h": 24 * 3600, "7d": 7 * 24 * 3600}
+BUCKETS_PER_WINDOW = 60
+CALIBRATION_BINS = 10
+# Predictions waiting for a label; the oldest are dropped beyond either limit
+PENDING_MAX = int(os.environ.get("ONLINE_EVAL_PENDING_MAX", 100_000))
+PENDING_TTL_S = float(os.environ.get("ONLINE_EVAL_PENDING_TTL_S", 30 * 24 * 3600))
+
+# Layout of an aggregate vector
+TP, FP, FN, TN, BRIER = range(5)
+_BIN_COUNT = slice(5, 5 + CALIBRATION_BINS)
+_BIN_SCORE = slice(5 + CALIBRATION_BINS, 5 + 2 * CALIBRATION_BINS)
+_BIN_POSITIVE = slice(5 + 2 * CALIBRATION_BINS, 5 + 3 * CALIBRATION_BINS)
+_SIZE = 5 + 3 * CALIBRATION_BINS
+
+
+def _observation(score, label, predicted):
+    """Aggregate vector of a single labeled prediction (score is clipped to [0, 1])."""
+    score = min(max(score, 0.0), 1.0)
+    v = np.zeros(_SIZE)
+    v[(TP if predicted else FN) if label else (FP if predicted else TN)] = 1
+    v[BRIER] = (score - label) ** 2
+    b = min(int(score * CALIBRATION_BINS), CALIBRATION_BINS - 1)
+    v[_BIN_COUNT.start + b] = 1
+    v[_BIN_SCORE.start + b] = score
+    v[_BIN_POSITIVE.start + b] = label
+    return v
+
+
+def summarize(v):
+    tp, fp, fn, tn = (int(v[i]) for i in (TP, FP, FN, TN))
+    n = tp + fp + fn + tn
+
+    def ratio(a, b):
+        return a / b if b else None
+
+    precision, recall = ratio(tp, tp + fp), ratio(tp, tp + fn)
+    calibration = []
+    for b in range(CALIBRATION_BINS):
+        count = int(v[_BIN_COUNT][b])
+        calibration.append({
+            "bin_low": b / CALIBRATION_BINS,
+            "bin_high": (b + 1) / CALIBRATION_BINS,
+            "count": count,
+            "mean_score": ratio(v[_BIN_SCORE][b], count),
+            "observed_rate": ratio(v[_BIN_POSITIVE][b], count),
+        })
+    return {
+        "labeled": n,
+        "tp": tp, "fp": fp, "fn": fn, "tn": tn,
+        "recall": recall,
+        "precision": precision,
+        "f1": ratio(2 * precision * recall, precision + recall) if precision is not None and recall is not None else None,
+        "accuracy": ratio(tp + tn, n),
+        "positive_rate": ratio(tp + fn, n),
+        "brier_score": ratio(v[BRIER], n),
+        "calibration": calibration,
+    }
+
+
+class SlidingWindow:
+    def __init__(self, span_s, n_buckets=BUCKETS_PER_WINDOW):
+        self.width = span_s / n_buckets
+        self.buckets = np.zeros((n_buckets, _SIZE))
+        self.bucket_ids = np.full(n_buckets, -1, dtype=np.int64)
+        self.total = np.zeros(_SIZE)
+
+    def _expire(self, now):
+        # Subtract every bucket that has left the window (at most n_buckets: constant work)
+        current = int(now // self.width)
+        stale = (self.bucket_ids >= 0) & (self.bucket_ids <= current - len(self.buckets))
+        if stale.any():
+            self.total -= self.buckets[stale].sum(axis=0)
+            self.buckets[stale] = 0
+            self.bucket_ids[stale] = -1
+        return current
+
+    def add(self, now, v):
+        current = self._expire(now)
+        slot = current % len(self.buckets)
+        if self.bucket_ids[slot] != current:
+            self.total -= self.buckets[slot]
+            self.buckets[slot] = 0
+            self.bucket_ids[slot] = current
+        self.buckets[slot] += v
+        self.total += v
+
+    def value(self, now):
+        self._expire(now)
+        return self.total
+
+
+class OnlineEvaluator:
+    def __init__(self, windows=WINDOWS, pending_max=PENDING_MAX, pending_ttl_s=PENDING_TTL_S):
+        self.windows = {name: SlidingWindow(span) for name, span in windows.items()}
+        self.lifetime = np.zeros(_SIZE)
+        self.pending = OrderedDict()  # prediction_id -> (time, score, threshold)
+        self.pending_max = pending_max
+        self.pending_ttl_s = pending_ttl_s
+        self.predictions = 0
+        self.unmatched_labels = 0
+        # Bumped on every change to what ``snapshot`` reports, see ``version``
+        self.revision = 0
+        self._lock = threading.Lock()
+
+    def record_prediction(self, prediction_id, score, threshold, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            self.predictions += 1
+            self.revision += 1
+            self.pending[prediction_id] = (now, score, threshold)
+            while len(self.pending) > self.pending_max:
+                self.pending.popitem(last=False)
+            self._drop_expired(now)
+
+    def _drop_expired(self, now):
+        while self.pending:
+            _, (ts, _, _) = next(iter(self.pending.items()))
+            if now - ts <= self.pending_ttl_s:
+                break
+            self.pending.popitem(last=False)
+            self.revision += 1
+
+    def record_label(self, label, prediction_id=None, score=None, threshold=0.5, now=None):
+        """
+        Scores a ground-truth label against its prediction (by id, else by the given score).
+        Returns the score used, or None if the label could not be matched to a prediction
+        or its score is not a finite number.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            self.revision += 1
+            match = self.pending.pop(prediction_id, None) if prediction_id else None
+            if match is not None:
+                _, score, threshold = match
+            elif score is None or not np.isfinite(score):
+                self.unmatched_labels += 1
+                return None
+            v = _observation(float(score), int(bool(label)), score >= threshold)
+            self.lifetime += v
+            for window in self.windows.values():
+                window.add(now, v)
+            return score
+
+    def version(self, now=None):
+        """
+        Changes whenever ``snapshot`` would: on every event, and when the time bucket
+        turns over (window buckets only expire at bucket boundaries).
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            self._drop_expired(now)
+            width = min((w.width for w in self.windows.values()), default=1.0)
+            return self.revision, int(now // width)
+
+    def snapshot(self, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            self._drop_expired(now)
+            windows = {name: summarize(w.value(now)) for name, w in self.windows.items()}
+            windows["lifetime"] = summarize(self.lifetime)
+            return {
+                "predictions": self.predictions,
+                "awaiting_label": len(self.pending),
+                "unmatched_labels": self.unmatched_labels,
+                "windows": windows,
+            }
+
+
+online_evaluator = OnlineEvaluator()
@@ -0,0 +1,120 @@
+"""
+Next-step pH forecasting for every location of the spatio-temporal network.
+
+One pooled Ridge model is trained on the train period of ``water_dataset.mat``.
+It predicts pH at date t+1 for each location from these inputs:
+
+- the location's last ``lags`` pH readings
+- its sensor features at date t
+- the mean pH of the other locations in its location group over the same lags,
+  or of the whole network for a location without group neighbours
+- the location's mean pH over the train period
+
+The feature tensor for all dates and locations is built at once: sliding-window
+views supply the lags, and one matrix product with a row-normalised neighbour
+matrix supplies the neighbour means. A network forecast is therefore a single
+``predict`` call on a (locations x features) matrix.
+
+pH values are on the dataset's normalised scale, not raw pH units.
+"""
+
+import threading
+import time
+
+import numpy as np
+from sklearn.linear_model import Ridge
+from sklearn.metrics import mean_squared_error, r2_score
+
+from .spatiotemporal_store import get_store
+
+DEFAULT_LAGS = 7
+RIDGE_ALPHA = 1.0
+
+
+def neighbour_matrix(n_locations, location_groups):
+    """
+    (locations x locations) row-normalised weights: the other members of a location's
+    group, or every other location when it has none. ``location_groups`` are 1-based.
+    """
+    W = np.zeros((n_locations, n_locations))
+    for group in location_groups:
+        idx = np.asarray(group) - 1
+        W[np.ix_(idx, idx)] = 1.0
+    W[W.sum(axis=1) <= 1] = 1.0
+    np.fill_diagonal(W, 0.0)
+    return W / W.sum(axis=1, keepdims=True)
+
+
+def build_features(ph, features, W, location_means, lags=DEFAULT_LAGS):
+    """
+    Feature tensor of shape (dates - lags + 1, locations, n_features). Row i describes
+    the window that ends at date i + lags - 1.
+    """
+    ph_lags = np.lib.stride_tricks.sliding_window_view(ph, lags, axis=0)  # (windows, L, lags)
+    neighbour_lags = np.lib.stride_tricks.sliding_window_view(ph @ W.T, lags, axis=0)
+    current = features[lags - 1:]  # (windows, L, F)
+    means = np.broadcast_to(location_means, ph_lags.shape[:2])[..., None]
+    return np.concatenate([ph_lags, neighbour_lags, current, means], axis=-1)
+
+
+class PHForecaster:
+    def __init__(self, store, lags=DEFAULT_LAGS, alpha=RIDGE_ALPHA):
+        self.store = store
+        self.lags = lags
+        self.model = Ridge(alpha=alpha)
+        self.W = neighbour_matrix(store.shape[1], store.location_groups)
+        self.metrics = {}
+
+    def _features(self, start, stop):
+        ph, features = self.store.ph[start:stop], self.store.features[start:stop]
+        return build_features(ph, features, self.W, self.location_means, self.lags)
+
+    def fit(self):
+        """Trains on the train period and scores the test period against persistence (last value)."""
+        start = time.perf_counter()
+        n_train = self.store.n_train_dates
+        self.location_means = np.asarray(self.store.ph[:n_train]).mean(axis=0)
+
+        # Windows ending at t predict t + 1, so the last train window ends at n_train - 2
+        X = self._features(0, n_train - 1)
+        y = self.store.ph[self.lags:n_train]
+        self.model.fit(X.reshape(-1, X.shape[-1]), np.ravel(y))
+
+        # Test windows may start in the train period: only their targets must be test dates
+        X_test = self._features(n_train - self.lags, self.store.shape[0] - 1)
+        y_test = np.ravel(self.store.ph[n_train:])
+        pred = self.model.predict(X_test.reshape(-1, X_test.shape[-1]))
+        persistence = np.ravel(self.store.ph[n_train - 1:-1])
+        self.metrics = {
+            "rmse": float(np.sqrt(mean_squared_error(y_test, pred))),
+            "r2": float(r2_score(y_test, pred)),
+            "persistence_rmse": float(np.sqrt(mean_squared_error(y_test, persistence))),
+            "train_seconds": round(time.perf_counter() - start, 4),
+        }
+        return self
+
+    def forecast(self, date_index=None):
+        """
+        Next-step pH for every location, using the ``lags`` dates ending at ``date_index``
+        (default: the last date). Returns (predictions, actual next pH or None).
+        """
+        n_dates = self.store.shape[0]
+        date_index = n_dates - 1 if date_index is None else date_index
+        if not self.lags - 1 <= date_index < n_dates:
+            raise ValueError(f"date_index must be between {self.lags - 1} and {n_dates - 1}")
+        X = self._features(date_index - self.lags + 1, date_index + 1)[0]
+        actual = np.asarray(self.store.ph[date_index + 1]) if date_index + 1 < n_dates else None
+        return self.model.predict(X), actual
+
+
+_forecaster = None
+_forecaster_lock = threading.Lock()
+
+
+def get_forecaster():
+    """Process-wide forecaster, trained on first use."""
+    global _forecaster
+    with _forecaster_lock:
+        if _forecaster is None:
+            _forecaster = PHForecaster(get_store()).fit()
+        return _forecaster
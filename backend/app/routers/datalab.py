@@ -1,49 +1,113 @@
-import shutil
+import asyncio
+import hmac
 import uuid
 import os
-import pickle
-from fastapi import APIRouter, UploadFile, File, HTTPException, Body
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, HTTPException, Header, Body, Depends, Request, Query
+from fastapi.responses import FileResponse, Response
+from starlette.concurrency import run_in_threadpool
 import pandas as pd
+from ..session_store import session_store, derived_key, TEMP_DATA_DIR, RAW, CLEANED
+from ..eda_engine import (
+    compute_eda, compute_eda_streaming, compute_eda_progressive, compute_comparison, target_column, TargetStrata
+)
+from ..analysis_cache import analysis_cache
+from ..training import train_session_model, compare_session_models, model_path_for
+from ..hyperparameter_search import search_session_hyperparameters
+from ..jobs import job_manager, SUCCEEDED, FINISHED_STATES
+from ..session_lifecycle import session_lifecycle
+from ..upload_stream import CSVUploadStream, MultipartFileReader, UploadRejected, ALLOWED_SUFFIXES
+from ..serialization import json_response, ROWS, FORMAT_PATTERN
+from ..http_cache import make_etag, is_fresh, not_modified, cache_headers
+
+
+def touch_session(request: Request):
+    """Marks the session in the path as recently used, so the sweeper keeps it."""
+    session_id = request.path_params.get("session_id")
+    if session_id:
+        session_lifecycle.touch(session_id)
+
+
+router = APIRouter(dependencies=[Depends(touch_session)])
+
+# Admin endpoints are disabled unless a token is configured
+ADMIN_TOKEN = os.environ.get("DATALAB_ADMIN_TOKEN")
+
+
+def require_admin(x_admin_token: str | None = Header(None)):
+    """Allows the request only with the configured X-Admin-Token header."""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled")
+    if x_admin_token is None or not hmac.compare_digest(x_admin_token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
 
-router = APIRouter()
+# Datasets above this on-disk size are analysed out-of-core
+EDA_STREAMING_MIN_BYTES = int(os.environ.get("DATALAB_EDA_STREAMING_MIN_BYTES", 256 * 1024 * 1024))
+EDA_CHUNK_ROWS = 250_000
+# Limit on the decompressed size of an upload
+MAX_UPLOAD_BYTES = int(os.environ.get("DATALAB_MAX_UPLOAD_BYTES", 1024 * 1024 * 1024))
+PROGRESSIVE_EDA_BUDGET_MS = 500
+
+# Background exact EDA tasks started by progressive requests, keyed like the analysis cache
+_eda_refinements = {}
 
-TEMP_DATA_DIR = "temp_data"
 os.makedirs(TEMP_DATA_DIR, exist_ok=True)
 
 @router.post("/upload")
-async def upload_dataset(file: UploadFile = File(...)):
+async def upload_dataset(request: Request, filename: str | None = None):
     """
-    Uploads a CSV file and creates a new session.
+    Uploads a CSV file (optionally .csv.gz / .csv.zst) and creates a new session.
+    Send it as the multipart form field ``file``, or as the raw request body with
+    ``?filename=``. The body is read from the socket as it arrives: the file name
+    and CSV header are checked on the first bytes and the size limit while
+    receiving, so bad uploads are rejected without reading the rest. Parsed
+    chunks go straight to the columnar store, so memory does not grow with the file.
     """
-    if not file.filename.endswith('.csv'):
-        raise HTTPException(status_code=400, detail="Only CSV files are allowed.")
-    
+    content_type = request.headers.get("content-type", "")
     session_id = str(uuid.uuid4())
-    file_location = os.path.join(TEMP_DATA_DIR, f"{session_id}_raw.csv")
-    
+    writer = session_store.new_writer()
+    stream = None
+
     try:
-        with open(file_location, "wb+") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-            
-        # Quick validation that it's a readable CSV
-        pd.read_csv(file_location, nrows=5)
-        
+        reader = MultipartFileReader(content_type) if content_type.startswith("multipart/form-data") else None
+        async for chunk in request.stream():
+            blocks = reader.feed(chunk) if reader is not None else [chunk]
+            for block in blocks:
+                if stream is None:
+                    filename = reader.filename if reader is not None else filename
+                    if not filename or not filename.endswith(ALLOWED_SUFFIXES):
+                        raise UploadRejected("Only CSV files (.csv, .csv.gz, .csv.zst) are allowed.")
+                    stream = CSVUploadStream(filename, MAX_UPLOAD_BYTES, writer)
+                # Decompression and parsing run off the event loop
+                await run_in_threadpool(stream.feed, block)
+        if stream is None:
+            raise UploadRejected("No file received")
+        # Keyed by the decompressed content, so identical data maps onto one stored dataset
+        key = await run_in_threadpool(stream.finish)
+        await run_in_threadpool(session_store.commit_writer, session_id, RAW, writer, key)
+
+    except UploadRejected as e:
+        writer.abort()
+        raise HTTPException(status_code=e.status_code, detail=f"Invalid CSV file: {str(e)}")
     except Exception as e:
-        if os.path.exists(file_location):
-            os.remove(file_location)
+        writer.abort()
+        session_store.invalidate(session_id)
         raise HTTPException(status_code=400, detail=f"Invalid CSV file: {str(e)}")
-        
+
     return {
         "session_id": session_id,
-        "filename": file.filename,
-        "message": "Upload successful"
+        "filename": stream.filename,
+        "message": "Upload successful",
+        "rows": stream.rows,
+        "dtypes": stream.dtypes(),
+        "compression": stream.compression,
+        "bytes": stream.bytes_decompressed,
     }
 
 @router.post("/use_sample")
 async def use_sample():
     """
-    Copies the default dataset to a new session.
+    Creates a new session backed by the default dataset.
+    The sample is stored once; later sessions just point at it.
     """
     session_id = str(uuid.uuid4())
     # Path relative to backend execution: ../../../Data/water_potability.csv
@@ -57,13 +121,11 @@ async def use_sample():
     BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))) # Water Quality Prediction System
     DATA_PATH = os.path.join(BASE_DIR, "Data", "water_potability.csv")
     
-    dest_path = os.path.join(TEMP_DATA_DIR, f"{session_id}_raw.csv")
-    
     if not os.path.exists(DATA_PATH):
         raise HTTPException(status_code=404, detail="Sample dataset not found on server.")
         
     try:
-        shutil.copy(DATA_PATH, dest_path)
+        session_store.ingest_csv(session_id, RAW, DATA_PATH)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to load sample data: {str(e)}")
         
@@ -75,103 +137,102 @@ async def use_sample():
 
 import numpy as np
 
+def _compute_exact_eda(session_id):
+    if session_store.nbytes_on_disk(session_id, RAW) > EDA_STREAMING_MIN_BYTES:
+        # Too large to materialise: two streaming passes over memory-mapped chunks
+        return compute_eda_streaming(
+            lambda: session_store.iter_chunks(session_id, RAW, chunk_rows=EDA_CHUNK_ROWS)
+        )
+    return compute_eda(session_store.get(session_id, RAW))
+
+def _target_strata(session_id):
+    """Strata of the raw dataset's target, built from that one memory-mapped column."""
+    target = session_store.get(session_id, RAW, columns=[target_column(session_store.columns(session_id, RAW))])
+    return TargetStrata(target.iloc[:, 0])
+
+def _start_refinement(key, session_id):
+    """Starts (once) the background exact EDA behind a progressive response."""
+    task = _eda_refinements.get(key)
+    if task is not None and not (task.done() and task.exception() is not None):
+        return task
+    task = asyncio.create_task(analysis_cache.get_or_compute(key, lambda: _compute_exact_eda(session_id)))
+
+    def _finished(t):
+        # Successful results live in the analysis cache; failures stay visible to /status
+        if not t.cancelled() and t.exception() is None:
+            _eda_refinements.pop(key, None)
+
+    task.add_done_callback(_finished)
+    _eda_refinements[key] = task
+    return task
+
 @router.get("/eda/{session_id}")
-async def get_eda(session_id: str):
+async def get_eda(request: Request, session_id: str, mode: str = "exact", budget_ms: int = PROGRESSIVE_EDA_BUDGET_MS,
+                  layout: str = Query(ROWS, alias="format", pattern=FORMAT_PATTERN)):
     """
     Returns statistics and histogram data for the uploaded dataset.
+    mode: "exact" | "progressive". Progressive mode answers within budget_ms from a
+    stratified sample (with error bounds) and refines in the background; poll
+    /eda/{session_id}/status for the exact result.
+    format: "rows" | "columnar" (parallel arrays and a correlation matrix, see serialization.py).
+    Exact results carry an ETag derived from the dataset content; If-None-Match gets a 304.
     """
-    file_location = os.path.join(TEMP_DATA_DIR, f"{session_id}_raw.csv")
-    if not os.path.exists(file_location):
+    if not session_store.exists(session_id, RAW):
         raise HTTPException(status_code=404, detail="Session not found")
     
     try:
-        df = pd.read_csv(file_location)
-        
-        # Basic Stats
-        null_counts = df.isnull().sum().to_dict()
-        description = df.describe().to_dict()
-        
-        # 1. Histograms for numerical columns
-        histograms = {}
-        numerical_cols = df.select_dtypes(include=[np.number]).columns.tolist()
-        
-        for col in numerical_cols:
-            data = df[col].dropna().values
-            if len(data) > 0:
-                counts, bin_edges = np.histogram(data, bins=20)
-                hist_data = []
-                for i in range(len(counts)):
-                    hist_data.append({
-                        "name": f"{bin_edges[i]:.1f}-{bin_edges[i+1]:.1f}",
-                        "count": int(counts[i])
-                    })
-                histograms[col] = hist_data
-            else:
-                histograms[col] = []
-
-        # 2. Correlation Matrix
-        corr_matrix = df.corr().fillna(0).to_dict()
-        # Convert to list for easier frontend mapping
-        corr_list = []
-        cols = list(corr_matrix.keys())
-        for i, row_col in enumerate(cols):
-            for j, col_col in enumerate(cols):
-                corr_list.append({
-                    "x": row_col,
-                    "y": col_col,
-                    "value": float(corr_matrix[row_col][col_col])
-                })
-
-        # 3. Class Distribution (Target)
-        target_col = 'Potability' if 'Potability' in df.columns else df.columns[-1]
-        dist_counts = df[target_col].value_counts().to_dict()
-        total = len(df)
-        class_distribution = [
-            {"label": str(k), "count": v, "percentage": round((v/total)*100, 1)}
-            for k, v in dist_counts.items()
-        ]
-
-        # 4. Boxplot Stats & Outliers
-        boxplot_data = {}
-        for col in numerical_cols:
-            if col == target_col: continue
-            col_data = df[col].dropna()
-            if len(col_data) == 0: continue
-            
-            q1 = col_data.quantile(0.25)
-            q3 = col_data.quantile(0.75)
-            iqr = q3 - q1
-            lower_bound = q1 - 1.5 * iqr
-            upper_bound = q3 + 1.5 * iqr
-            
-            outliers = col_data[(col_data < lower_bound) | (col_data > upper_bound)]
-            
-            boxplot_data[col] = {
-                "min": float(col_data.min()),
-                "q1": float(q1),
-                "median": float(col_data.median()),
-                "q3": float(q3),
-                "max": float(col_data.max()),
-                "outlier_count": len(outliers),
-                "outlier_percentage": round((len(outliers) / len(col_data)) * 100, 1)
-            }
+        key = ("eda", session_store.dataset_key(session_id, RAW))
+        if mode != "progressive":
+            etag = make_etag(*key, layout)
+            if is_fresh(request, etag):
+                return not_modified(etag)
+            return json_response(
+                await analysis_cache.get_or_compute(key, lambda: _compute_exact_eda(session_id)), layout,
+                headers=cache_headers(etag)
+            )
 
-        return {
-            "total_rows": total,
-            "total_columns": len(df.columns),
-            "columns": list(df.columns),
-            "null_counts": null_counts,
-            "description": description,
-            "histograms": histograms,
-            "correlation_matrix": corr_list,
-            "class_distribution": class_distribution,
-            "boxplot_data": boxplot_data,
-            "target_col": target_col
-        }
+        exact = analysis_cache.get(key)
+        if exact is not None:
+            return json_response({**exact, "approximate": False, "status": "complete"}, layout)
+
+        _start_refinement(key, session_id)
+        # Strata are built once per dataset; each round then reads only its sampled rows
+        strata = await analysis_cache.get_or_compute(("eda_strata", key[1]), lambda: _target_strata(session_id))
+        result = await run_in_threadpool(
+            compute_eda_progressive, strata, lambda rows: session_store.take(session_id, rows, RAW), budget_ms / 1000
+        )
+        result["status"] = "refining" if result["approximate"] else "complete"
+        return json_response(result, layout)
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error analyzing data: {str(e)}")
 
+@router.get("/eda/{session_id}/status")
+async def get_eda_status(session_id: str, wait_ms: int = 0,
+                         layout: str = Query(ROWS, alias="format", pattern=FORMAT_PATTERN)):
+    """
+    Reports the background exact EDA started by a progressive request.
+    wait_ms > 0 long-polls until the result is ready or the wait elapses.
+    """
+    if not session_store.exists(session_id, RAW):
+        raise HTTPException(status_code=404, detail="Session not found")
+
+    key = ("eda", session_store.dataset_key(session_id, RAW))
+    result = analysis_cache.get(key)
+    if result is not None:
+        return json_response({"status": "complete", "result": result}, layout)
+
+    task = _eda_refinements.get(key)
+    if task is None:
+        return {"status": "not_started"}
+    if wait_ms > 0 and not task.done():
+        await asyncio.wait({task}, timeout=wait_ms / 1000)
+    if not task.done():
+        return {"status": "refining"}
+    if task.exception() is not None:
+        return {"status": "failed", "detail": str(task.exception())}
+    return json_response({"status": "complete", "result": task.result()}, layout)
+
 @router.get("/preview/{session_id}")
 async def get_preview(session_id: str):
     """
@@ -185,14 +246,14 @@ async def get_preview(session_id: str):
             
     log_debug(f"Entering get_preview for {session_id}")
 
-    file_location = os.path.join(TEMP_DATA_DIR, f"{session_id}_raw.csv")
-    if not os.path.exists(file_location):
-        log_debug(f"File not found: {file_location}")
+    if not session_store.exists(session_id, RAW):
+        log_debug(f"Session not found: {session_id}")
         raise HTTPException(status_code=404, detail="Session not found")
         
     try:
-        log_debug(f"Reading CSV: {file_location}")
-        df = pd.read_csv(file_location, nrows=5)
+        log_debug(f"Loading dataset for {session_id}")
+        # Parsed once here and reused by the EDA / cleaning steps that follow
+        df = session_store.get(session_id, RAW).head(5)
         
         log_debug("Replacing NaNs")
         df = df.fillna("") # Safer string replacement for JSON
@@ -219,30 +280,19 @@ async def impute_data(session_id: str, strategies: dict[str, str] = Body(...)):
     Applies imputation strategies to the dataset.
     strategies: {"column_name": "mean" | "median" | "mode" | "drop_row"}
     """
-    file_location = os.path.join(TEMP_DATA_DIR, f"{session_id}_raw.csv")
-    if not os.path.exists(file_location):
+    if not session_store.exists(session_id, RAW):
         raise HTTPException(status_code=404, detail="Session not found")
     
     try:
-        df = pd.read_csv(file_location)
-        
-        for col, method in strategies.items():
-            if col not in df.columns:
-                continue
-                
-            if method == "drop_row":
-                df.dropna(subset=[col], inplace=True)
-            elif method == "mean" and pd.api.types.is_numeric_dtype(df[col]):
-                df[col] = df[col].fillna(df[col].mean())
-            elif method == "median" and pd.api.types.is_numeric_dtype(df[col]):
-                df[col] = df[col].fillna(df[col].median())
-            elif method == "mode":
-                if not df[col].mode().empty:
-                    df[col] = df[col].fillna(df[col].mode()[0])
-        
-        # Save cleaned version
-        cleaned_location = os.path.join(TEMP_DATA_DIR, f"{session_id}_cleaned.csv")
-        df.to_csv(cleaned_location, index=False)
+        # Same data + same strategies always give the same cleaned dataset
+        cleaned_key = derived_key(session_store.dataset_key(session_id, RAW), "impute", strategies)
+        try:
+            session_store.get_dataset(cleaned_key)
+            session_store.link(session_id, CLEANED, cleaned_key)
+        except FileNotFoundError:
+            _apply_imputation(session_id, strategies, cleaned_key)
+        df = session_store.get(session_id, CLEANED)
+        cleaned_location = session_store.path_for(session_id, CLEANED)
         
         return {
             "message": "Imputation applied successfully",
@@ -253,229 +303,237 @@ async def impute_data(session_id: str, strategies: dict[str, str] = Body(...)):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error cleaning data: {str(e)}")
 
+def _apply_imputation(session_id, strategies, cleaned_key):
+    # Cached frames are shared, so clean a private copy
+    df = session_store.get(session_id, RAW).copy()
+
+    for col, method in strategies.items():
+        if col not in df.columns:
+            continue
+            
+        if method == "drop_row":
+            df.dropna(subset=[col], inplace=True)
+        elif method == "mean" and pd.api.types.is_numeric_dtype(df[col]):
+            df[col] = df[col].fillna(df[col].mean())
+        elif method == "median" and pd.api.types.is_numeric_dtype(df[col]):
+            df[col] = df[col].fillna(df[col].median())
+        elif method == "mode":
+            if not df[col].mode().empty:
+                df[col] = df[col].fillna(df[col].mode()[0])
+    
+    # Save cleaned version, replacing any previously stored (and cached) one
+    session_store.save(session_id, CLEANED, df, key=cleaned_key)
+
+@router.get("/export/{session_id}")
+async def export_dataset(session_id: str, version: str = "latest"):
+    """
+    Exports a session dataset as CSV.
+    version: "raw" | "cleaned" | "latest"
+    """
+    if version == "latest":
+        version = session_store.latest_version(session_id)
+    if version not in (RAW, CLEANED) or not session_store.exists(session_id, version):
+        raise HTTPException(status_code=404, detail="Dataset not found")
+
+    df = session_store.get(session_id, version)
+    return Response(
+        content=df.to_csv(index=False),
+        media_type="text/csv",
+        headers={"Content-Disposition": f'attachment; filename="{session_id}_{version}.csv"'}
+    )
+
 @router.get("/compare/{session_id}")
-async def compare_data(session_id: str):
+async def compare_data(request: Request, session_id: str,
+                       layout: str = Query(ROWS, alias="format", pattern=FORMAT_PATTERN)):
     """
     Returns 'Before vs After' histogram data for visualization.
+    The ETag is derived from both dataset versions; If-None-Match gets a 304.
     """
-    raw_location = os.path.join(TEMP_DATA_DIR, f"{session_id}_raw.csv")
-    cleaned_location = os.path.join(TEMP_DATA_DIR, f"{session_id}_cleaned.csv")
-    
-    if not os.path.exists(cleaned_location):
+    if not session_store.exists(session_id, CLEANED):
         raise HTTPException(status_code=404, detail="Cleaned data used for comparison not found. Please impute first.")
         
-    try:
-        df_raw = pd.read_csv(raw_location)
-        df_clean = pd.read_csv(cleaned_location)
-        
-        comparison_data = {}
-        
-        # Compare numerical columns
-        for col in df_clean.select_dtypes(include=[np.number]).columns:
-            if col not in df_raw.columns:
-                continue
-                
-            # Raw Histogram
-            raw_vals = df_raw[col].dropna().values
-            clean_vals = df_clean[col].dropna().values
-            
-            if len(raw_vals) == 0 or len(clean_vals) == 0:
-                continue
+    def compute():
+        df_clean = session_store.get(session_id, CLEANED)
+        # Only the numeric columns are compared, so map just those from the raw data
+        numeric_cols = df_clean.select_dtypes(include=[np.number]).columns.tolist()
+        df_raw = session_store.get(session_id, RAW, columns=numeric_cols)
+        return compute_comparison(df_raw, df_clean)
 
-            # Use fixed bins based on the full range (raw + clean) to align charts
-            min_val = min(raw_vals.min(), clean_vals.min())
-            max_val = max(raw_vals.max(), clean_vals.max())
-            
-            # Create 20 bins
-            bins = np.linspace(min_val, max_val, 21)
-            
-            raw_hist, _ = np.histogram(raw_vals, bins=bins)
-            clean_hist, _ = np.histogram(clean_vals, bins=bins)
-            
-            chart_data = []
-            for i in range(len(raw_hist)):
-                label = f"{bins[i]:.1f}-{bins[i+1]:.1f}"
-                chart_data.append({
-                    "name": label,
-                    "Raw": int(raw_hist[i]),
-                    "Cleaned": int(clean_hist[i])
-                })
-                
-            comparison_data[col] = chart_data
-
-        return {"comparisons": comparison_data}
+    try:
+        key = ("compare", session_store.dataset_key(session_id, RAW),
+               session_store.dataset_key(session_id, CLEANED))
+        etag = make_etag(*key, layout)
+        if is_fresh(request, etag):
+            return not_modified(etag)
+        return json_response(await analysis_cache.get_or_compute(key, compute), layout,
+                             headers=cache_headers(etag))
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error comparing data: {str(e)}")
 
-from sklearn.model_selection import train_test_split
-from sklearn.ensemble import RandomForestClassifier, GradientBoostingClassifier
-from sklearn.linear_model import LogisticRegression
-from sklearn.metrics import (
-    accuracy_score, f1_score, confusion_matrix, 
-    precision_score, recall_score, roc_auc_score, roc_curve
-)
-from pydantic import BaseModel
-import json
+from pydantic import BaseModel, Field
 from datetime import datetime
 
 class TrainingConfig(BaseModel):
+    # "Random Forest", "Gradient Boosting", "Histogram Gradient Boosting" or "Logistic Regression"
     model_type: str = "Random Forest"
     params: dict = {}
+    # Stratified k-fold evaluation in addition to the hold-out split (0: off)
+    cv_folds: int = Field(0, ge=0, le=20)
+
+class ComparisonRequest(BaseModel):
+    configs: list[TrainingConfig]
+    n_jobs: int | None = None  # total core budget, default all cores
+    rank_by: str = "auc_score"
+
+RANKING_METRICS = {"accuracy", "f1_score", "precision", "recall", "auc_score"}
+
+class SearchConfig(BaseModel):
+    model_type: str = "Random Forest"
+    # {param: {"type": "int" | "float" | "log" | "choice", "low", "high" | "choices"}}; default per model type
+    space: dict | None = None
+    n_trials: int = Field(27, ge=1, le=243)
+    eta: int = Field(3, ge=2, le=10)
+    metric: str = "auc_score"
+    n_jobs: int | None = None
 
 @router.post("/train/{session_id}")
-async def train_model(session_id: str, config: TrainingConfig = Body(...)):
+async def train_model(session_id: str, config: TrainingConfig = Body(...),
+                      layout: str = Query(ROWS, alias="format", pattern=FORMAT_PATTERN)):
     """
     Trains a model based on user configuration.
+    For long trainings prefer POST /jobs/train/{session_id}.
     """
-    file_location = os.path.join(TEMP_DATA_DIR, f"{session_id}_cleaned.csv")
-    if not os.path.exists(file_location):
-        file_location = os.path.join(TEMP_DATA_DIR, f"{session_id}_raw.csv")
-        
-    if not os.path.exists(file_location):
+    if session_store.latest_version(session_id) is None:
         raise HTTPException(status_code=404, detail="Dataset not found")
         
     try:
-        df = pd.read_csv(file_location)
-        # Handle simple target assumption
-        target_col = 'Potability' if 'Potability' in df.columns else df.columns[-1]
-        
-        X = df.drop(columns=[target_col])
-        y = df[target_col]
-        
-        # Simple imputation for safety
-        if X.isnull().sum().sum() > 0:
-            X = X.fillna(X.mean())
-            
-        X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-        
-        # Model Selection
-        model_type = config.model_type
-        params = config.params
-        
-        if model_type == "Gradient Boosting":
-            # Safe defaults if params missing
-            n_estimators = int(params.get("n_estimators", 100))
-            learning_rate = float(params.get("learning_rate", 0.1))
-            model = GradientBoostingClassifier(n_estimators=n_estimators, learning_rate=learning_rate, random_state=42)
-            
-        elif model_type == "Logistic Regression":
-            C = float(params.get("C", 1.0))
-            model = LogisticRegression(C=C, max_iter=1000, random_state=42)
-            
-        else: # Default Random Forest
-            n_estimators = int(params.get("n_estimators", 100))
-            max_depth = params.get("max_depth", None)
-            if max_depth == "None": max_depth = None
-            else: max_depth = int(max_depth) if max_depth else None
-            
-            model = RandomForestClassifier(n_estimators=n_estimators, max_depth=max_depth, random_state=42)
-            
-        model.fit(X_train, y_train)
-        
-        y_pred = model.predict(X_test)
-        y_prob = model.predict_proba(X_test)[:, 1]
-        
-        acc = accuracy_score(y_test, y_pred)
-        f1 = f1_score(y_test, y_pred, average='weighted')
-        precision = precision_score(y_test, y_pred, average='weighted', zero_division=0)
-        recall = recall_score(y_test, y_pred, average='weighted', zero_division=0)
-        cm = confusion_matrix(y_test, y_pred).tolist()
-        
-        # ROC Calculation
-        auc_score = 0
-        roc_data = []
-        try:
-            if len(np.unique(y)) == 2:
-                auc_score = roc_auc_score(y_test, y_prob)
-                fpr, tpr, _ = roc_curve(y_test, y_prob)
-                indices = np.linspace(0, len(fpr)-1, 20, dtype=int)
-                for i in indices:
-                    roc_data.append({"fpr": float(fpr[i]), "tpr": float(tpr[i])})
-        except:
-            pass
-
-        # Feature Importance (Switch for LR)
-        feature_importance = []
-        if hasattr(model, 'feature_importances_'):
-            importances = model.feature_importances_
-            feature_importance = [{"feature": col, "importance": float(imp)} for col, imp in zip(X.columns, importances)]
-        elif hasattr(model, 'coef_'):
-            importances = np.abs(model.coef_[0])
-            feature_importance = [{"feature": col, "importance": float(imp)} for col, imp in zip(X.columns, importances)]
-            
-        feature_importance.sort(key=lambda x: x['importance'], reverse=True)
-        feature_importance = feature_importance[:10]
-
-        # 3. Threshold Tuning Data
-        threshold_curves = []
-        try:
-            if len(np.unique(y)) == 2:
-                for thresh in np.linspace(0, 1, 21):
-                    y_pred_thresh = (y_prob >= thresh).astype(int)
-                    p_t = float(precision_score(y_test, y_pred_thresh, zero_division=0))
-                    r_t = float(recall_score(y_test, y_pred_thresh, zero_division=0))
-                    f_t = float(f1_score(y_test, y_pred_thresh, zero_division=0))
-                    threshold_curves.append({
-                        "threshold": round(float(thresh), 2),
-                        "precision": p_t,
-                        "recall": r_t,
-                        "f1": f_t
-                    })
-        except:
-            pass
-
-        # Save model
-        model_path = os.path.join(TEMP_DATA_DIR, f"{session_id}_model.pkl")
-        with open(model_path, "wb") as f:
-            pickle.dump(model, f)
-            
-        # Log History
-        history_path = os.path.join(TEMP_DATA_DIR, f"{session_id}_history.json")
-        run_record = {
-            "timestamp": datetime.now().isoformat(),
-            "model_type": model_type,
-            "params": params,
-            "metrics": {
-                "accuracy": float(acc),
-                "f1": float(f1),
-                "auc": float(auc_score)
-            }
-        }
-        
-        history = []
-        if os.path.exists(history_path):
-            with open(history_path, 'r') as hf:
-                history = json.load(hf)
-        history.append(run_record)
-        with open(history_path, 'w') as hf:
-            json.dump(history, hf)
-            
-        return {
-            "accuracy": float(acc),
-            "f1_score": float(f1),
-            "precision": float(precision),
-            "recall": float(recall),
-            "auc_score": float(auc_score),
-            "roc_curve": roc_data,
-            "confusion_matrix": cm,
-            "feature_importance": feature_importance,
-            "threshold_curves": threshold_curves, # NEW
-            "target": target_col,
-            "model_path": model_path,
-            "history": history
-        }
-        
+        result = await run_in_threadpool(
+            train_session_model, session_id, config.model_type, config.params, -1, config.cv_folds
+        )
+        return json_response(result, layout)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error training model: {str(e)}")
 
+@router.post("/train_compare/{session_id}")
+async def train_compare(session_id: str, request: ComparisonRequest = Body(...),
+                        layout: str = Query(ROWS, alias="format", pattern=FORMAT_PATTERN)):
+    """
+    Trains several configurations on one shared split in parallel and ranks them.
+    The best model becomes the session's downloadable model.
+    """
+    if session_store.latest_version(session_id) is None:
+        raise HTTPException(status_code=404, detail="Dataset not found")
+    if not request.configs:
+        raise HTTPException(status_code=400, detail="At least one configuration is required")
+    if request.rank_by not in RANKING_METRICS:
+        raise HTTPException(status_code=400, detail=f"rank_by must be one of {sorted(RANKING_METRICS)}")
+
+    try:
+        configs = [c.model_dump() for c in request.configs]
+        result = await run_in_threadpool(compare_session_models, session_id, configs, request.n_jobs, request.rank_by)
+        return json_response(result, layout)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error training models: {str(e)}")
+
+@router.post("/jobs/train/{session_id}", status_code=202)
+async def submit_training_job(session_id: str, config: TrainingConfig = Body(...), timeout: float | None = None):
+    """
+    Queues a training run in a background worker process.
+    Poll GET /jobs/{job_id} for progress and fetch GET /jobs/{job_id}/result when done.
+    """
+    if session_store.latest_version(session_id) is None:
+        raise HTTPException(status_code=404, detail="Dataset not found")
+
+    # Concurrent jobs share the machine, so each gets an equal slice of the cores
+    threads = max(1, (os.cpu_count() or 1) // job_manager.max_workers)
+    job = job_manager.submit(
+        "train", train_session_model,
+        args=(session_id, config.model_type, config.params, threads, config.cv_folds),
+        timeout=timeout, session_id=session_id,
+    )
+    return job.to_dict()
+
+@router.post("/jobs/search/{session_id}", status_code=202)
+async def submit_search_job(session_id: str, config: SearchConfig = Body(...), timeout: float | None = None):
+    """
+    Queues a successive-halving hyperparameter search as a background job.
+    GET /jobs/{job_id} streams the leaderboard in ``details``; the result is the
+    retrained best model's metrics plus the final leaderboard.
+    """
+    if session_store.latest_version(session_id) is None:
+        raise HTTPException(status_code=404, detail="Dataset not found")
+    if config.metric not in RANKING_METRICS:
+        raise HTTPException(status_code=400, detail=f"metric must be one of {sorted(RANKING_METRICS)}")
+
+    n_jobs = config.n_jobs or max(1, (os.cpu_count() or 1) // job_manager.max_workers)
+    job = job_manager.submit(
+        "search", search_session_hyperparameters,
+        args=(session_id, config.model_type, config.space, config.n_trials, config.eta, config.metric, n_jobs),
+        timeout=timeout, session_id=session_id,
+    )
+    return job.to_dict()
+
+@router.get("/jobs")
+async def list_jobs(session_id: str | None = None):
+    """Lists known jobs, optionally for one session."""
+    filters = {"session_id": session_id} if session_id else {}
+    return {"jobs": [job.to_dict() for job in job_manager.list(**filters)], **job_manager.stats()}
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Returns the status and progress of a job."""
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+@router.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: str, layout: str = Query(ROWS, alias="format", pattern=FORMAT_PATTERN)):
+    """Returns the result of a finished job."""
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job.status == SUCCEEDED:
+        return json_response(job.result, layout)
+    if job.status in FINISHED_STATES:
+        raise HTTPException(status_code=500, detail=f"Job {job.status}: {job.error}")
+    raise HTTPException(status_code=409, detail=f"Job is still {job.status}")
+
+@router.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    """Cancels a queued or running job."""
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    # Waits for the worker to exit, so off the event loop
+    if not await run_in_threadpool(job_manager.cancel, job_id):
+        raise HTTPException(status_code=409, detail=f"Job already {job.status}")
+    return job.to_dict()
+
 @router.get("/download_model/{session_id}")
 async def download_model(session_id: str):
     """
     Downloads the trained model as a .pkl file.
     """
-    model_path = os.path.join(TEMP_DATA_DIR, f"{session_id}_model.pkl")
+    model_path = model_path_for(session_id)
     if not os.path.exists(model_path):
         raise HTTPException(status_code=404, detail="Model not found. Please train first.")
         
     return FileResponse(model_path, filename="water_quality_model.pkl", media_type="application/octet-stream")
+
+@router.get("/admin/usage", dependencies=[Depends(require_admin)])
+async def get_disk_usage():
+    """
+    Reports DataLab disk usage per session and in total, against the quota.
+    Sessions are listed by opaque reference, never by ID. Requires X-Admin-Token.
+    """
+    return await run_in_threadpool(session_lifecycle.usage)
+
+@router.post("/admin/sweep", dependencies=[Depends(require_admin)])
+async def run_sweep():
+    """
+    Expires idle sessions, enforces the disk quota and deletes unreferenced datasets now.
+    Requires X-Admin-Token.
+    """
+    return await run_in_threadpool(session_lifecycle.sweep)
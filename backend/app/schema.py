@@ -11,6 +11,25 @@ class WaterQualityInput(BaseModel):
     Trihalomethanes: float = Field(..., description="Amount of Trihalomethanes in μg/L", json_schema_extra={"example": 60.0})
     Turbidity: float = Field(..., description="Measure of light emitting property in NTU", json_schema_extra={"example": 4.0})
 
+class FeedbackInput(WaterQualityInput):
+    """A sample with its lab-confirmed potability, for retraining."""
+    potable: bool = Field(..., description="Lab-confirmed potability of the sample")
+    predicted_score: float | None = Field(None, ge=0, le=1, allow_inf_nan=False,
+                                          description="Score the model returned for this sample, if known")
+    prediction_id: str | None = Field(None, description="prediction_id returned by /predict, to evaluate that prediction")
+
+class FeedbackResponse(BaseModel):
+    status: str
+    pending_rows: int
+
+class ShadowCandidateInput(BaseModel):
+    """A candidate model to score live traffic in shadow mode. Give exactly one source."""
+    name: str = Field(..., min_length=1, max_length=64)
+    session_id: str | None = Field(None, description="DataLab session whose trained model to shadow")
+    model_file: str | None = Field(None, description="Model file name inside the backend model directory")
+    fraction: float = Field(0.1, gt=0, le=1, description="Fraction of /predict requests to shadow")
+    threshold: float | None = Field(None, ge=0, le=1, description="Decision threshold (default: production)")
+
 class FeatureContribution(BaseModel):
     feature: str
     value: float
@@ -22,17 +41,26 @@ class PredictionResponse(BaseModel):
     status: str
     threshold_used: float
     explanation: list[FeatureContribution] = []
+    prediction_id: str | None = None  # send back with the lab label to /feedback
 
 
 class FeatureImportanceItem(BaseModel):
     feature: str
     importance: float
 
+class FeatureImportanceResponse(BaseModel):
+    model_name: str
+    model_version: str
+    feature_importance: list[FeatureImportanceItem] = []
+
 class StatsResponse(BaseModel):
-    r2_score: float
-    rmse: float
-    recall_optimized: float
+    """Live evaluation of the deployed model against labels received through /feedback."""
     model_name: str
+    threshold: float
+    predictions: int
+    awaiting_label: int
+    unmatched_labels: int
+    windows: dict  # "1h" | "24h" | "7d" | "lifetime" -> confusion counts, recall, precision, calibration
     feature_importance: list[FeatureImportanceItem] = []
 
 
@@ -58,6 +86,23 @@ class pHForecastResponse(BaseModel):
     confidence: float
 
 
+class LocationPHForecast(BaseModel):
+    location_id: int
+    predicted_ph: float
+    last_ph: float
+    actual_ph: float | None = None  # known only when forecasting a past date
+
+
+class NetworkPHForecastResponse(BaseModel):
+    """Next-step pH for every monitoring location (normalised dataset scale)."""
+    date_index: int
+    forecasts: list[LocationPHForecast]
+    latency_ms: float
+    budget_ms: float
+    within_budget: bool
+    model_metrics: dict
+
+
 class IoTReading(BaseModel):
     sensor_id: str
     ph: float
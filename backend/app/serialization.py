@@ -0,0 +1,94 @@
+"""
+Fast JSON encoding and an opt-in columnar layout for large analytical responses.
+
+Endpoints without a ``response_model`` normally go through ``jsonable_encoder``,
+which walks and copies every nested dict, and then ``json.dumps``. For EDA and
+training results that is thousands of small dicts per request. Those endpoints
+return ``json_response(...)`` instead. It encodes the result in one step with
+orjson when it is installed, or with compact stdlib JSON otherwise, and skips the
+encoder walk. Endpoints with a ``response_model`` are left alone: FastAPI already
+serialises them straight to bytes through pydantic.
+
+``format=columnar`` swaps lists of uniform records for parallel arrays. For
+example, ``[{"fpr": 0, "tpr": 0}, ...]`` becomes ``{"fpr": [...], "tpr": [...]}``,
+and the flat ``{"x", "y", "value"}`` correlation list becomes a column list plus
+a square matrix. Keys are no longer repeated per element, which roughly halves
+the payload of wide datasets (see ``scripts/benchmark_serialization.py``).
+"""
+
+import json
+
+import numpy as np
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # optional dependency
+    orjson = None
+
+ROWS, COLUMNAR = "rows", "columnar"
+FORMAT_PATTERN = f"^({ROWS}|{COLUMNAR})$"
+_MATRIX_KEYS = {"x", "y", "value"}
+
+
+def _default(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(content):
+    """Compact JSON bytes; numpy arrays and scalars are encoded as plain values."""
+    if orjson is not None:
+        return orjson.dumps(content, default=_default,
+                            option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, default=_default, ensure_ascii=False, allow_nan=False,
+                      separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content):
+        return dumps(content)
+
+
+def _matrix(records):
+    columns = list(dict.fromkeys(r["x"] for r in records))
+    position = {c: i for i, c in enumerate(columns)}
+    values = [[None] * len(columns) for _ in columns]
+    for r in records:
+        values[position[r["x"]]][position[r["y"]]] = r["value"]
+    return {"columns": columns, "values": values}
+
+
+def to_columnar(value):
+    """
+    Copy of ``value`` with every list of same-keyed dicts turned into a dict of
+    parallel lists (``{"x", "y", "value"}`` lists become a matrix). The input is
+    not modified, so cached results can be passed in.
+    """
+    if isinstance(value, dict):
+        return {k: to_columnar(v) for k, v in value.items()}
+    if isinstance(value, list):
+        if value and all(isinstance(v, dict) for v in value):
+            keys = value[0].keys()
+            if all(v.keys() == keys for v in value):
+                if keys == _MATRIX_KEYS:
+                    return _matrix(value)
+                return {k: _column([v[k] for v in value]) for k in keys}
+        return [to_columnar(v) for v in value]
+    return value
+
+
+def _column(values):
+    # Columns of scalars (the common case) are returned without a per-element walk
+    if any(isinstance(v, (dict, list)) for v in values):
+        return [to_columnar(v) for v in values]
+    return values
+
+
+def json_response(content, layout=ROWS, status_code=200, headers=None):
+    if layout == COLUMNAR:
+        content = {**to_columnar(content), "format": COLUMNAR}
+    return FastJSONResponse(content, status_code=status_code, headers=headers)
@@ -1,9 +1,15 @@
+import hashlib
 import joblib
 import json
 import os
+import time
+import uuid
 import pandas as pd
 import numpy as np
 from .schema import WaterQualityInput
+from .shadow import shadow_scorer
+from .online_eval import online_evaluator
+from .shap_index import ShapIndex
 
 MODEL_DIR = os.path.join(os.path.dirname(__file__), 'model')
 MODEL_PATH = os.path.join(MODEL_DIR, 'water_quality_model.pkl')
@@ -13,19 +19,30 @@ IMPUTER_PATH = os.path.join(MODEL_DIR, 'imputer_values.json')
 DATA_PATH = os.path.join(os.path.dirname(__file__), '../../Data/water_potability.csv')
 EXPLAINER_PATH = os.path.join(MODEL_DIR, 'shap_explainer.pkl')
 FEATURE_IMPORTANCE_PATH = os.path.join(MODEL_DIR, 'global_feature_importance.json')
+SHAP_INDEX_PATH = os.path.join(MODEL_DIR, 'shap_index.pkl')
+# Opt-in: answer explanations from the nearest-neighbour SHAP index when close enough
+SHAP_APPROXIMATION = os.environ.get("SHAP_APPROXIMATION", "0") == "1"
 
 class ModelService:
     def __init__(self):
         self.model = None
         self.explainer = None
+        self.shap_index = None
         self.feature_importance = []
         self.threshold = 0.5
         self.imputer_values = {}
         self.data_df = None
+        self.version = None
         self._load_artifacts()
         self._load_data()
 
+    def reload(self):
+        """Re-reads the model, threshold and explainer after they were updated on disk."""
+        self.explainer = None
+        self._load_artifacts()
+
     def _load_artifacts(self):
+        self.version = artifact_version()
         try:
             if os.path.exists(MODEL_PATH):
                 self.model = joblib.load(MODEL_PATH)
@@ -44,6 +61,13 @@ class ModelService:
                 except Exception as e:
                     print(f"Error loading explainer: {e}")
 
+            if SHAP_APPROXIMATION:
+                try:
+                    self.shap_index = ShapIndex.load(SHAP_INDEX_PATH, MODEL_PATH)
+                except Exception as e:
+                    self.shap_index = None
+                    print(f"Error loading SHAP index: {e}")
+
             if os.path.exists(FEATURE_IMPORTANCE_PATH):
                 with open(FEATURE_IMPORTANCE_PATH, 'r') as f:
                     self.feature_importance = json.load(f)
@@ -67,36 +91,48 @@ class ModelService:
         df = pd.DataFrame([data])
         df.fillna(self.imputer_values, inplace=True)
         
+        start = time.perf_counter()
         probs = self.model.predict_proba(df)[:, 1]
+        latency_ms = (time.perf_counter() - start) * 1000
         score = float(probs[0])
         is_potable = score >= self.threshold
+        # Candidate models score this row later, on a background thread
+        shadow_scorer.observe(df, score, self.threshold, latency_ms)
+        # Joined with the lab label when it arrives at /feedback
+        prediction_id = uuid.uuid4().hex
+        online_evaluator.record_prediction(prediction_id, score, self.threshold)
 
         explanation = []
-        if self.explainer:
+        vals = None
+        if self.shap_index is not None:
+            # None when the row is too far from the reference set to approximate within tolerance
+            vals = self.shap_index.explain(df.to_numpy(), score)
+        if vals is None and self.explainer:
             try:
                 shap_values = self.explainer(df)
                 # Handle shape (1, features, 2) for binary classification
                 vals = shap_values.values[0]
                 if vals.ndim > 1:
                     vals = vals[:, 1]  # Take positive class contribution
-                
-                for i, col in enumerate(df.columns):
-                    explanation.append({
-                        "feature": col,
-                        "value": float(df.iloc[0, i]),
-                        "contribution": float(vals[i])
-                    })
-                # Sort by absolute impact
-                explanation.sort(key=lambda x: abs(x['contribution']), reverse=True)
             except Exception as e:
                 print(f"Error generating SHAP explanation: {e}")
+        if vals is not None:
+            for i, col in enumerate(df.columns):
+                explanation.append({
+                    "feature": col,
+                    "value": float(df.iloc[0, i]),
+                    "contribution": float(vals[i])
+                })
+            # Sort by absolute impact
+            explanation.sort(key=lambda x: abs(x['contribution']), reverse=True)
         
         return {
             "potability_score": score,
             "is_potable": bool(is_potable),
             "status": "Safe" if is_potable else "Not Safe",
             "threshold_used": self.threshold,
-            "explanation": explanation
+            "explanation": explanation,
+            "prediction_id": prediction_id
         }
 
     def get_random_sample(self):
@@ -116,7 +152,47 @@ class ModelService:
                 
         return sample_dict
 
+    def reference_rows(self, n=1000):
+        """Up to n dataset rows as the model sees them (imputed features), or None without data."""
+        if self.data_df is None:
+            return None
+        X = self.data_df[list(WaterQualityInput.model_fields)].fillna(self.imputer_values)
+        return X.sample(min(n, len(X)), random_state=0)
+
     def get_global_feature_importance(self):
         return self.feature_importance
 
+    def model_name(self):
+        if self.model is None:
+            return "No model loaded"
+        return type(self.model).__name__
+
+def artifact_version(paths=(MODEL_PATH, THRESHOLD_PATH, FEATURE_IMPORTANCE_PATH)):
+    """Short fingerprint of the serving artifacts (size and mtime), changed by retraining or promotion."""
+    stats = []
+    for path in paths:
+        if os.path.exists(path):
+            st = os.stat(path)
+            stats.append((os.path.basename(path), st.st_size, st.st_mtime_ns))
+    return hashlib.sha256(repr(stats).encode()).hexdigest()[:16]
+
+def rebuild_explainer(model, path=EXPLAINER_PATH):
+    """
+    Replaces the saved SHAP explainer after the model changed. TreeExplainer only
+    reads the trees, so this does not depend on data size. Models it cannot
+    explain get no explainer rather than a stale one.
+    """
+    try:
+        import shap
+        explainer = shap.TreeExplainer(model)
+    except Exception as e:
+        print(f"No SHAP explainer for the new model: {e}")
+        if os.path.exists(path):
+            os.remove(path)
+        return None
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    joblib.dump(explainer, tmp_path)
+    os.replace(tmp_path, path)
+    return explainer
+
 model_service = ModelService()
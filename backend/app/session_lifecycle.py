@@ -0,0 +1,278 @@
+"""
+Lifecycle management for DataLab sessions on disk.
+
+A session is identified by its ``temp_data/<session>_session.json`` manifest.
+It owns the other top-level ``temp_data/<session>_*`` files (trained model,
+history) and references content-addressed datasets under ``temp_data/datasets/``.
+Files without a manifest, such as CSVs left by earlier versions, are never
+counted or removed. Any request for a session touches its manifest, so the
+newest mtime among its files is its last access time.
+
+A background sweeper periodically
+  1. expires sessions idle for longer than the TTL,
+  2. evicts least recently used sessions while disk usage exceeds the quota, and
+  3. deletes datasets no remaining session references (reference counting over
+     all manifests; datasets younger than a grace period are kept, since they
+     may have been written but not yet linked).
+Sessions with a queued or running job are never removed.
+
+A session ID is the only credential for a session's data, so usage and sweep
+reports name sessions by ``session_ref``, a one-way hash of the ID.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+
+from .session_store import session_store
+from .jobs import job_manager, FINISHED_STATES
+
+DEFAULT_TTL_S = float(os.environ.get("DATALAB_SESSION_TTL_S", 24 * 3600))
+DEFAULT_QUOTA_BYTES = int(os.environ.get("DATALAB_DISK_QUOTA_BYTES", 5 * 1024 ** 3))
+DEFAULT_SWEEP_INTERVAL_S = float(os.environ.get("DATALAB_SWEEP_INTERVAL_S", 600))
+# Unreferenced datasets younger than this are left alone
+DATASET_GRACE_S = 300
+# Repeated touches of the same session within this window are skipped
+TOUCH_INTERVAL_S = 30
+
+MANIFEST_SUFFIX = "_session.json"
+
+
+def session_ref(session_id):
+    """Opaque, stable name for a session in admin reports; the session ID cannot be recovered from it."""
+    return hashlib.sha256(session_id.encode()).hexdigest()[:16]
+
+
+def _disk_usage(path):
+    if not os.path.isdir(path):
+        return os.path.getsize(path)
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+class SessionLifecycleManager:
+    def __init__(self, store=session_store, ttl_s=DEFAULT_TTL_S, quota_bytes=DEFAULT_QUOTA_BYTES,
+                 sweep_interval_s=DEFAULT_SWEEP_INTERVAL_S):
+        self.store = store
+        self.ttl_s = ttl_s
+        self.quota_bytes = quota_bytes
+        self.sweep_interval_s = sweep_interval_s
+        self._touched = {}  # session_id -> time of the last recorded touch
+        self._lock = threading.Lock()
+        self._sweeper = None
+        self._last_sweep = None
+
+    @property
+    def data_dir(self):
+        return self.store.data_dir
+
+    def touch(self, session_id):
+        """Records an access to a session (throttled) and makes sure the sweeper runs."""
+        self._ensure_sweeper()
+        now = time.time()
+        if now - self._touched.get(session_id, 0) < TOUCH_INTERVAL_S:
+            return
+        self._touched[session_id] = now
+        try:
+            os.utime(self.store.manifest_path(session_id))
+        except FileNotFoundError:
+            pass
+
+    # ---- Inventory ----------------------------------------------------------
+
+    def _sessions(self):
+        """session_id -> {"paths", "bytes", "last_access"} for top-level files of sessions with a manifest."""
+        sessions = {}
+        if not os.path.isdir(self.data_dir):
+            return sessions
+        entries = list(os.scandir(self.data_dir))
+        known = {e.name[:-len(MANIFEST_SUFFIX)] for e in entries if e.name.endswith(MANIFEST_SUFFIX)}
+        for entry in entries:
+            session_id = entry.name.split("_", 1)[0]
+            if session_id not in known:
+                continue
+            try:
+                mtime = entry.stat().st_mtime
+                size = _disk_usage(entry.path)
+            except OSError:
+                continue
+            info = sessions.setdefault(session_id, {"paths": [], "bytes": 0, "last_access": 0.0})
+            info["paths"].append(entry.path)
+            info["bytes"] += size
+            info["last_access"] = max(info["last_access"], mtime)
+        return sessions
+
+    def _session_keys(self, session_id):
+        path = self.store.manifest_path(session_id)
+        try:
+            with open(path, "r") as f:
+                return set(json.load(f).values())
+        except (FileNotFoundError, ValueError):
+            return set()
+
+    def _datasets(self):
+        """dataset key -> {"bytes", "mtime"}."""
+        datasets = {}
+        root = os.path.join(self.data_dir, "datasets")
+        if not os.path.isdir(root):
+            return datasets
+        for entry in os.scandir(root):
+            if not entry.is_dir() or entry.name.startswith("."):
+                continue  # staging directories of in-progress writes
+            try:
+                datasets[entry.name] = {"bytes": _disk_usage(entry.path), "mtime": entry.stat().st_mtime}
+            except OSError:
+                continue
+        return datasets
+
+    def _busy_sessions(self):
+        return {j.meta.get("session_id") for j in job_manager.list() if j.status not in FINISHED_STATES}
+
+    def usage(self):
+        """Disk usage per session and in total, most recently used sessions first."""
+        now = time.time()
+        sessions = self._sessions()
+        datasets = self._datasets()
+        refcounts = {}
+        keys_by_session = {}
+        for session_id in sessions:
+            keys = self._session_keys(session_id)
+            keys_by_session[session_id] = keys
+            for key in keys:
+                refcounts[key] = refcounts.get(key, 0) + 1
+
+        rows = []
+        for session_id, info in sessions.items():
+            keys = [k for k in keys_by_session[session_id] if k in datasets]
+            rows.append({
+                "session_ref": session_ref(session_id),
+                "bytes": info["bytes"],
+                "dataset_bytes": sum(datasets[k]["bytes"] for k in keys),
+                "shared_datasets": sum(1 for k in keys if refcounts[k] > 1),
+                "last_access": info["last_access"],
+                "idle_s": round(now - info["last_access"], 1),
+            })
+        rows.sort(key=lambda r: r["last_access"], reverse=True)
+
+        session_bytes = sum(s["bytes"] for s in sessions.values())
+        dataset_bytes = sum(d["bytes"] for d in datasets.values())
+        return {
+            "sessions": rows,
+            "datasets": {
+                "count": len(datasets),
+                "bytes": dataset_bytes,
+                "unreferenced": sum(1 for k in datasets if k not in refcounts),
+            },
+            "total_bytes": session_bytes + dataset_bytes,
+            "quota_bytes": self.quota_bytes,
+            "ttl_s": self.ttl_s,
+            "last_sweep": self._last_sweep,
+        }
+
+    # ---- Sweeping -----------------------------------------------------------
+
+    def _remove_session(self, session_id, info):
+        for path in info["paths"]:
+            try:
+                if os.path.isdir(path):
+                    shutil.rmtree(path)
+                else:
+                    os.remove(path)
+            except FileNotFoundError:
+                pass
+        self.store.forget_session(session_id)
+        self._touched.pop(session_id, None)
+
+    def sweep(self, now=None):
+        """Runs one expiry / quota / garbage-collection pass and returns what it removed."""
+        with self._lock:
+            now = time.time() if now is None else now
+            sessions = self._sessions()
+            datasets = self._datasets()
+            busy = self._busy_sessions()
+
+            keys_by_session = {sid: self._session_keys(sid) for sid in sessions}
+            refcounts = {}
+            for keys in keys_by_session.values():
+                for key in keys:
+                    refcounts[key] = refcounts.get(key, 0) + 1
+
+            expired, evicted = [], []
+            freed = 0
+            orphaned = set()  # datasets whose last referencing session was just removed
+
+            def remove(session_id):
+                nonlocal freed
+                info = sessions.pop(session_id)
+                self._remove_session(session_id, info)
+                freed += info["bytes"]
+                for key in keys_by_session.pop(session_id):
+                    refcounts[key] -= 1
+                    if refcounts[key] == 0:
+                        del refcounts[key]
+                        orphaned.add(key)
+
+            for session_id, info in list(sessions.items()):
+                if session_id not in busy and now - info["last_access"] > self.ttl_s:
+                    remove(session_id)
+                    expired.append(session_id)
+
+            removed_datasets = 0
+
+            def collect():
+                nonlocal freed, removed_datasets
+                for key, info in list(datasets.items()):
+                    if key in refcounts:
+                        continue
+                    if key not in orphaned and now - info["mtime"] < DATASET_GRACE_S:
+                        continue
+                    self.store.drop_dataset(key)
+                    freed += datasets.pop(key)["bytes"]
+                    removed_datasets += 1
+
+            collect()
+            total = sum(s["bytes"] for s in sessions.values()) + sum(d["bytes"] for d in datasets.values())
+            # Evict least recently used sessions until usage fits the quota
+            for session_id in sorted(sessions, key=lambda s: sessions[s]["last_access"]):
+                if total <= self.quota_bytes:
+                    break
+                if session_id in busy:
+                    continue
+                remove(session_id)
+                evicted.append(session_id)
+                collect()
+                total = sum(s["bytes"] for s in sessions.values()) + sum(d["bytes"] for d in datasets.values())
+
+            self._last_sweep = now
+            return {
+                "expired": [session_ref(s) for s in expired],
+                "evicted": [session_ref(s) for s in evicted],
+                "datasets_removed": removed_datasets,
+                "bytes_freed": freed,
+                "total_bytes": total,
+            }
+
+    def _ensure_sweeper(self):
+        if self._sweeper is None or not self._sweeper.is_alive():
+            self._sweeper = threading.Thread(target=self._run, name="datalab-sweeper", daemon=True)
+            self._sweeper.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.sweep_interval_s)
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"Session sweep failed: {e}")
+
+
+session_lifecycle = SessionLifecycleManager()
@@ -0,0 +1,332 @@
+"""
+Content-addressed store for DataLab session datasets.
+
+Every DataLab step (EDA, preview, imputation, comparison, training) works on the
+same one or two datasets per session. Datasets are stored once per content hash
+under ``temp_data/datasets/<key>/`` in the typed columnar format from
+``columnar.py``; a session is just a small manifest pointing at the keys of its
+raw and cleaned versions. Uploading the same file twice, or clicking "Use
+sample" repeatedly, therefore reuses the stored dataset instead of parsing and
+writing it again.
+
+Loaded DataFrames are kept in memory per key, bounded by a global byte budget;
+least recently used datasets are evicted first and are transparently re-opened
+(memory-mapped) on the next access.
+
+Sessions created by earlier versions (``<session>_<version>.csv`` files or
+``<session>_<version>/`` columnar directories) are migrated on first access.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+from .columnar import (
+    ColumnarWriter, write_columnar, read_columnar, read_schema, take_columnar, columnar_exists, iter_columnar_chunks,
+    columnar_nbytes
+)
+
+TEMP_DATA_DIR = "temp_data"
+DEFAULT_MAX_BYTES = int(os.environ.get("DATALAB_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+
+RAW = "raw"
+CLEANED = "cleaned"
+
+_HASH_CHUNK_BYTES = 1024 * 1024
+
+
+def file_digest(path):
+    """Returns the SHA-256 hex digest of a file's contents."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(_HASH_CHUNK_BYTES), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def frame_digest(df):
+    """Returns a SHA-256 hex digest of a DataFrame's column names and values."""
+    h = hashlib.sha256(json.dumps([str(c) for c in df.columns]).encode())
+    h.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return h.hexdigest()
+
+
+def derived_key(parent_key, operation, params):
+    """Key for a dataset derived deterministically from another one (e.g. an imputation)."""
+    payload = json.dumps({"parent": parent_key, "op": operation, "params": params}, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class SessionDatasetStore:
+    def __init__(self, data_dir=TEMP_DATA_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.data_dir = data_dir
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # dataset key -> (df, nbytes)
+        self._manifests = {}  # session_id -> {version: dataset key}
+        self._file_digests = {}  # (path, size, mtime) -> digest
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._lock = threading.Lock()
+
+    # ---- Paths & manifests -------------------------------------------------
+
+    def dataset_path(self, key):
+        return os.path.join(self.data_dir, "datasets", key)
+
+    def manifest_path(self, session_id):
+        return os.path.join(self.data_dir, f"{session_id}_session.json")
+
+    def _manifest(self, session_id):
+        manifest = self._manifests.get(session_id)
+        if manifest is None:
+            path = self.manifest_path(session_id)
+            if not os.path.exists(path):
+                return {}
+            with open(path, "r") as f:
+                manifest = json.load(f)
+            self._manifests[session_id] = manifest
+        return manifest
+
+    def link(self, session_id, version, key):
+        """Points a session version at a stored dataset."""
+        with self._lock:
+            manifest = dict(self._manifest(session_id))
+            manifest[version] = key
+            os.makedirs(self.data_dir, exist_ok=True)
+            tmp_path = self.manifest_path(session_id) + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(manifest, f)
+            os.replace(tmp_path, self.manifest_path(session_id))
+            self._manifests[session_id] = manifest
+
+    def dataset_key(self, session_id, version=RAW):
+        """Returns the content key of a session version, or None if it does not exist."""
+        with self._lock:
+            key = self._manifest(session_id).get(version)
+        if key is None:
+            key = self._migrate_legacy(session_id, version)
+        return key
+
+    def path_for(self, session_id, version=RAW):
+        key = self.dataset_key(session_id, version)
+        if key is None:
+            raise FileNotFoundError(f"{session_id}_{version}")
+        return self.dataset_path(key)
+
+    def exists(self, session_id, version=RAW):
+        return self.dataset_key(session_id, version) is not None
+
+    def latest_version(self, session_id):
+        """Returns the most processed version available: cleaned if imputed, else raw."""
+        for version in (CLEANED, RAW):
+            if self.exists(session_id, version):
+                return version
+        return None
+
+    # ---- Reads --------------------------------------------------------------
+
+    def get(self, session_id, version=RAW, columns=None):
+        """
+        Returns the DataFrame for a session, loading it from disk on a miss.
+        The returned frame is shared between requests and sessions and must not be mutated.
+        When ``columns`` is given and the dataset is not cached, only those
+        columns are mapped and the partial frame is not cached.
+        Raises FileNotFoundError if the dataset does not exist.
+        """
+        key = self.dataset_key(session_id, version)
+        if key is None:
+            raise FileNotFoundError(f"{session_id}_{version}")
+        return self.get_dataset(key, columns)
+
+    def get_dataset(self, key, columns=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._hits += 1
+                if columns is None:
+                    return entry[0]
+                return entry[0][[c for c in columns if c in entry[0].columns]]
+            self._misses += 1
+
+        path = self.dataset_path(key)
+        if not columnar_exists(path):
+            raise FileNotFoundError(path)
+        if columns is not None:
+            return read_columnar(path, columns=columns)
+        df = read_columnar(path)
+        self._insert(key, df)
+        return df
+
+    def columns(self, session_id, version=RAW):
+        """Column names of a session dataset, from its schema (no data is read)."""
+        return [c["name"] for c in read_schema(self.path_for(session_id, version))["columns"]]
+
+    def take(self, session_id, rows, version=RAW):
+        """
+        Returns the given row positions of a session dataset, renumbered from 0.
+        Uses the cached frame if loaded, else reads just those rows from disk
+        without loading (or caching) the whole dataset.
+        """
+        key = self.dataset_key(session_id, version)
+        if key is None:
+            raise FileNotFoundError(f"{session_id}_{version}")
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._hits += 1
+                return entry[0].iloc[rows].reset_index(drop=True)
+        return take_columnar(self.dataset_path(key), rows)
+
+    def iter_chunks(self, session_id, version=RAW, chunk_rows=100_000, columns=None):
+        """Streams a session dataset from disk in row chunks, bypassing the cache."""
+        return iter_columnar_chunks(self.path_for(session_id, version), chunk_rows, columns)
+
+    def nbytes_on_disk(self, session_id, version=RAW):
+        return columnar_nbytes(self.path_for(session_id, version))
+
+    # ---- Writes -------------------------------------------------------------
+
+    def save(self, session_id, version, df, key=None):
+        """
+        Stores a dataset for a session version, replacing any previous one, and caches it.
+        ``key`` defaults to the frame's content hash; if a dataset with that key
+        already exists it is reused as is. The cached frame is the memory-mapped
+        copy, so hits and misses see identical dtypes.
+        """
+        key = key or frame_digest(df)
+        path = self.dataset_path(key)
+        if not columnar_exists(path):
+            try:
+                write_columnar(df, path)
+            except OSError:
+                # A concurrent request stored the same content first
+                if not columnar_exists(path):
+                    raise
+        self.link(session_id, version, key)
+        return self.get_dataset(key)
+
+    def new_writer(self):
+        """A ColumnarWriter staging inside the dataset store, for datasets built chunk by chunk."""
+        return ColumnarWriter(os.path.join(self.data_dir, "datasets"))
+
+    def commit_writer(self, session_id, version, writer, key):
+        """
+        Stores what ``writer`` received under ``key`` and links it to a session version.
+        If a dataset with that key already exists it is reused and the writer discarded.
+        Nothing is loaded into memory; the dataset is mapped on first access.
+        """
+        path = self.dataset_path(key)
+        if columnar_exists(path):
+            writer.abort()
+        else:
+            try:
+                writer.commit(path)
+            except OSError:
+                # A concurrent request stored the same content first
+                if not columnar_exists(path):
+                    raise
+        self.link(session_id, version, key)
+
+    def ingest_csv(self, session_id, version, csv_path, key=None):
+        """
+        Stores a CSV as the given session version, keyed by the file's content hash.
+        Parsing is skipped entirely when identical content was ingested before.
+        """
+        key = key or self.cached_file_digest(csv_path)
+        if self.link_if_stored(session_id, version, key):
+            return self.get_dataset(key)
+        return self.save(session_id, version, pd.read_csv(csv_path), key=key)
+
+    def link_if_stored(self, session_id, version, key):
+        """Points a session version at an already stored dataset; returns False if there is none."""
+        if not columnar_exists(self.dataset_path(key)):
+            return False
+        self.link(session_id, version, key)
+        return True
+
+    def cached_file_digest(self, path):
+        """file_digest memoised on (path, size, mtime) for files that are ingested repeatedly."""
+        stat = os.stat(path)
+        memo_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+        digest = self._file_digests.get(memo_key)
+        if digest is None:
+            digest = file_digest(path)
+            self._file_digests[memo_key] = digest
+        return digest
+
+    def put(self, key, df):
+        """Caches a DataFrame that is already stored on disk under ``key``."""
+        self._insert(key, df)
+
+    def invalidate(self, session_id, version=None):
+        """Drops cached datasets of a session (all versions when version is None)."""
+        with self._lock:
+            manifest = self._manifest(session_id)
+            keys = [k for v, k in manifest.items() if version is None or v == version]
+            for key in keys:
+                entry = self._entries.pop(key, None)
+                if entry is not None:
+                    self._bytes -= entry[1]
+
+    def forget_session(self, session_id):
+        """Drops the in-memory manifest of a session whose files were deleted."""
+        with self._lock:
+            self._manifests.pop(session_id, None)
+
+    def drop_dataset(self, key):
+        """Deletes a stored dataset and its cached frame. Callers ensure nothing references it."""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._bytes -= entry[1]
+        shutil.rmtree(self.dataset_path(key), ignore_errors=True)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self._hits,
+                "misses": self._misses,
+            }
+
+    def _insert(self, key, df):
+        nbytes = int(df.memory_usage(index=True, deep=True).sum())
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[1]
+            # Datasets larger than the whole budget are served but never cached
+            if nbytes > self.max_bytes:
+                return
+            self._entries[key] = (df, nbytes)
+            self._bytes += nbytes
+            while self._bytes > self.max_bytes:
+                _, (_, evicted_bytes) = self._entries.popitem(last=False)
+                self._bytes -= evicted_bytes
+
+    def _migrate_legacy(self, session_id, version):
+        """Moves a pre-manifest session dataset into the content-addressed layout."""
+        legacy_dir = os.path.join(self.data_dir, f"{session_id}_{version}")
+        legacy_csv = legacy_dir + ".csv"
+        if columnar_exists(legacy_dir):
+            self.save(session_id, version, read_columnar(legacy_dir, mmap=False))
+            shutil.rmtree(legacy_dir)
+        elif os.path.exists(legacy_csv):
+            self.ingest_csv(session_id, version, legacy_csv, key=file_digest(legacy_csv))
+            os.remove(legacy_csv)
+        else:
+            return None
+        with self._lock:
+            return self._manifest(session_id).get(version)
+
+
+session_store = SessionDatasetStore()
@@ -0,0 +1,321 @@
+"""
+Shadow scoring of candidate models on live prediction traffic.
+
+Candidates (a DataLab session model or a model file produced by the scripts)
+see a configurable fraction of ``/api/predict`` requests. The request handler
+only samples and enqueues the already-prepared feature row; a background thread
+scores queued rows in batches and records, per candidate, agreement with the
+production decision, score deltas and latency. The queue is bounded and rows
+are dropped rather than ever blocking the primary response.
+
+A candidate that has proven itself can be promoted. Promotion replaces the
+production artifact set as a unit: model, threshold, imputer values and global
+feature importance are all staged first, so a failure leaves production as it
+was, and only then swapped in (previous files are kept as backups). The SHAP
+explainer is rebuilt for the new model and the prediction service reloads.
+
+A candidate's threshold, imputer values and feature importance come from the
+candidate when it has them: its registered threshold and JSON files next to its
+model file (``<model>.imputer_values.json``, ``<model>.feature_importance.json``).
+Otherwise the production threshold and imputer values, which the candidate was
+shadow-scored with, stay in place, and feature importance is recomputed as mean
+absolute SHAP on reference rows so it never describes the replaced model.
+"""
+
+import json
+import os
+import queue
+import random
+import shutil
+import threading
+import time
+from collections import deque
+
+import joblib
+import numpy as np
+import pandas as pd
+
+QUEUE_MAX_ROWS = int(os.environ.get("SHADOW_QUEUE_MAX_ROWS", 10_000))
+BATCH_MAX_ROWS = 256
+# Latencies kept per candidate for percentiles
+LATENCY_WINDOW = 1000
+MIN_SAMPLES_TO_PROMOTE = int(os.environ.get("SHADOW_MIN_SAMPLES_TO_PROMOTE", 100))
+
+# Production artifact files in the model directory
+MODEL_FILE = "water_quality_model.pkl"
+THRESHOLD_FILE = "optimal_threshold.json"
+IMPUTER_FILE = "imputer_values.json"
+IMPORTANCE_FILE = "global_feature_importance.json"
+EXPLAINER_FILE = "shap_explainer.pkl"
+
+_promote_lock = threading.Lock()
+
+
+def _backup_path(path):
+    root, ext = os.path.splitext(path)
+    return f"{root}.previous{ext}"
+
+
+def _shap_importance(model, reference):
+    """Mean absolute positive-class SHAP value per feature on ``reference``, as in global_feature_importance.json."""
+    try:
+        import shap
+        values = shap.TreeExplainer(model)(reference).values
+    except Exception as e:
+        print(f"No SHAP feature importance for the promoted model: {e}")
+        return None
+    if values.ndim == 3:
+        values = values[:, :, 1] if values.shape[2] > 1 else values[:, :, 0]
+    importance = [{"feature": col, "importance": float(v)}
+                  for col, v in zip(reference.columns, np.abs(values).mean(axis=0))]
+    importance.sort(key=lambda x: x["importance"], reverse=True)
+    return importance
+
+
+class CandidateStats:
+    def __init__(self):
+        self.samples = 0
+        self.agreements = 0
+        self.delta_sum = 0.0
+        self.abs_delta_sum = 0.0
+        self.max_abs_delta = 0.0
+        self.errors = 0
+        self.latencies_ms = deque(maxlen=LATENCY_WINDOW)
+        self.primary_latencies_ms = deque(maxlen=LATENCY_WINDOW)
+
+    def record(self, primary_scores, scores, threshold, primary_threshold, latency_ms, primary_latencies_ms):
+        deltas = scores - primary_scores
+        self.samples += len(scores)
+        self.agreements += int(np.sum((scores >= threshold) == (primary_scores >= primary_threshold)))
+        self.delta_sum += float(deltas.sum())
+        self.abs_delta_sum += float(np.abs(deltas).sum())
+        self.max_abs_delta = max(self.max_abs_delta, float(np.abs(deltas).max()))
+        # Batch latency is shared evenly between its rows
+        self.latencies_ms.extend([latency_ms / len(scores)] * len(scores))
+        self.primary_latencies_ms.extend(primary_latencies_ms)
+
+    def to_dict(self):
+        def percentiles(values):
+            if not values:
+                return {"mean": None, "p95": None}
+            arr = np.fromiter(values, dtype=float)
+            return {"mean": round(float(arr.mean()), 4), "p95": round(float(np.percentile(arr, 95)), 4)}
+
+        n = self.samples
+        return {
+            "samples": n,
+            "agreement_rate": self.agreements / n if n else None,
+            "mean_delta": self.delta_sum / n if n else None,
+            "mean_abs_delta": self.abs_delta_sum / n if n else None,
+            "max_abs_delta": self.max_abs_delta,
+            "errors": self.errors,
+            "latency_ms": percentiles(self.latencies_ms),
+            "primary_latency_ms": percentiles(self.primary_latencies_ms),
+        }
+
+
+class Candidate:
+    def __init__(self, name, model, source, fraction, threshold):
+        self.name = name
+        self.model = model
+        self.source = source
+        self.fraction = fraction
+        self.threshold = threshold
+        self.registered_at = time.time()
+        self.stats = CandidateStats()
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "source": self.source,
+            "fraction": self.fraction,
+            "threshold": self.threshold,
+            "registered_at": self.registered_at,
+            **self.stats.to_dict(),
+        }
+
+
+class ShadowScorer:
+    def __init__(self, max_queue_rows=QUEUE_MAX_ROWS):
+        self._candidates = {}
+        self._queue = queue.Queue(maxsize=max_queue_rows)
+        self._lock = threading.Lock()
+        self._worker = None
+        self.dropped = 0
+
+    # ---- Registry -----------------------------------------------------------
+
+    def register(self, name, model_path, fraction=0.1, threshold=None, expected_features=None):
+        """
+        Loads a candidate model and starts shadowing. ``threshold`` defaults to the
+        production threshold at scoring time. Raises ValueError on incompatible models.
+        """
+        model = joblib.load(model_path)
+        if not hasattr(model, "predict_proba"):
+            raise ValueError("Candidate model must implement predict_proba")
+        names = getattr(model, "feature_names_in_", None)
+        if expected_features is not None and names is not None and list(names) != list(expected_features):
+            raise ValueError(f"Candidate features {list(names)} do not match production features")
+        candidate = Candidate(name, model, model_path, float(fraction), threshold)
+        with self._lock:
+            self._candidates[name] = candidate
+        self._ensure_worker()
+        return candidate
+
+    def remove(self, name):
+        with self._lock:
+            return self._candidates.pop(name, None) is not None
+
+    def get(self, name):
+        with self._lock:
+            return self._candidates.get(name)
+
+    def stats(self):
+        with self._lock:
+            candidates = [c.to_dict() for c in self._candidates.values()]
+        return {"candidates": candidates, "queued": self._queue.qsize(), "dropped": self.dropped}
+
+    # ---- Request path -------------------------------------------------------
+
+    def observe(self, features, primary_score, primary_threshold, primary_latency_ms):
+        """
+        Called on the prediction path: samples candidates and enqueues the row. Never blocks.
+        features: the single-row DataFrame the production model scored.
+        """
+        if not self._candidates:
+            return
+        names = [c.name for c in list(self._candidates.values()) if random.random() < c.fraction]
+        if not names:
+            return
+        try:
+            self._queue.put_nowait((names, features, primary_score, primary_threshold, primary_latency_ms))
+        except queue.Full:
+            self.dropped += 1
+
+    # ---- Worker -------------------------------------------------------------
+
+    def _ensure_worker(self):
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._run, name="shadow-scorer", daemon=True)
+            self._worker.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            # Score whatever else is waiting in one call per candidate
+            while len(batch) < BATCH_MAX_ROWS:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._score(batch)
+            except Exception as e:
+                print(f"Shadow scoring failed: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _score(self, batch):
+        by_candidate = {}
+        for i, (names, *_rest) in enumerate(batch):
+            for name in names:
+                by_candidate.setdefault(name, []).append(i)
+
+        for name, rows in by_candidate.items():
+            candidate = self.get(name)
+            if candidate is None:
+                continue
+            X = pd.concat([batch[i][1] for i in rows], ignore_index=True)
+            primary_scores = np.array([batch[i][2] for i in rows])
+            primary_threshold = batch[rows[0]][3]
+            start = time.perf_counter()
+            try:
+                scores = candidate.model.predict_proba(X)[:, 1]
+            except Exception:
+                with self._lock:
+                    candidate.stats.errors += len(rows)
+                continue
+            latency_ms = (time.perf_counter() - start) * 1000
+            threshold = candidate.threshold if candidate.threshold is not None else primary_threshold
+            with self._lock:
+                candidate.stats.record(primary_scores, scores, threshold, primary_threshold,
+                                       latency_ms, [batch[i][4] for i in rows])
+
+    def wait_idle(self, timeout=None):
+        """Blocks until every queued row has been scored (for tests and shutdown)."""
+        deadline = None if timeout is None else time.time() + timeout
+        while self._queue.unfinished_tasks:
+            if deadline is not None and time.time() > deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    # ---- Promotion ----------------------------------------------------------
+
+    def promote(self, name, model_dir, reference=None, min_samples=MIN_SAMPLES_TO_PROMOTE,
+                rebuild_explainer=True):
+        """
+        Makes a candidate the production model: replaces the artifact set in ``model_dir``
+        (see the module docstring), rebuilds the SHAP explainer and stops shadowing it.
+        reference: feature rows for recomputing global importance when the candidate has none.
+        Raises KeyError for unknown candidates and ValueError if it has too few samples.
+        """
+        candidate = self.get(name)
+        if candidate is None:
+            raise KeyError(name)
+        if candidate.stats.samples < min_samples:
+            raise ValueError(f"Candidate has {candidate.stats.samples} shadow samples, needs {min_samples}")
+
+        with _promote_lock:
+            artifacts = self._candidate_artifacts(candidate, reference)
+            staged = {}
+            try:
+                for filename, content in artifacts.items():
+                    path = os.path.join(model_dir, filename)
+                    tmp_path = f"{path}.{os.getpid()}.tmp"
+                    staged[path] = tmp_path
+                    if filename == MODEL_FILE:
+                        joblib.dump(content, tmp_path)
+                    elif content is not None:
+                        with open(tmp_path, "w") as f:
+                            json.dump(content, f, indent=4)
+            except Exception:
+                for tmp_path in staged.values():
+                    if os.path.exists(tmp_path):
+                        os.remove(tmp_path)
+                raise
+
+            # Everything is staged; back up the current set and swap the new one in
+            for path in staged:
+                if os.path.exists(path):
+                    shutil.copy2(path, _backup_path(path))
+            for path, tmp_path in staged.items():
+                if os.path.exists(tmp_path):
+                    os.replace(tmp_path, path)
+                elif os.path.exists(path):
+                    os.remove(path)  # no importance for the new model: better none than a stale one
+            if rebuild_explainer:
+                from .services import rebuild_explainer as write_explainer
+                write_explainer(candidate.model, os.path.join(model_dir, EXPLAINER_FILE))
+        self.remove(name)
+        return candidate
+
+    def _candidate_artifacts(self, candidate, reference):
+        """filename -> content of every production artifact the candidate replaces."""
+        sidecar = os.path.splitext(candidate.source)[0]
+        artifacts = {MODEL_FILE: candidate.model}
+        if candidate.threshold is not None:
+            artifacts[THRESHOLD_FILE] = {"threshold": candidate.threshold}
+        if os.path.exists(f"{sidecar}.imputer_values.json"):
+            with open(f"{sidecar}.imputer_values.json", "r") as f:
+                artifacts[IMPUTER_FILE] = json.load(f)
+        if os.path.exists(f"{sidecar}.feature_importance.json"):
+            with open(f"{sidecar}.feature_importance.json", "r") as f:
+                artifacts[IMPORTANCE_FILE] = json.load(f)
+        else:
+            artifacts[IMPORTANCE_FILE] = _shap_importance(candidate.model, reference) if reference is not None else None
+        return artifacts
+
+
+shadow_scorer = ShadowScorer()
@@ -0,0 +1,182 @@
+"""
+Nearest-neighbour approximation of SHAP explanations.
+
+An exact TreeSHAP explanation for one request costs far more than the
+prediction itself. ``ShapIndex`` stores exact SHAP vectors (positive class)
+for a dense reference set in a KD-tree over standardised features. The
+reference set is the training rows plus jittered synthetic copies, built
+offline by ``src/explainability/build_shap_index.py``. An explanation is the
+inverse-distance-weighted mean of the k nearest reference vectors. The gap
+between its sum and the model's actual output (score minus base value, known
+at request time) is then spread evenly over the features, which restores
+SHAP's additivity and removes about a third of the error.
+
+TreeSHAP explains a model on its own output scale: probabilities for a Random
+Forest, log-odds for gradient boosting. The index stores its base value and
+vectors on that scale (``output``, found by ``infer_output``) and converts the
+probability it is given at request time before correcting, so both kinds of
+model stay additive. Tolerances and errors are on the same scale.
+
+``validate`` compares approximated against exact values on held-out rows. It
+then picks the largest nearest-neighbour distance at which the 95th-percentile
+error stays within ``tolerance``. Requests further than that from every
+reference row fall back to exact computation. The index remembers the hash of
+the model it was built for, so a retrained or promoted model disables it
+rather than serving stale explanations.
+"""
+
+import hashlib
+import os
+import time
+
+import joblib
+import numpy as np
+from sklearn.neighbors import KDTree
+
+DEFAULT_K = 8
+DEFAULT_TOLERANCE = 0.02
+# Keeps an exact match (distance 0) from dividing by zero
+_EPS = 1e-9
+
+PROBABILITY, LOG_ODDS = "probability", "log_odds"
+# Largest gap between base value + sum of SHAP values and the model output accepted as additive
+ADDITIVITY_ATOL = 1e-4
+
+
+def to_output(probabilities, output):
+    """Positive-class probabilities on the given SHAP output scale."""
+    p = np.asarray(probabilities, dtype=np.float64)
+    if output == LOG_ODDS:
+        p = np.clip(p, 1e-15, 1 - 1e-15)
+        return np.log(p / (1 - p))
+    return p
+
+
+def infer_output(base_value, shap_values, probabilities, atol=ADDITIVITY_ATOL):
+    """
+    The scale (PROBABILITY or LOG_ODDS) on which base value + summed SHAP values
+    reproduce the model's positive-class probabilities. Raises ValueError if neither does.
+    """
+    totals = float(base_value) + np.asarray(shap_values, dtype=np.float64).sum(axis=1)
+    for output in (PROBABILITY, LOG_ODDS):
+        if np.allclose(totals, to_output(probabilities, output), rtol=0, atol=atol):
+            return output
+    raise ValueError("SHAP values do not add up to the model output as probabilities or log-odds")
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ShapIndex:
+    # Indexes saved before the output scale was recorded were built for probability-scale forests
+    output = PROBABILITY
+
+    def __init__(self, X_reference, shap_reference, base_value, feature_names, model_hash, k=DEFAULT_K,
+                 output=PROBABILITY):
+        X_reference = np.asarray(X_reference, dtype=np.float64)
+        self.mean = X_reference.mean(axis=0)
+        self.scale = X_reference.std(axis=0)
+        self.scale[self.scale == 0] = 1.0
+        self.tree = KDTree((X_reference - self.mean) / self.scale)
+        self.shap_reference = np.asarray(shap_reference, dtype=np.float64)
+        self.base_value = float(base_value)
+        self.output = output
+        self.feature_names = list(feature_names)
+        self.model_hash = model_hash
+        self.k = min(k, len(X_reference))
+        # Until validated, never approximate
+        self.max_distance = 0.0
+        self.report = {}
+
+    def approximate(self, X, scores=None):
+        """
+        (values (rows, features), nearest-neighbour distance per row). With the model's
+        positive-class probabilities as ``scores`` the values are corrected to sum to
+        the score on the index's output scale minus the base value.
+        """
+        Z = (np.asarray(X, dtype=np.float64) - self.mean) / self.scale
+        distances, neighbours = self.tree.query(Z, k=self.k)
+        weights = 1.0 / (distances + _EPS)
+        weights /= weights.sum(axis=1, keepdims=True)
+        values = np.einsum('rk,rkf->rf', weights, self.shap_reference[neighbours])
+        if scores is not None:
+            residual = to_output(scores, self.output) - self.base_value - values.sum(axis=1)
+            values += residual[:, None] / values.shape[1]
+        return values, distances[:, 0]
+
+    def validate(self, X_val, shap_val, scores, tolerance=DEFAULT_TOLERANCE):
+        """
+        Measures the approximation against exact SHAP on held-out rows, sets the distance
+        cutoff for ``tolerance`` (max absolute error per row, 95th percentile) and returns the report.
+        ``scores`` are the model's positive-class probabilities for those rows. Raises
+        ValueError if the exact values are not additive to them on the index's output
+        scale, i.e. the base value or scale does not match the model.
+        """
+        exact = np.asarray(shap_val, dtype=np.float64)
+        additivity_error = np.abs(self.base_value + exact.sum(axis=1) - to_output(scores, self.output)).max()
+        if additivity_error > ADDITIVITY_ATOL:
+            raise ValueError(f"Exact SHAP values miss the {self.output} model output by up to "
+                             f"{additivity_error:.3g}; wrong base value or output scale")
+        start = time.perf_counter()
+        approx, distance = self.approximate(X_val, scores)
+        query_ms = (time.perf_counter() - start) * 1000 / len(distance)
+        error = np.abs(approx - exact).max(axis=1)
+        scale = np.abs(exact).sum(axis=1)
+
+        # Largest cutoff whose served rows (distance <= cutoff) keep p95 error within tolerance
+        order = np.argsort(distance)
+        sorted_error = error[order]
+        self.max_distance = 0.0
+        served = 0
+        for n in range(1, len(order) + 1):
+            if np.percentile(sorted_error[:n], 95) <= tolerance:
+                self.max_distance, served = float(distance[order[n - 1]]), n
+
+        self.report = {
+            "validation_rows": int(len(error)),
+            "reference_rows": int(len(self.shap_reference)),
+            "k": self.k,
+            "tolerance": tolerance,
+            "output": self.output,
+            "additivity_max_error": float(additivity_error),
+            "max_distance": self.max_distance,
+            "coverage": served / len(error),
+            "mean_abs_error": float(np.abs(approx - exact).mean()),
+            "p95_row_max_error": float(np.percentile(error, 95)),
+            "max_row_max_error": float(error.max()),
+            "mean_relative_error": float(np.mean(np.abs(approx - exact).sum(axis=1) / np.maximum(scale, _EPS))),
+            "served_p95_row_max_error": float(np.percentile(sorted_error[:served], 95)) if served else None,
+            "query_ms_per_row": round(query_ms, 4),
+        }
+        return self.report
+
+    def explain(self, X_row, score):
+        """
+        Contributions for a single row given its positive-class probability, or None when
+        it is too far from the reference set.
+        """
+        values, distance = self.approximate(X_row, [score])
+        if distance[0] > self.max_distance:
+            return None
+        return values[0]
+
+    def save(self, path):
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        joblib.dump(self, tmp_path)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def load(path, model_path):
+        """The saved index, or None if it is missing or was built for another model."""
+        if not os.path.exists(path) or not os.path.exists(model_path):
+            return None
+        index = joblib.load(path)
+        if index.model_hash != file_hash(model_path):
+            print("SHAP index was built for a different model; using exact explanations")
+            return None
+        return index
@@ -0,0 +1,174 @@
+"""
+Memory-mapped tensor store for the spatio-temporal dataset (``water_dataset.mat``).
+
+The .mat file keeps features as an object array holding one (locations x
+features) matrix per date, and pH as a (locations x dates) matrix, split into
+train and test periods. Rebuilding flat arrays from that on every use is slow
+and copies everything.
+
+``SpatioTemporalStore.open`` converts the file once, keyed by its content
+hash, into contiguous .npy tensors:
+
+- ``features`` (dates x locations x features)
+- ``ph`` (dates x locations)
+
+The train dates come first, followed by the test dates. After that the tensors
+are opened with ``mmap_mode='r'``, so every process shares the OS page cache
+and nothing is parsed again. The accessors return views, never copies.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+
+import numpy as np
+
+MAT_PATH = os.path.join(os.path.dirname(__file__), '../../Data/water_dataset.mat')
+CACHE_DIR = os.environ.get(
+    "SPATIOTEMPORAL_CACHE_DIR",
+    os.path.join(os.path.dirname(__file__), '../../Data/.cache/spatiotemporal')
+)
+FORMAT_VERSION = 1
+
+
+def _file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _mat_strings(cells):
+    return [str(np.ravel(c)[0]) for c in np.ravel(cells)]
+
+
+def convert_mat(mat_path, out_dir):
+    """Writes the tensors and meta.json for ``mat_path`` into ``out_dir`` (atomically)."""
+    import scipy.io  # only needed for the one-off conversion
+
+    mat = scipy.io.loadmat(mat_path)
+    X_tr, X_te = mat['X_tr'][0], mat['X_te'][0]
+    n_train, n_dates = len(X_tr), len(X_tr) + len(X_te)
+    n_locations, n_features = X_tr[0].shape
+
+    tmp_dir = f"{out_dir}.{os.getpid()}.tmp"
+    os.makedirs(tmp_dir, exist_ok=True)
+    features = np.lib.format.open_memmap(
+        os.path.join(tmp_dir, 'features.npy'), mode='w+', dtype=np.float64,
+        shape=(n_dates, n_locations, n_features)
+    )
+    # One block copy per period straight into the file, no intermediate lists
+    features[:n_train] = np.stack(X_tr)
+    features[n_train:] = np.stack(X_te)
+    features.flush()
+    del features
+
+    # pH is stored locations x dates in the .mat; transpose to dates x locations
+    ph = np.ascontiguousarray(np.concatenate([mat['Y_tr'], mat['Y_te']], axis=1).T)
+    np.save(os.path.join(tmp_dir, 'ph.npy'), ph)
+
+    meta = {
+        "version": FORMAT_VERSION,
+        "n_train_dates": n_train,
+        "location_ids": [int(i) for i in np.ravel(mat['location_ids'])],
+        # 1-based location indices per group, as in the .mat
+        "location_groups": [[int(i) for i in np.ravel(g)] for g in np.ravel(mat['location_group'])],
+        "feature_names": _mat_strings(mat['features']),
+    }
+    with open(os.path.join(tmp_dir, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+
+    if os.path.exists(out_dir):
+        shutil.rmtree(out_dir)
+    os.replace(tmp_dir, out_dir)
+
+
+class SpatioTemporalStore:
+    def __init__(self, directory):
+        with open(os.path.join(directory, 'meta.json')) as f:
+            meta = json.load(f)
+        self.directory = directory
+        self.features = np.load(os.path.join(directory, 'features.npy'), mmap_mode='r')
+        self.ph = np.load(os.path.join(directory, 'ph.npy'), mmap_mode='r')
+        self.n_train_dates = meta["n_train_dates"]
+        self.location_ids = meta["location_ids"]
+        self.location_groups = meta["location_groups"]
+        self.feature_names = meta["feature_names"]
+        self._location_index = {loc: i for i, loc in enumerate(self.location_ids)}
+
+    @classmethod
+    def open(cls, mat_path=MAT_PATH, cache_dir=CACHE_DIR):
+        """Opens the store for ``mat_path``, converting it first if this content was never seen."""
+        directory = os.path.join(cache_dir, _file_hash(mat_path))
+        meta_path = os.path.join(directory, 'meta.json')
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                if json.load(f).get("version") != FORMAT_VERSION:
+                    shutil.rmtree(directory)
+        if not os.path.exists(directory):
+            os.makedirs(cache_dir, exist_ok=True)
+            convert_mat(mat_path, directory)
+        return cls(directory)
+
+    @property
+    def shape(self):
+        """(dates, locations, features)"""
+        return self.features.shape
+
+    def location_index(self, location_id):
+        """Position of a site (USGS location id) on the location axis; KeyError if unknown."""
+        return self._location_index[location_id]
+
+    def _locations(self, locations):
+        if locations is None:
+            return slice(None)
+        if isinstance(locations, (int, np.integer, slice)):
+            return locations
+        raise TypeError("locations must be an index or a slice (fancy indexing would copy)")
+
+    def window(self, start=0, stop=None, locations=None):
+        """
+        Zero-copy (features, ph) views for dates [start, stop) and a location index or slice.
+        With a single location index the location axis is dropped.
+        """
+        loc = self._locations(locations)
+        return self.features[start:stop, loc], self.ph[start:stop, loc]
+
+    def train(self, locations=None):
+        return self.window(0, self.n_train_dates, locations)
+
+    def test(self, locations=None):
+        return self.window(self.n_train_dates, None, locations)
+
+    def flat(self, start=0, stop=None):
+        """
+        (date*location, features) and (date*location,) views, one row per location-date
+        pair, date-major. This matches the notebook's concatenated layout without copying.
+        """
+        features, ph = self.window(start, stop)
+        return features.reshape(-1, features.shape[-1]), ph.reshape(-1)
+
+    def sliding_windows(self, length, start=0, stop=None):
+        """
+        Views of every ``length``-date window of the range, shaped
+        (windows, locations, features, length) and (windows, locations, length).
+        """
+        features, ph = self.window(start, stop)
+        return (np.lib.stride_tricks.sliding_window_view(features, length, axis=0),
+                np.lib.stride_tricks.sliding_window_view(ph, length, axis=0))
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """Process-wide store, opened (and converted if needed) on first use."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = SpatioTemporalStore.open()
+        return _store
@@ -0,0 +1,92 @@
+"""
+Full-resolution decision threshold analysis for binary classifiers.
+
+Precision, recall, F1 and the confusion counts are computed for every distinct
+predicted probability in a single sort plus cumulative sums, i.e. O(n log n)
+instead of one pass over the data per candidate threshold. A sample is predicted
+positive when its score is >= the threshold, matching ``(y_prob >= t)``.
+
+Shared by DataLab training and the offline training scripts.
+"""
+
+import numpy as np
+
+DEFAULT_MIN_RECALL = 0.90
+
+
+class ThresholdAnalysis:
+    """
+    Confusion counts and metrics at every distinct score of ``y_score``.
+    Arrays are ordered by decreasing threshold; metrics with a zero
+    denominator are 0, like sklearn's ``zero_division=0``.
+    """
+
+    def __init__(self, y_true, y_score, pos_label=1):
+        y_true = np.asarray(y_true) == pos_label
+        y_score = np.asarray(y_score, dtype=float)
+
+        order = np.argsort(-y_score, kind="mergesort")
+        self._sorted_scores = y_score[order]
+        # _cum_tp[k]: positives among the k highest scores
+        self._cum_tp = np.concatenate([[0], np.cumsum(y_true[order])])
+        self.positives = int(self._cum_tp[-1])
+        self.negatives = len(y_score) - self.positives
+
+        # Last position of each run of equal scores
+        last = np.concatenate([np.flatnonzero(np.diff(self._sorted_scores)), [len(y_score) - 1]])
+        self.thresholds = self._sorted_scores[last] if len(y_score) else np.array([])
+        counts = self._counts(last + 1)
+        self.tp, self.fp, self.fn, self.tn = counts
+        self.precision, self.recall, self.f1 = self._metrics(*counts)
+
+    def _counts(self, n_predicted_positive):
+        tp = self._cum_tp[n_predicted_positive]
+        fp = n_predicted_positive - tp
+        return tp, fp, self.positives - tp, self.negatives - fp
+
+    @staticmethod
+    def _metrics(tp, fp, fn, tn):
+        with np.errstate(divide="ignore", invalid="ignore"):
+            precision = np.where(tp + fp > 0, tp / (tp + fp), 0.0)
+            recall = np.where(tp + fn > 0, tp / (tp + fn), 0.0)
+            f1 = np.where(2 * tp + fp + fn > 0, 2 * tp / (2 * tp + fp + fn), 0.0)
+        return precision, recall, f1
+
+    def at(self, thresholds):
+        """
+        Metrics at arbitrary thresholds (e.g. a coarse grid for plotting).
+        Returns a list of dicts with threshold, precision, recall, f1 and the confusion counts.
+        """
+        thresholds = np.asarray(thresholds, dtype=float)
+        # Number of scores >= t, found by binary search on the sorted scores
+        n_pos = np.searchsorted(-self._sorted_scores, -thresholds, side="right")
+        tp, fp, fn, tn = self._counts(n_pos)
+        precision, recall, f1 = self._metrics(tp, fp, fn, tn)
+        return [
+            {
+                "threshold": float(thresholds[i]),
+                "precision": float(precision[i]),
+                "recall": float(recall[i]),
+                "f1": float(f1[i]),
+                "tp": int(tp[i]), "fp": int(fp[i]), "fn": int(fn[i]), "tn": int(tn[i]),
+            }
+            for i in range(len(thresholds))
+        ]
+
+    def optimal_threshold(self, min_recall=DEFAULT_MIN_RECALL):
+        """
+        Returns the threshold with the best F1 among those reaching ``min_recall``
+        (the lowest such threshold on ties), as a metrics dict, or None if no
+        threshold reaches it.
+        """
+        valid = np.flatnonzero(self.recall >= min_recall)
+        if len(valid) == 0:
+            return None
+        # Arrays run from high to low thresholds; take the last maximum
+        best = valid[len(valid) - 1 - np.argmax(self.f1[valid][::-1])]
+        return {
+            "threshold": float(self.thresholds[best]),
+            "precision": float(self.precision[best]),
+            "recall": float(self.recall[best]),
+            "f1": float(self.f1[best]),
+        }
@@ -0,0 +1,477 @@
+"""
+DataLab model training.
+
+Kept free of FastAPI so the same code runs inside a request, in the threadpool,
+or in a background job process (see ``jobs.py``).
+"""
+
+import json
+import os
+import pickle
+import time
+from contextlib import nullcontext
+from datetime import datetime
+
+import numpy as np
+from joblib import Parallel, delayed
+from sklearn.model_selection import train_test_split, StratifiedKFold
+from sklearn.ensemble import RandomForestClassifier, GradientBoostingClassifier, HistGradientBoostingClassifier
+from sklearn.inspection import permutation_importance
+from sklearn.linear_model import LogisticRegression
+from sklearn.metrics import (
+    accuracy_score, f1_score, confusion_matrix,
+    precision_score, recall_score, roc_auc_score, roc_curve
+)
+from threadpoolctl import threadpool_limits
+
+from .session_store import session_store, TEMP_DATA_DIR
+from .threshold_analysis import ThresholdAnalysis
+
+RANDOM_STATE = 42
+TEST_SIZE = 0.2
+# Random Forest trees are grown in this many warm-started batches to report progress
+PROGRESS_BATCHES = 10
+# Points on the threshold tuning chart
+THRESHOLD_CURVE_POINTS = 21
+# Models without built-in importances are scored by permutation on at most this many test rows
+PERMUTATION_IMPORTANCE_ROWS = 2000
+
+HIST_GRADIENT_BOOSTING = "Histogram Gradient Boosting"
+# Model types that handle missing values themselves and are trained on unimputed data
+NATIVE_NAN_MODELS = {HIST_GRADIENT_BOOSTING}
+
+
+def _no_progress(fraction, stage, **details):
+    pass
+
+
+def load_training_data(session_id, impute=True):
+    """
+    Returns (X, y, target_col) for the most processed version of a session dataset.
+    impute: fill remaining missing values with column means (off for NATIVE_NAN_MODELS).
+    """
+    version = session_store.latest_version(session_id)
+    if version is None:
+        raise FileNotFoundError(f"Dataset not found for session {session_id}")
+    df = session_store.get(session_id, version)
+    # Handle simple target assumption
+    target_col = 'Potability' if 'Potability' in df.columns else df.columns[-1]
+
+    X = df.drop(columns=[target_col])
+    y = df[target_col]
+
+    # Simple imputation for safety
+    if impute:
+        X = fill_missing(X)
+    return X, y, target_col
+
+
+def fill_missing(X, means=None):
+    if X.isnull().sum().sum() > 0:
+        X = X.fillna(X.mean() if means is None else means)
+    return X
+
+
+def split_data(X, y):
+    return train_test_split(X, y, test_size=TEST_SIZE, random_state=RANDOM_STATE)
+
+
+def build_model(model_type, params, n_jobs=None):
+    """
+    Creates an unfitted estimator from a DataLab model type and its parameters.
+    n_jobs: threads for estimators that can train in parallel (Random Forest).
+    """
+    if model_type == "Gradient Boosting":
+        # Safe defaults if params missing
+        n_estimators = int(params.get("n_estimators", 100))
+        learning_rate = float(params.get("learning_rate", 0.1))
+        return GradientBoostingClassifier(n_estimators=n_estimators, learning_rate=learning_rate, random_state=RANDOM_STATE)
+
+    if model_type == HIST_GRADIENT_BOOSTING:
+        # Multi-threaded, bins features and routes missing values natively;
+        # stops once the score on an internal validation split stops improving
+        max_iter = int(params.get("max_iter", 200))
+        learning_rate = float(params.get("learning_rate", 0.1))
+        return HistGradientBoostingClassifier(
+            max_iter=max_iter, learning_rate=learning_rate,
+            early_stopping=True, validation_fraction=0.1, n_iter_no_change=10,
+            random_state=RANDOM_STATE
+        )
+
+    if model_type == "Logistic Regression":
+        C = float(params.get("C", 1.0))
+        return LogisticRegression(C=C, max_iter=1000, random_state=RANDOM_STATE)
+
+    # Default Random Forest
+    n_estimators = int(params.get("n_estimators", 100))
+    max_depth = params.get("max_depth", None)
+    if max_depth == "None": max_depth = None
+    else: max_depth = int(max_depth) if max_depth else None
+
+    return RandomForestClassifier(n_estimators=n_estimators, max_depth=max_depth, random_state=RANDOM_STATE, n_jobs=n_jobs)
+
+
+def fit_model(model, X_train, y_train, progress=_no_progress):
+    """
+    Fits a model, reporting progress in [0, 1] where the estimator allows it.
+    Random Forests are grown in warm-started batches (sklearn seeds each tree
+    identically either way) and Gradient Boosting reports through its monitor hook.
+    """
+    if isinstance(model, RandomForestClassifier):
+        total = model.n_estimators
+        step = max(1, total // PROGRESS_BATCHES)
+        model.set_params(warm_start=True)
+        for n in range(min(step, total), total + step, step):
+            model.set_params(n_estimators=min(n, total))
+            model.fit(X_train, y_train)
+            progress(min(n, total) / total, "fitting")
+        model.set_params(warm_start=False)
+        return model
+
+    if isinstance(model, GradientBoostingClassifier):
+        total = model.n_estimators
+
+        def monitor(i, estimator, local_vars):
+            if (i + 1) % max(1, total // PROGRESS_BATCHES) == 0:
+                progress((i + 1) / total, "fitting")
+            return False
+
+        return model.fit(X_train, y_train, monitor=monitor)
+
+    if isinstance(model, HistGradientBoostingClassifier):
+        total = model.max_iter
+        step = max(1, total // PROGRESS_BATCHES)
+        model.set_params(warm_start=True)
+        for n in range(min(step, total), total + step, step):
+            model.set_params(max_iter=min(n, total))
+            model.fit(X_train, y_train)
+            progress(min(n, total) / total, "fitting")
+            if model.n_iter_ < min(n, total):
+                break  # stopped early
+        progress(1.0, "fitting")
+        model.set_params(warm_start=False, max_iter=total)
+        return model
+
+    model.fit(X_train, y_train)
+    progress(1.0, "fitting")
+    return model
+
+
+def _scalar_metrics(y_test, y_pred, y_prob, binary):
+    auc_score = 0
+    if binary:
+        try:
+            auc_score = roc_auc_score(y_test, y_prob)
+        except ValueError:
+            pass
+    return {
+        "accuracy": float(accuracy_score(y_test, y_pred)),
+        "f1_score": float(f1_score(y_test, y_pred, average='weighted')),
+        "precision": float(precision_score(y_test, y_pred, average='weighted', zero_division=0)),
+        "recall": float(recall_score(y_test, y_pred, average='weighted', zero_division=0)),
+        "auc_score": float(auc_score),
+    }
+
+
+def evaluate_model(model, feature_names, y, X_test, y_test):
+    """Computes the DataLab metrics, curves and feature importance for a fitted model."""
+    y_pred = model.predict(X_test)
+    y_prob = model.predict_proba(X_test)[:, 1]
+
+    metrics = _scalar_metrics(y_test, y_pred, y_prob, len(np.unique(y)) == 2)
+    cm = confusion_matrix(y_test, y_pred).tolist()
+
+    # ROC Calculation
+    roc_data = []
+    try:
+        if len(np.unique(y)) == 2:
+            fpr, tpr, _ = roc_curve(y_test, y_prob)
+            indices = np.linspace(0, len(fpr)-1, 20, dtype=int)
+            for i in indices:
+                roc_data.append({"fpr": float(fpr[i]), "tpr": float(tpr[i])})
+    except:
+        pass
+
+    # Feature Importance (Switch for LR)
+    feature_importance = []
+    if hasattr(model, 'feature_importances_'):
+        importances = model.feature_importances_
+        feature_importance = [{"feature": col, "importance": float(imp)} for col, imp in zip(feature_names, importances)]
+    elif hasattr(model, 'coef_'):
+        importances = np.abs(model.coef_[0])
+        feature_importance = [{"feature": col, "importance": float(imp)} for col, imp in zip(feature_names, importances)]
+    else:
+        X_perm, y_perm = X_test, y_test
+        if len(X_test) > PERMUTATION_IMPORTANCE_ROWS:
+            X_perm = X_test.sample(PERMUTATION_IMPORTANCE_ROWS, random_state=RANDOM_STATE)
+            y_perm = y_test.loc[X_perm.index]
+        importances = permutation_importance(model, X_perm, y_perm, n_repeats=5, random_state=RANDOM_STATE).importances_mean
+        feature_importance = [{"feature": col, "importance": float(max(imp, 0.0))} for col, imp in zip(feature_names, importances)]
+
+    feature_importance.sort(key=lambda x: x['importance'], reverse=True)
+    feature_importance = feature_importance[:10]
+
+    # 3. Threshold Tuning Data
+    threshold_curves = []
+    optimal_threshold = None
+    try:
+        if len(np.unique(y)) == 2:
+            analysis = ThresholdAnalysis(y_test, y_prob)
+            for point in analysis.at(np.linspace(0, 1, THRESHOLD_CURVE_POINTS)):
+                threshold_curves.append({
+                    "threshold": round(point["threshold"], 2),
+                    "precision": point["precision"],
+                    "recall": point["recall"],
+                    "f1": point["f1"]
+                })
+            optimal_threshold = analysis.optimal_threshold()
+    except:
+        pass
+
+    return {
+        **metrics,
+        "roc_curve": roc_data,
+        "confusion_matrix": cm,
+        "feature_importance": feature_importance,
+        "threshold_curves": threshold_curves,
+        "optimal_threshold": optimal_threshold,
+    }
+
+
+def model_path_for(session_id):
+    return os.path.join(TEMP_DATA_DIR, f"{session_id}_model.pkl")
+
+
+def save_session_model(session_id, model):
+    model_path = model_path_for(session_id)
+    tmp_path = f"{model_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump(model, f)
+    os.replace(tmp_path, model_path)
+    return model_path
+
+
+def append_history(session_id, model_type, params, metrics):
+    """Appends a run to the session's experiment history and returns the full history."""
+    history_path = os.path.join(TEMP_DATA_DIR, f"{session_id}_history.json")
+    run_record = {
+        "timestamp": datetime.now().isoformat(),
+        "model_type": model_type,
+        "params": params,
+        "metrics": {
+            "accuracy": metrics["accuracy"],
+            "f1": metrics["f1_score"],
+            "auc": metrics["auc_score"]
+        }
+    }
+
+    history = []
+    if os.path.exists(history_path):
+        with open(history_path, 'r') as hf:
+            history = json.load(hf)
+    history.append(run_record)
+    with open(history_path, 'w') as hf:
+        json.dump(history, hf)
+    return history
+
+
+def thread_limit(n_jobs):
+    """Caps OpenMP threads (used by Histogram Gradient Boosting) to n_jobs when positive."""
+    if n_jobs and n_jobs > 0:
+        return threadpool_limits(limits=n_jobs, user_api="openmp")
+    return nullcontext()
+
+
+def train_session_model(session_id, model_type, params, n_jobs=None, cv_folds=0, progress=_no_progress):
+    """
+    Trains, evaluates and saves a model for a session; returns the /train response.
+    cv_folds: when >= 2, also cross-validates the configuration (see cross_validate_session).
+    progress: callable(fraction, stage) receiving overall progress in [0, 1].
+    """
+    progress(0.0, "loading data")
+    X, y, target_col = load_training_data(session_id, impute=model_type not in NATIVE_NAN_MODELS)
+    X_train, X_test, y_train, y_test = split_data(X, y)
+
+    cross_validation = None
+    fit_start = 0.05
+    if cv_folds and cv_folds >= 2:
+        progress(0.05, "cross-validating")
+        cross_validation = cross_validate_session(session_id, model_type, params, cv_folds, n_jobs, X=X, y=y)
+        fit_start = 0.45
+
+    model = build_model(model_type, params, n_jobs=n_jobs)
+    # Fitting dominates, so it gets most of the progress range
+    with thread_limit(n_jobs):
+        fit_model(model, X_train, y_train, lambda f, stage: progress(fit_start + (0.9 - fit_start) * f, stage))
+
+    progress(0.9, "evaluating")
+    metrics = evaluate_model(model, X.columns, y, X_test, y_test)
+
+    progress(0.95, "saving")
+    model_path = save_session_model(session_id, model)
+    history = append_history(session_id, model_type, params, metrics)
+    progress(1.0, "done")
+
+    result = {
+        **metrics,
+        "target": target_col,
+        "model_path": model_path,
+        "history": history
+    }
+    if cross_validation is not None:
+        result["cross_validation"] = cross_validation
+    return result
+
+
+def fold_assignments(y, folds):
+    """Stratified k-fold assignment: the test fold id of every row."""
+    skf = StratifiedKFold(n_splits=folds, shuffle=True, random_state=RANDOM_STATE)
+    fold_of = np.empty(len(y), dtype=np.int16)
+    for fold, (_, test_idx) in enumerate(skf.split(np.zeros(len(y)), y)):
+        fold_of[test_idx] = fold
+    return fold_of
+
+
+def session_folds(session_id, y, folds):
+    """
+    Fold assignment for a session's dataset, computed once per dataset and fold count.
+    It is stored inside the content-addressed dataset directory, so training jobs in
+    separate worker processes share it, and it is deleted with the dataset.
+    """
+    version = session_store.latest_version(session_id)
+    path = os.path.join(session_store.path_for(session_id, version), f"folds_{folds}_{RANDOM_STATE}.npy")
+    if os.path.exists(path):
+        return np.load(path, mmap_mode="r")
+    fold_of = fold_assignments(y, folds)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.save(f, fold_of)
+    os.replace(tmp_path, path)
+    return fold_of
+
+
+def _fit_fold(model_type, params, n_jobs, X, y, fold_of, fold, binary):
+    train, test = fold_of != fold, fold_of == fold
+    model = build_model(model_type, params, n_jobs=n_jobs)
+    with thread_limit(n_jobs):
+        model.fit(X[train], y[train])
+    return _scalar_metrics(y[test], model.predict(X[test]), model.predict_proba(X[test])[:, 1], binary), os.getpid()
+
+
+def cross_validate_session(session_id, model_type, params, folds=5, n_jobs=None, X=None, y=None):
+    """
+    Stratified k-fold evaluation of one configuration; returns mean and std per metric.
+    Folds train in parallel processes that share one read-only (memory-mapped) copy
+    of the data, with the core budget n_jobs (default: all cores) split between them.
+    """
+    if X is None:
+        X, y, _ = load_training_data(session_id, impute=model_type not in NATIVE_NAN_MODELS)
+    fold_of = session_folds(session_id, y, folds)
+
+    budget = n_jobs if n_jobs and n_jobs > 0 else (os.cpu_count() or 1)
+    n_parallel = max(1, min(folds, budget))
+    threads_per_fold = max(1, budget // n_parallel)
+    binary = len(np.unique(y)) == 2
+
+    start = time.perf_counter()
+    # Plain arrays so joblib memory-maps them into the workers instead of pickling a copy each
+    X_values, y_values = X.to_numpy(), y.to_numpy()
+    outputs = Parallel(n_jobs=n_parallel, backend="loky")(
+        delayed(_fit_fold)(model_type, params, threads_per_fold, X_values, y_values, fold_of, fold, binary)
+        for fold in range(folds)
+    )
+    wall_seconds = time.perf_counter() - start
+    fold_metrics = [metrics for metrics, _ in outputs]
+
+    summary = {}
+    for name in fold_metrics[0]:
+        values = np.array([m[name] for m in fold_metrics])
+        summary[name] = {"mean": float(values.mean()), "std": float(values.std(ddof=1))}
+    return {
+        "folds": folds,
+        "metrics": summary,
+        "fold_metrics": fold_metrics,
+        "wall_seconds": round(wall_seconds, 3),
+        # 0 means every fold ran inline in this process
+        "worker_processes": len({pid for _, pid in outputs} - {os.getpid()}),
+    }
+
+
+def _fit_and_evaluate(model_type, params, n_jobs, X_train, y_train, X_test, y_test, y, means):
+    if model_type not in NATIVE_NAN_MODELS:
+        X_train, X_test = fill_missing(X_train, means), fill_missing(X_test, means)
+    start = time.perf_counter()
+    model = build_model(model_type, params, n_jobs=n_jobs)
+    with thread_limit(n_jobs):
+        model.fit(X_train, y_train)
+    fit_seconds = time.perf_counter() - start
+    return model, evaluate_model(model, X_train.columns, y, X_test, y_test), fit_seconds, os.getpid()
+
+
+def compare_session_models(session_id, configs, n_jobs=None, rank_by="auc_score"):
+    """
+    Trains several configurations on one shared split, in parallel processes.
+    configs: list of {"model_type": ..., "params": {...}}.
+    n_jobs: total core budget (default: all cores). Candidates run side by side
+    and any cores left over are given to the models that can use threads.
+    The best model is saved as the session model; every run is added to history.
+    """
+    # Imputed per candidate, since some models take the missing values as they are
+    X, y, target_col = load_training_data(session_id, impute=False)
+    X_train, X_test, y_train, y_test = split_data(X, y)
+    means = X.mean()
+
+    budget = n_jobs if n_jobs and n_jobs > 0 else (os.cpu_count() or 1)
+    n_parallel = max(1, min(len(configs), budget))
+    threads_per_model = max(1, budget // n_parallel)
+
+    start = time.perf_counter()
+    # Large arrays are memory-mapped into the workers instead of copied per candidate
+    outputs = Parallel(n_jobs=n_parallel, backend="loky")(
+        delayed(_fit_and_evaluate)(c["model_type"], c.get("params", {}), threads_per_model,
+                                   X_train, y_train, X_test, y_test, y, means)
+        for c in configs
+    )
+    wall_seconds = time.perf_counter() - start
+
+    results = []
+    for config, (model, metrics, fit_seconds, _) in zip(configs, outputs):
+        results.append({
+            "model_type": config["model_type"],
+            "params": config.get("params", {}),
+            "fit_seconds": round(fit_seconds, 3),
+            **metrics,
+        })
+
+    order = sorted(range(len(results)), key=lambda i: results[i][rank_by], reverse=True)
+    ranking = []
+    for rank, i in enumerate(order, start=1):
+        r = results[i]
+        ranking.append({
+            "rank": rank,
+            "model_type": r["model_type"],
+            "params": r["params"],
+            "accuracy": r["accuracy"],
+            "f1_score": r["f1_score"],
+            "precision": r["precision"],
+            "recall": r["recall"],
+            "auc_score": r["auc_score"],
+            "fit_seconds": r["fit_seconds"],
+        })
+
+    model_path = save_session_model(session_id, outputs[order[0]][0])
+    history = None
+    for r in results:
+        history = append_history(session_id, r["model_type"], r["params"], r)
+
+    return {
+        "ranking": ranking,
+        "results": results,
+        "rank_by": rank_by,
+        "target": target_col,
+        "best_model_path": model_path,
+        "n_jobs": budget,
+        "wall_seconds": round(wall_seconds, 3),
+        "worker_processes": len({pid for *_, pid in outputs} - {os.getpid()}),
+        "history": history,
+    }
@@ -0,0 +1,259 @@
+"""
+Incremental parsing of (optionally compressed) CSV uploads.
+
+``CSVUploadStream`` is fed the upload chunk by chunk as it arrives from the
+socket. Each chunk is decompressed on the fly (gzip always, zstd when the
+``zstandard`` package is installed) and hashed, and complete records are
+parsed in batches of ``PARSE_BATCH_BYTES`` and appended straight to a
+``ColumnarWriter``. Parsing therefore overlaps with the transfer, the upload is
+never written to disk as CSV, and memory use does not grow with the file. The
+header and first records are validated immediately, so malformed files are
+rejected before the rest is received, and a maximum decompressed size protects
+against compression bombs.
+
+``MultipartFileReader`` pulls the file field out of a ``multipart/form-data``
+body as it streams in, so the upload endpoint can read the request itself
+instead of waiting for the framework to spool the whole file.
+"""
+
+import hashlib
+import zlib
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:  # python-multipart < 0.0.13
+    from multipart.multipart import MultipartParser, parse_options_header
+
+try:
+    import zstandard
+except ImportError:  # optional dependency
+    zstandard = None
+
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+ALLOWED_SUFFIXES = (".csv", ".csv.gz", ".csv.zst")
+# Complete records are parsed and stored in batches of about this many bytes
+PARSE_BATCH_BYTES = 8 * 1024 * 1024
+
+
+class UploadRejected(ValueError):
+    """The upload is not an acceptable CSV; ``status_code`` is the HTTP status to return."""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class RecordSplitter:
+    """
+    Buffers CSV text and hands out the longest prefix that ends a record, i.e. ends
+    in a newline outside any quoted field. Whether the scan is inside quotes is
+    carried between calls, so every byte is scanned once however many blocks a
+    long quoted field spans.
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._in_quotes = False
+
+    def feed(self, data):
+        """Adds data; returns the complete records now available (possibly b"")."""
+        scanned = len(self._buffer)
+        self._buffer += data
+        new = np.frombuffer(data, dtype=np.uint8)
+        if not len(new):
+            return b""
+        # An odd number of quotes so far means the position is inside a quoted field
+        inside = (np.cumsum(new == ord('"')) + self._in_quotes) % 2
+        self._in_quotes = bool(inside[-1])
+        ends = np.flatnonzero((new == ord("\n")) & (inside == 0))
+        if not len(ends):
+            return b""
+        end = scanned + int(ends[-1]) + 1
+        complete = bytes(self._buffer[:end])
+        del self._buffer[:end]
+        return complete
+
+    def rest(self):
+        """Everything after the last complete record."""
+        rest, self._buffer = bytes(self._buffer), bytearray()
+        return rest
+
+
+class CSVUploadStream:
+    def __init__(self, filename, max_bytes, writer, batch_bytes=PARSE_BATCH_BYTES):
+        self.filename = filename
+        self.max_bytes = max_bytes
+        self.writer = writer
+        self.batch_bytes = batch_bytes
+        self.compression = None
+        self.bytes_received = 0
+        self.bytes_decompressed = 0
+        self.rows = 0
+        self.columns = None
+        self._digest = hashlib.sha256()
+        self._decompressor = None
+        self._header = None
+        self._splitter = RecordSplitter()
+        self._pending = bytearray()  # complete records not parsed yet
+
+    def _open_decompressor(self, first):
+        if first.startswith(GZIP_MAGIC):
+            self.compression = "gzip"
+            # wbits 16+MAX_WBITS: expect a gzip header
+            return zlib.decompressobj(16 + zlib.MAX_WBITS)
+        if first.startswith(ZSTD_MAGIC):
+            if zstandard is None:
+                raise UploadRejected("zstd-compressed uploads need the 'zstandard' package on the server", 415)
+            self.compression = "zstd"
+            return zstandard.ZstdDecompressor().decompressobj()
+        if self.filename.endswith((".gz", ".zst")):
+            raise UploadRejected("File extension says compressed, but the content is not gzip or zstd")
+        return None
+
+    def feed(self, block):
+        """Consumes one raw upload chunk."""
+        if self.bytes_received == 0:
+            self._decompressor = self._open_decompressor(block)
+        self.bytes_received += len(block)
+        data = self._decompressor.decompress(block) if self._decompressor else block
+        self._consume(data)
+
+    def _consume(self, data):
+        if not data:
+            return
+        self.bytes_decompressed += len(data)
+        if self.bytes_decompressed > self.max_bytes:
+            raise UploadRejected(f"Upload exceeds the {self.max_bytes // (1024 * 1024)} MB limit", 413)
+        self._digest.update(data)
+
+        complete = self._splitter.feed(data)
+        if self._header is None:
+            if not complete:
+                return  # header line not complete yet
+            self._header, _, complete = complete.partition(b"\n")
+            self._header += b"\n"
+            self._validate_header()
+        self._pending += complete
+        # The first records are parsed at once so bad files fail early; later ones in batches
+        if self._pending and (self.rows == 0 or len(self._pending) >= self.batch_bytes):
+            self._flush()
+
+    def _flush(self):
+        lines, self._pending = bytes(self._pending), bytearray()
+        self._parse(lines)
+
+    def _validate_header(self):
+        try:
+            columns = pd.read_csv(BytesIO(self._header), nrows=0).columns
+        except Exception as e:
+            raise UploadRejected(f"Invalid CSV header: {e}")
+        names = [str(c).strip() for c in columns]
+        if len(names) < 2:
+            raise UploadRejected("CSV must have at least two columns (features and a target)")
+        if any(not n or n.startswith("Unnamed:") for n in names):
+            raise UploadRejected("CSV header has empty column names")
+        self.columns = list(columns)
+
+    def _parse(self, lines):
+        try:
+            frame = pd.read_csv(BytesIO(self._header + lines))
+        except Exception as e:
+            raise UploadRejected(f"Invalid CSV near row {self.rows + 1}: {e}")
+        if list(frame.columns) != self.columns:
+            raise UploadRejected(f"Rows after row {self.rows} do not match the header")
+        self.writer.append(frame)
+        self.rows += len(frame)
+
+    def finish(self):
+        """Flushes the decompressor and the last partial line; returns the content digest."""
+        if self._decompressor is not None:
+            tail = self._decompressor.flush()
+            if self.compression == "gzip" and not self._decompressor.eof:
+                raise UploadRejected("Truncated gzip stream")
+            self._consume(tail)
+        rest = self._splitter.rest()
+        if rest.strip():
+            if self._header is None:
+                self._header = rest + b"\n"
+                self._validate_header()
+            else:
+                self._pending += rest + b"\n"
+        if self._pending:
+            self._flush()
+        if self._header is None:
+            raise UploadRejected("Empty file")
+        if self.rows == 0:
+            raise UploadRejected("CSV has a header but no rows")
+        return self._digest.hexdigest()
+
+    def dtypes(self):
+        kinds = self.writer.kinds()
+        return {str(c): kinds.get(str(c), "float") for c in self.columns}
+
+
+class MultipartFileReader:
+    """
+    Incremental ``multipart/form-data`` parser that returns the bytes of one file
+    field as they arrive. ``filename`` is set once that part's headers are read.
+    """
+
+    def __init__(self, content_type, field="file"):
+        _, params = parse_options_header(content_type)
+        boundary = params.get(b"boundary")
+        if not boundary:
+            raise UploadRejected("Missing multipart boundary")
+        self.field = field
+        self.filename = None
+        self._blocks = []
+        self._in_file = False
+        self._header_field = b""
+        self._header_value = b""
+        self._headers = {}
+        self._parser = MultipartParser(boundary, callbacks={
+            "on_part_begin": self._on_part_begin,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+            "on_part_data": self._on_part_data,
+        })
+
+    def feed(self, chunk):
+        """Parses one chunk of the request body; returns the file bytes it contained."""
+        try:
+            self._parser.write(chunk)
+        except Exception as e:
+            raise UploadRejected(f"Malformed multipart body: {e}")
+        blocks, self._blocks = self._blocks, []
+        return blocks
+
+    def _on_part_begin(self):
+        self._in_file = False
+        self._headers = {}
+
+    def _on_header_field(self, data, start, end):
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data, start, end):
+        self._header_value += data[start:end]
+
+    def _on_header_end(self):
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field, self._header_value = b"", b""
+
+    def _on_headers_finished(self):
+        _, params = parse_options_header(self._headers.get(b"content-disposition", b""))
+        name = params.get(b"name", b"").decode("utf-8", "replace")
+        filename = params.get(b"filename")
+        if name == self.field and filename is not None and self.filename is None:
+            self.filename = filename.decode("utf-8", "replace")
+            self._in_file = True
+
+    def _on_part_data(self, data, start, end):
+        if self._in_file:
+            self._blocks.append(bytes(data[start:end]))
@@ -64,6 +64,7 @@ const TrainingStep = ({ sessionId }) => {
                             >
                                 <option value="Random Forest">Random Forest (Robust)</option>
                                 <option value="Gradient Boosting">Gradient Boosting (High Performance)</option>
+                                <option value="Histogram Gradient Boosting">Histogram Gradient Boosting (Large Datasets)</option>
                                 <option value="Logistic Regression">Logistic Regression (Interpretable)</option>
                             </select>
                         </div>
@@ -122,6 +123,30 @@ const TrainingStep = ({ sessionId }) => {
                                 </div>
                             )}
 
+                            {config.model_type === 'Histogram Gradient Boosting' && (
+                                <div style={{ display: 'grid', gap: '15px' }}>
+                                    <div>
+                                        <label style={{ fontSize: '0.85rem', display: 'block', marginBottom: '5px' }}>Max Iterations (early stopping)</label>
+                                        <input
+                                            type="number"
+                                            value={config.params.max_iter || 200}
+                                            onChange={(e) => setConfig({ ...config, params: { ...config.params, max_iter: e.target.value } })}
+                                            style={{ width: '100%', padding: '8px', borderRadius: '6px', background: '#1e293b', border: '1px solid #334155', color: 'white' }}
+                                        />
+                                    </div>
+                                    <div>
+                                        <label style={{ fontSize: '0.85rem', display: 'block', marginBottom: '5px' }}>Learning Rate</label>
+                                        <input
+                                            type="number"
+                                            step="0.01"
+                                            value={config.params.learning_rate || 0.1}
+                                            onChange={(e) => setConfig({ ...config, params: { ...config.params, learning_rate: e.target.value } })}
+                                            style={{ width: '100%', padding: '8px', borderRadius: '6px', background: '#1e293b', border: '1px solid #334155', color: 'white' }}
+                                        />
+                                    </div>
+                                </div>
+                            )}
+
                             {config.model_type === 'Logistic Regression' && (
                                 <div>
                                     <label style={{ fontSize: '0.85rem', display: 'block', marginBottom: '5px' }}>Regularization (C)</label>
@@ -28,7 +28,7 @@ const UploadStep = ({ onSessionCreated }) => {
 
     const handleUpload = async (file) => {
         if (!file) return;
-        if (!file.name.endsWith('.csv')) {
+        if (!['.csv', '.csv.gz', '.csv.zst'].some((ext) => file.name.endsWith(ext))) {
             setError('Please upload a CSV file.');
             return;
         }
@@ -185,7 +185,7 @@ const UploadStep = ({ onSessionCreated }) => {
                 <input
                     id="file-upload"
                     type="file"
-                    accept=".csv"
+                    accept=".csv,.gz,.zst"
                     style={{ display: 'none' }}
                     onChange={(e) => handleUpload(e.target.files[0])}
                 />
@@ -210,7 +210,7 @@ const UploadStep = ({ onSessionCreated }) => {
                                 Click to upload or drag and drop
                             </p>
                             <p style={{ fontSize: '0.9rem', color: 'var(--text-muted)' }}>
-                                CSV files only (max 50MB)
+                                CSV files, optionally gzip or zstd compressed
                             </p>
                         </div>
                     </div>
@@ -0,0 +1,78 @@
+"""
+Benchmarks JSON encoding of DataLab EDA responses for increasingly wide datasets.
+
+For each width it builds a synthetic dataset, computes its EDA result once and
+times these encodings:
+
+    fastapi_default   jsonable_encoder + JSONResponse (the old path)
+    rows              serialization.dumps, record lists as before
+    columnar          serialization.dumps of the format=columnar layout
+
+It reports payload size and median encode time per request. Whether orjson was
+used is printed, because ``dumps`` falls back to stdlib json without it.
+
+    python scripts/benchmark_serialization.py
+    python scripts/benchmark_serialization.py --columns 50 200 500 --rows 2000 --repeat 5
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from backend.app.eda_engine import compute_eda
+from backend.app.serialization import dumps, to_columnar, orjson, COLUMNAR
+
+
+def wide_frame(columns, rows, seed=0):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame(rng.normal(size=(rows, columns)), columns=[f"feature_{i}" for i in range(columns)])
+    df["Potability"] = rng.integers(0, 2, rows)
+    return df
+
+
+def median_ms(encode, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        body = encode()
+        timings.append((time.perf_counter() - start) * 1000)
+    return body, statistics.median(timings)
+
+
+def benchmark(widths, rows, repeat):
+    encoders = {
+        "fastapi_default": lambda result: JSONResponse(jsonable_encoder(result)).body,
+        "rows": dumps,
+        "columnar": lambda result: dumps({**to_columnar(result), "format": COLUMNAR}),
+    }
+    report = []
+    for columns in widths:
+        result = compute_eda(wide_frame(columns, rows))
+        for name, encode in encoders.items():
+            body, ms = median_ms(lambda: encode(result), repeat)
+            report.append({"columns": columns, "encoding": name, "bytes": len(body), "encode_ms": round(ms, 2)})
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark EDA response size and encode time.")
+    parser.add_argument('--columns', type=int, nargs='+', default=[20, 100, 300], help="Dataset widths")
+    parser.add_argument('--rows', type=int, default=1000, help="Rows per dataset")
+    parser.add_argument('--repeat', type=int, default=7, help="Timed encodes per case (median reported)")
+    args = parser.parse_args()
+
+    print(f"Encoder: {'orjson ' + orjson.__version__ if orjson is not None else 'stdlib json (orjson not installed)'}")
+    print(f"{'columns':>8} {'encoding':>16} {'bytes':>12} {'encode ms':>10} {'vs default':>11}")
+    baseline = {}
+    for row in benchmark(args.columns, args.rows, args.repeat):
+        base = baseline.setdefault(row["columns"], row)
+        print(f"{row['columns']:>8} {row['encoding']:>16} {row['bytes']:>12,} {row['encode_ms']:>10.2f} "
+              f"{base['encode_ms'] / max(row['encode_ms'], 1e-9):>10.1f}x")
@@ -0,0 +1,106 @@
+"""
+Builds every serving artifact with one command, rebuilding only what changed.
+
+    python scripts/build_artifacts.py                 # all stages that are out of date
+    python scripts/build_artifacts.py plot_bar        # one target and what it needs
+    python scripts/build_artifacts.py --model hgb     # a param change reruns train and downstream
+    python scripts/build_artifacts.py --dry-run       # show what would run
+
+Stages, their tracked inputs and the code they run:
+
+    train         CSV -> model, imputer values, threshold
+                  (train_model.py, prepare.py, threshold_analysis.py)
+    shap          model, CSV, imputer values -> importance JSON, explainer
+                  (generate_shap.py, shap_cache.py, prepare.py)
+    plot_*        model, CSV, imputer values, importance JSON -> one PNG each, in parallel
+                  (generate_shap.py, shap_cache.py, prepare.py)
+
+The entry points in this file are thin wrappers, so a stage reruns when the
+modules doing the work change, not when this file does.
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from src.pipeline.dag import Pipeline, Stage
+
+DATA_PATH = 'Data/water_potability.csv'
+MODEL_DIR = 'backend/app/model'
+MODEL_PATH = os.path.join(MODEL_DIR, 'water_quality_model.pkl')
+IMPUTER_PATH = os.path.join(MODEL_DIR, 'imputer_values.json')
+THRESHOLD_PATH = os.path.join(MODEL_DIR, 'optimal_threshold.json')
+IMPORTANCE_PATH = os.path.join(MODEL_DIR, 'global_feature_importance.json')
+EXPLAINER_PATH = os.path.join(MODEL_DIR, 'shap_explainer.pkl')
+SHAP_DIR = 'Visualisations/shap'
+
+TRAIN_CODE = ['scripts/train_model.py', 'src/data/prepare.py', 'backend/app/threshold_analysis.py']
+SHAP_CODE = ['src/explainability/generate_shap.py', 'src/explainability/shap_cache.py', 'src/data/prepare.py']
+
+PLOTS = [
+    ('summary', {}, 'shap_summary_plot.png'),
+    ('bar', {}, 'shap_bar_plot.png'),
+    ('dependence', {'feature': 'ph'}, 'shap_dependence_ph.png'),
+    ('dependence', {'feature': 'Sulfate'}, 'shap_dependence_Sulfate.png'),
+    ('waterfall', {'sample_idx': 0}, 'shap_waterfall_sample_0.png'),
+    ('waterfall', {'sample_idx': 100}, 'shap_waterfall_sample_100.png'),
+]
+
+
+def train(model_name):
+    from scripts.train_model import train_and_save
+    train_and_save(model_name)
+
+
+def shap_artifacts():
+    from src.explainability.generate_shap import build_api_artifacts
+    build_api_artifacts()
+
+
+def shap_plot(kind, **options):
+    from src.explainability.generate_shap import build_plot
+    build_plot(kind, **options)
+
+
+def build_pipeline(model_name='rf'):
+    stages = [
+        Stage('train', train,
+              inputs=[DATA_PATH],
+              outputs=[MODEL_PATH, IMPUTER_PATH, THRESHOLD_PATH],
+              params={'model_name': model_name},
+              code=TRAIN_CODE),
+        Stage('shap', shap_artifacts,
+              inputs=[MODEL_PATH, DATA_PATH, IMPUTER_PATH],
+              outputs=[IMPORTANCE_PATH, EXPLAINER_PATH],
+              code=SHAP_CODE),
+    ]
+    for kind, options, filename in PLOTS:
+        # shap_bar_plot.png -> plot_bar, shap_dependence_ph.png -> plot_dependence_ph
+        name = 'plot_' + os.path.splitext(filename)[0][len('shap_'):].removesuffix('_plot')
+        stages.append(Stage(name, shap_plot,
+                            inputs=[MODEL_PATH, DATA_PATH, IMPUTER_PATH, IMPORTANCE_PATH],
+                            outputs=[os.path.join(SHAP_DIR, filename)],
+                            params={'kind': kind, **options},
+                            code=SHAP_CODE))
+    return Pipeline(stages)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Incrementally rebuild model, SHAP and plot artifacts.")
+    parser.add_argument('targets', nargs='*', help="Stages to bring up to date (default: all)")
+    parser.add_argument('--model', choices=['rf', 'hgb'], default='rf', help="Model trained by the train stage")
+    parser.add_argument('--jobs', type=int, default=None, help="Parallel worker processes (1 = run in-process)")
+    parser.add_argument('--force', action='store_true', help="Rerun stages even if up to date")
+    parser.add_argument('--dry-run', action='store_true', help="Only report which stages would run")
+    parser.add_argument('--list', action='store_true', help="List stages and their upstreams")
+    args = parser.parse_args()
+
+    pipeline = build_pipeline(args.model)
+    if args.list:
+        for name, stage in pipeline.stages.items():
+            upstream = ', '.join(sorted(pipeline.upstream[name])) or '-'
+            print(f"{name:28s} <- {upstream}")
+        sys.exit(0)
+    status = pipeline.run(args.targets, force=args.force, jobs=args.jobs, dry_run=args.dry_run)
+    sys.exit(1 if any(s in ('failed', 'blocked') for s in status.values()) else 0)
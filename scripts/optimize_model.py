@@ -1,32 +1,62 @@
 """
 Optuna Hyperparameter Optimization Script
+
+Resumable and safe to run with several worker processes:
+- The study is persisted in SQLite; rerunning continues it until --trials
+  finished (complete or pruned) trials exist.
+- Running trials send a heartbeat to the storage. A trial whose worker died
+  (crash, OOM kill) stops beating, is marked failed after a grace period by
+  the next worker to start a trial, and is re-queued with the same params, so
+  it is neither left RUNNING forever nor silently dropped.
+- --workers processes pull trials from the shared study. The --cores budget is
+  split explicitly: each worker's Random Forest gets cores // workers threads
+  and cross-validation folds run sequentially inside a trial, so nothing is
+  oversubscribed.
+- A median pruner stops trials whose fold-wise running F1 falls below the
+  median of earlier trials at the same fold.
+- A throughput report (trials per hour) is printed and saved.
 """
 
+import argparse
+import multiprocessing
 import os
+import sys
 import json
+import time
 import optuna
 import mlflow
-import pandas as pd
 import numpy as np
-import joblib
+from optuna.storages import RetryFailedTrialCallback
+from optuna.study import MaxTrialsCallback
+from optuna.trial import TrialState
 from sklearn.ensemble import RandomForestClassifier
-from sklearn.model_selection import StratifiedKFold, cross_val_score
-from sklearn.metrics import f1_score, make_scorer
+from sklearn.model_selection import StratifiedKFold
+from sklearn.metrics import f1_score
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from src.data.prepare import prepare_data
 
 # Paths
 DATA_PATH = 'Data/water_potability.csv'
 MODEL_DIR = 'backend/app/model'
 BEST_PARAMS_PATH = os.path.join(MODEL_DIR, 'best_params.json')
+REPORT_PATH = os.path.join(MODEL_DIR, 'optimization_report.json')
+STUDY_DIR = 'studies'
+DEFAULT_STORAGE = f"sqlite:///{STUDY_DIR}/optuna.db"
+STUDY_NAME = "RF_Optimization"
+N_FOLDS = 5
+RANDOM_STATE = 42
+# A running trial without a heartbeat for GRACE_PERIOD_S is considered dead
+HEARTBEAT_INTERVAL_S = 60
+GRACE_PERIOD_S = 180
+MAX_TRIAL_RETRIES = 3
 
 def load_data():
-    df = pd.read_csv(DATA_PATH)
-    # Impute missing values
-    df.fillna(df.median(), inplace=True)
-    X = df.drop('Potability', axis=1)
-    y = df['Potability']
-    return X, y
-
-def objective(trial, X, y):
+    # Imputed with the persisted medians; every worker reads the same binary cache
+    data = prepare_data(path=DATA_PATH, random_state=RANDOM_STATE)
+    return data.X, data.y
+
+def objective(trial, X, y, n_jobs):
     # Hyperparameter search space
     params = {
         'n_estimators': trial.suggest_int('n_estimators', 100, 500),
@@ -36,60 +66,143 @@ def objective(trial, X, y):
         'max_features': trial.suggest_categorical('max_features', ['sqrt', 'log2', None]),
         'bootstrap': trial.suggest_categorical('bootstrap', [True, False])
     }
-    
-    # Model
+
+    # Model: the worker's share of the cores goes to tree building
     model = RandomForestClassifier(
         **params,
-        random_state=42,
+        random_state=RANDOM_STATE,
         class_weight='balanced',
-        n_jobs=-1
+        n_jobs=n_jobs
     )
-    
-    # robust evaluation with cross-validation
-    cv = StratifiedKFold(n_splits=5, shuffle=True, random_state=42)
-    scores = cross_val_score(model, X, y, cv=cv, scoring='f1', n_jobs=-1)
-    
-    return scores.mean()
-
-def run_optimization():
-    mlflow.set_experiment("Water_Quality_Optuna_Optimization")
-    
+
+    # robust evaluation with cross-validation, one fold at a time so the pruner can stop early
+    cv = StratifiedKFold(n_splits=N_FOLDS, shuffle=True, random_state=RANDOM_STATE)
+    scores = []
+    for fold, (train_idx, test_idx) in enumerate(cv.split(X, y)):
+        model.fit(X.iloc[train_idx], y.iloc[train_idx])
+        scores.append(f1_score(y.iloc[test_idx], model.predict(X.iloc[test_idx])))
+        trial.report(float(np.mean(scores)), fold)
+        if trial.should_prune():
+            raise optuna.TrialPruned()
+
+    return float(np.mean(scores))
+
+def open_study(storage_url):
+    if storage_url.startswith("sqlite:///"):
+        os.makedirs(os.path.dirname(storage_url[len("sqlite:///"):]) or ".", exist_ok=True)
+    # Several processes write to the same SQLite file; wait for locks instead of failing
+    storage = optuna.storages.RDBStorage(
+        storage_url,
+        engine_kwargs={"connect_args": {"timeout": 60}},
+        heartbeat_interval=HEARTBEAT_INTERVAL_S,
+        grace_period=GRACE_PERIOD_S,
+        failed_trial_callback=RetryFailedTrialCallback(max_retry=MAX_TRIAL_RETRIES),
+    )
+    return optuna.create_study(
+        direction='maximize',
+        study_name=STUDY_NAME,
+        storage=storage,
+        load_if_exists=True,
+        sampler=optuna.samplers.TPESampler(),
+        pruner=optuna.pruners.MedianPruner(n_startup_trials=5, n_warmup_steps=1)
+    )
+
+def run_worker(storage_url, total_trials, n_jobs):
+    """Worker process: pulls trials from the shared study until it has total_trials finished trials."""
+    optuna.logging.set_verbosity(optuna.logging.WARNING)
+    study = open_study(storage_url)
     X, y = load_data()
-    
-    study = optuna.create_study(direction='maximize', study_name="RF_Optimization")
-    
-    print("Starting optimization (20 trials)...")
-    study.optimize(lambda trial: objective(trial, X, y), n_trials=20)
-    
+    study.optimize(
+        lambda trial: objective(trial, X, y, n_jobs),
+        callbacks=[MaxTrialsCallback(total_trials, states=(TrialState.COMPLETE, TrialState.PRUNED))],
+        # Checked again by the callback; this only bounds a single worker
+        n_trials=total_trials
+    )
+
+def throughput_report(study, started_at, finished_before):
+    trials = study.get_trials(deepcopy=False)
+    finished = [t for t in trials if t.state in (TrialState.COMPLETE, TrialState.PRUNED)]
+    elapsed_h = (time.time() - started_at) / 3600
+    new = len(finished) - finished_before
+    report = {
+        "trials_total": len(finished),
+        "trials_this_run": new,
+        "complete": sum(1 for t in finished if t.state == TrialState.COMPLETE),
+        "pruned": sum(1 for t in finished if t.state == TrialState.PRUNED),
+        "elapsed_seconds": round(elapsed_h * 3600, 1),
+        "trials_per_hour": round(new / elapsed_h, 1) if elapsed_h > 0 else None,
+    }
+    durations = [t.duration.total_seconds() for t in finished if t.duration is not None]
+    if durations:
+        report["mean_trial_seconds"] = round(float(np.mean(durations)), 2)
+    return report
+
+def run_optimization(n_trials=20, workers=None, cores=None, storage_url=DEFAULT_STORAGE):
+    cores = cores or os.cpu_count() or 1
+    workers = max(1, min(workers or cores, cores))
+    n_jobs = max(1, cores // workers)
+
+    study = open_study(storage_url)
+    finished_before = len(study.get_trials(deepcopy=False, states=(TrialState.COMPLETE, TrialState.PRUNED)))
+    print(f"Study '{STUDY_NAME}' in {storage_url}: {finished_before}/{n_trials} trials finished")
+    print(f"Running {workers} worker(s) x {n_jobs} thread(s) on {cores} core(s)...")
+
+    started_at = time.time()
+    if finished_before < n_trials:
+        # spawn: workers start clean and open their own database connections
+        ctx = multiprocessing.get_context("spawn")
+        processes = [ctx.Process(target=run_worker, args=(storage_url, n_trials, n_jobs)) for _ in range(workers)]
+        for p in processes:
+            p.start()
+        for p in processes:
+            p.join()
+
+    report = throughput_report(study, started_at, finished_before)
+    print(f"\nThroughput: {report['trials_this_run']} trials in {report['elapsed_seconds']}s "
+          f"({report['trials_per_hour']} trials/hour), {report['pruned']} pruned overall")
+
     print("\nBest trial:")
     trial = study.best_trial
     print(f"  Value: {trial.value}")
     print("  Params: ")
     for key, value in trial.params.items():
         print(f"    {key}: {value}")
-        
+
+    X, y = load_data()
+    mlflow.set_experiment("Water_Quality_Optuna_Optimization")
+
     # Log best run to MLflow
     with mlflow.start_run(run_name="Optuna_Best_Model"):
         mlflow.log_params(trial.params)
         mlflow.log_metric("best_cv_f1", trial.value)
-        
+        mlflow.log_metric("trials_per_hour", report["trials_per_hour"] or 0)
+
         # Train final model with best params
         best_model = RandomForestClassifier(
             **trial.params,
-            random_state=42,
-            class_weight='balanced'
+            random_state=RANDOM_STATE,
+            class_weight='balanced',
+            n_jobs=cores
         )
         best_model.fit(X, y)
-        
+
         # Save best model
         mlflow.sklearn.log_model(best_model, "best_model")
-        
+
         # Save params locally
         os.makedirs(MODEL_DIR, exist_ok=True)
         with open(BEST_PARAMS_PATH, 'w') as f:
             json.dump(trial.params, f, indent=4)
-            
+        with open(REPORT_PATH, 'w') as f:
+            json.dump(report, f, indent=4)
+
         print(f"Saved best params to {BEST_PARAMS_PATH}")
 
 if __name__ == "__main__":
-    run_optimization()
+    parser = argparse.ArgumentParser(description="Resumable Random Forest hyperparameter optimization.")
+    parser.add_argument('--trials', type=int, default=20, help="Total finished trials the study should reach")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: one per core)")
+    parser.add_argument('--cores', type=int, default=None, help="Total core budget (default: all cores)")
+    parser.add_argument('--storage', default=DEFAULT_STORAGE, help="Optuna storage URL")
+    args = parser.parse_args()
+    run_optimization(args.trials, args.workers, args.cores, args.storage)
@@ -1,78 +1,74 @@
-import pandas as pd
-import numpy as np
+import argparse
 import joblib
 import json
 import os
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.metrics import recall_score, f1_score
-from sklearn.model_selection import train_test_split
+import sys
+from sklearn.ensemble import RandomForestClassifier, HistGradientBoostingClassifier
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from backend.app.threshold_analysis import ThresholdAnalysis
+from backend.app.feedback import FeedbackStore, refresh_model
+from src.data.prepare import prepare_data
 
 # Config
 DATA_PATH = 'Data/water_potability.csv'
 MODEL_DIR = 'backend/app/model'
 RANDOM_STATE = 42
 
-def train_and_save():
+def build_model(model_name):
+    if model_name == 'hgb':
+        # Histogram-binned boosting: multi-threaded, handles NaN natively, stops early on a validation split
+        return HistGradientBoostingClassifier(
+            max_iter=500,
+            learning_rate=0.05,
+            early_stopping=True,
+            validation_fraction=0.1,
+            n_iter_no_change=20,
+            class_weight='balanced',
+            random_state=RANDOM_STATE
+        )
+    return RandomForestClassifier(
+        n_estimators=300,
+        max_depth=12,
+        random_state=RANDOM_STATE,
+        class_weight='balanced',
+        n_jobs=-1
+    )
+
+def train_and_save(model_name='rf'):
     print("Loading data...")
     if not os.path.exists(DATA_PATH):
         print(f"Error: {DATA_PATH} not found.")
         return
 
-    df = pd.read_csv(DATA_PATH)
+    # Imputation (Median, fitted here); the values are saved for the API either way
+    if model_name != 'hgb':
+        print("Performing imputation...")
+    data = prepare_data(impute=model_name != 'hgb', fit_imputer=True, path=DATA_PATH, random_state=RANDOM_STATE)
+    imputer_values = data.imputer_values
     
-    # Imputation (Median)
-    print("Performing imputation...")
-    imputer_values = df.median().to_dict()
-    df.fillna(imputer_values, inplace=True)
+    # 80-20 Split (cached indices, shared with the other scripts)
+    X_train, X_test, y_train, y_test = data.split()
     
-    # Split
-    X = df.drop('Potability', axis=1)
-    y = df['Potability']
-    
-    # 80-20 Split
-    X_train, X_test, y_train, y_test = train_test_split(
-        X, y, test_size=0.2, random_state=RANDOM_STATE, stratify=y
-    )
-    
-    # Train Random Forest (Balanced)
-    print("Training Random Forest...")
-    rf_model = RandomForestClassifier(
-        n_estimators=300,
-        max_depth=12,
-        random_state=RANDOM_STATE,
-        class_weight='balanced',
-        n_jobs=-1
-    )
-    rf_model.fit(X_train, y_train)
+    # Train (Balanced)
+    print(f"Training {'Histogram Gradient Boosting' if model_name == 'hgb' else 'Random Forest'}...")
+    model = build_model(model_name)
+    model.fit(X_train, y_train)
+    if model_name == 'hgb':
+        print(f"Early stopping after {model.n_iter_} iterations")
     
     # Threshold Optimization for 90% Recall
     print("Optimizing threshold for >90% recall...")
-    y_probs = rf_model.predict_proba(X_test)[:, 1]
+    y_probs = model.predict_proba(X_test)[:, 1]
     
-    thresholds = np.arange(0.0, 1.01, 0.01)
     best_thresh = 0.5
-    found_target = False
-    
-    # We want the threshold that gives >= 0.90 recall with the best possible F1 (or precision)
-    # Alternatively, just pick the highest threshold that maintains >= 0.90 recall (to maximize precision)
     
-    valid_thresholds = []
+    # Every distinct probability is a candidate; pick the best F1 among those with >= 90% recall
+    best = ThresholdAnalysis(y_test, y_probs).optimal_threshold(min_recall=0.90)
     
-    for t in thresholds:
-        y_pred_t = (y_probs >= t).astype(int)
-        rec = recall_score(y_test, y_pred_t, zero_division=0)
-        
-        if rec >= 0.90:
-            f1 = f1_score(y_test, y_pred_t, zero_division=0)
-            valid_thresholds.append((t, rec, f1))
-    
-    if valid_thresholds:
-        # Pick the one with highest F1 among those with >= 90% recall
-        # Or simply the one with highest threshold to maximize precision
-        valid_thresholds.sort(key=lambda x: x[2], reverse=True) # Sort by F1 desc
-        best_t_data = valid_thresholds[0]
-        best_thresh = best_t_data[0]
-        print(f"Found threshold {best_thresh:.2f} with Recall: {best_t_data[1]:.4f} and F1: {best_t_data[2]:.4f}")
+    if best:
+        best_thresh = best['threshold']
+        print(f"Found threshold {best_thresh:.4f} with Recall: {best['recall']:.4f} and F1: {best['f1']:.4f}")
     else:
         print("Warning: Could not achieve 90% recall. Using default optimization.")
         # Fallback logic if needed, but for now lets rely on the resume claim being reproducible
@@ -81,7 +77,7 @@ def train_and_save():
     if not os.path.exists(MODEL_DIR):
         os.makedirs(MODEL_DIR)
         
-    joblib.dump(rf_model, os.path.join(MODEL_DIR, 'water_quality_model.pkl'))
+    joblib.dump(model, os.path.join(MODEL_DIR, 'water_quality_model.pkl'))
     
     with open(os.path.join(MODEL_DIR, 'imputer_values.json'), 'w') as f:
         json.dump(imputer_values, f)
@@ -92,4 +88,13 @@ def train_and_save():
     print(f"Artifacts saved to {MODEL_DIR}")
 
 if __name__ == "__main__":
-    train_and_save()
+    parser = argparse.ArgumentParser(description="Train the water potability model.")
+    parser.add_argument('--model', choices=['rf', 'hgb'], default='rf',
+                        help="rf: Random Forest (default), hgb: Histogram Gradient Boosting")
+    parser.add_argument('--refresh', action='store_true',
+                        help="Incrementally refresh the saved Random Forest from new labeled feedback instead of retraining")
+    args = parser.parse_args()
+    if args.refresh:
+        print(refresh_model(FeedbackStore(), MODEL_DIR))
+    else:
+        train_and_save(args.model)
@@ -8,20 +8,23 @@ This script trains the Random Forest model with full MLflow tracking:
 """
 
 import os
+import sys
 import json
 import mlflow
 import mlflow.sklearn
 import pandas as pd
-import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
 from sklearn.ensemble import RandomForestClassifier
-from sklearn.model_selection import train_test_split
 from sklearn.metrics import (
     classification_report, confusion_matrix, 
     f1_score, recall_score, precision_score, roc_auc_score
 )
 
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from backend.app.threshold_analysis import ThresholdAnalysis
+from src.data.prepare import prepare_data
+
 # Paths
 DATA_PATH = 'Data/water_potability.csv'
 MODEL_DIR = 'backend/app/model'
@@ -39,23 +42,18 @@ def train_with_mlflow():
         
         # ============ Data Loading ============
         print("Loading data...")
-        df = pd.read_csv(DATA_PATH)
+        raw = prepare_data(impute=False, path=DATA_PATH, random_state=RANDOM_STATE)
         
         # Log dataset info
-        mlflow.log_param("dataset_size", len(df))
-        mlflow.log_param("missing_values", df.isnull().sum().sum())
-        
-        # Imputation
-        imputer_values = df.median().to_dict()
-        df.fillna(imputer_values, inplace=True)
+        mlflow.log_param("dataset_size", len(raw.X))
+        mlflow.log_param("missing_values", raw.X.isnull().sum().sum())
+        mlflow.log_param("dataset_sha256", raw.dataset_hash)
         
-        X = df.drop('Potability', axis=1)
-        y = df['Potability']
-        
-        # Train-test split
-        X_train, X_test, y_train, y_test = train_test_split(
-            X, y, test_size=0.2, random_state=RANDOM_STATE, stratify=y
-        )
+        # Imputation (fresh medians) and the shared cached train-test split
+        data = prepare_data(fit_imputer=True, path=DATA_PATH, random_state=RANDOM_STATE)
+        imputer_values = data.imputer_values
+        X = data.X
+        X_train, X_test, y_train, y_test = data.split()
         
         mlflow.log_param("train_size", len(X_train))
         mlflow.log_param("test_size", len(X_test))
@@ -85,20 +83,11 @@ def train_with_mlflow():
         print("Optimizing threshold for >90% recall...")
         
         y_probs = rf_model.predict_proba(X_test)[:, 1]
-        thresholds = np.arange(0.0, 1.01, 0.01)
         
         best_thresh = 0.5
-        best_f1 = 0
-        
-        for t in thresholds:
-            y_pred_t = (y_probs >= t).astype(int)
-            rec = recall_score(y_test, y_pred_t, zero_division=0)
-            
-            if rec >= 0.90:
-                f1 = f1_score(y_test, y_pred_t, zero_division=0)
-                if f1 > best_f1:
-                    best_f1 = f1
-                    best_thresh = t
+        best = ThresholdAnalysis(y_test, y_probs).optimal_threshold(min_recall=0.90)
+        if best:
+            best_thresh = best['threshold']
         
         mlflow.log_param("optimal_threshold", best_thresh)
         
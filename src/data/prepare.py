@@ -0,0 +1,150 @@
+"""
+Shared data preparation for the training, optimization and SHAP scripts.
+
+Every script gets the potability dataset, its imputation and its train/test
+split from here, so they all see exactly the same arrays:
+
+- The CSV is parsed once into a typed binary cache (one array per column in
+  an .npz) keyed by the SHA-256 of the file, so later runs skip CSV parsing and
+  an edited CSV is never served from a stale cache.
+- Missing values are filled from the persisted ``imputer_values.json``, the
+  same medians the API uses. Only training fits new medians.
+- Stratified train/test split indices are cached per dataset hash, test size and
+  random state. The split is identical to ``train_test_split(X, y, ...)`` with the
+  same arguments.
+"""
+
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+from sklearn.model_selection import train_test_split
+
+DATA_PATH = 'Data/water_potability.csv'
+CACHE_DIR = 'Data/.cache'
+IMPUTER_PATH = 'backend/app/model/imputer_values.json'
+TARGET = 'Potability'
+TEST_SIZE = 0.2
+RANDOM_STATE = 42
+
+# In-process memo: dataset hash -> DataFrame, so repeated calls in one run parse nothing
+_frames = {}
+
+
+class PreparedData:
+    """Features, target and split of one dataset; ``X_train`` etc. are views by split index."""
+
+    def __init__(self, X, y, train_idx, test_idx, imputer_values, dataset_hash):
+        self.X = X
+        self.y = y
+        self.train_idx = train_idx
+        self.test_idx = test_idx
+        self.imputer_values = imputer_values
+        self.dataset_hash = dataset_hash
+
+    @property
+    def X_train(self):
+        return self.X.iloc[self.train_idx]
+
+    @property
+    def X_test(self):
+        return self.X.iloc[self.test_idx]
+
+    @property
+    def y_train(self):
+        return self.y.iloc[self.train_idx]
+
+    @property
+    def y_test(self):
+        return self.y.iloc[self.test_idx]
+
+    def split(self):
+        """Returns X_train, X_test, y_train, y_test in ``train_test_split`` order."""
+        return self.X_train, self.X_test, self.y_train, self.y_test
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _atomic_savez(path, **arrays):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        np.savez(f, **arrays)
+    os.replace(tmp_path, path)
+
+
+def load_dataset(path=DATA_PATH, cache_dir=CACHE_DIR):
+    """Returns (DataFrame, content hash) of the raw, un-imputed dataset."""
+    digest = file_hash(path)
+    if digest in _frames:
+        return _frames[digest].copy(), digest
+
+    cache_path = os.path.join(cache_dir, f"{digest}.npz")
+    if os.path.exists(cache_path):
+        with np.load(cache_path, allow_pickle=False) as data:
+            columns = [str(c) for c in data['columns']]
+            df = pd.DataFrame({c: data[f"col_{i}"] for i, c in enumerate(columns)})
+    else:
+        df = pd.read_csv(path)
+        os.makedirs(cache_dir, exist_ok=True)
+        _atomic_savez(cache_path, columns=np.array(df.columns, dtype=str),
+                      **{f"col_{i}": df[c].to_numpy() for i, c in enumerate(df.columns)})
+
+    _frames[digest] = df
+    return df.copy(), digest
+
+
+def load_imputer_values(path=IMPUTER_PATH):
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def fit_imputer_values(df):
+    """Column medians of the raw dataset, as saved to ``imputer_values.json``."""
+    return df.median().to_dict()
+
+
+def split_indices(y, dataset_hash, test_size=TEST_SIZE, random_state=RANDOM_STATE, cache_dir=CACHE_DIR):
+    """Stratified (train_idx, test_idx) positions, cached per dataset and split parameters."""
+    cache_path = os.path.join(cache_dir, f"{dataset_hash}_split_{test_size}_{random_state}.npz")
+    if os.path.exists(cache_path):
+        with np.load(cache_path) as data:
+            return data['train'], data['test']
+    train_idx, test_idx = train_test_split(
+        np.arange(len(y)), test_size=test_size, random_state=random_state, stratify=y
+    )
+    os.makedirs(cache_dir, exist_ok=True)
+    _atomic_savez(cache_path, train=train_idx, test=test_idx)
+    return train_idx, test_idx
+
+
+def prepare_data(impute=True, fit_imputer=False, path=DATA_PATH, imputer_path=IMPUTER_PATH,
+                 cache_dir=CACHE_DIR, test_size=TEST_SIZE, random_state=RANDOM_STATE):
+    """
+    Loads the dataset and returns a PreparedData.
+
+    impute: fill missing values (models with native NaN support pass False).
+    fit_imputer: compute fresh medians from the data (training) instead of reading
+        the persisted ``imputer_values.json``; falls back to fitting if that file is missing.
+    The medians used (or fitted) are returned as ``imputer_values`` either way.
+    """
+    df, digest = load_dataset(path, cache_dir)
+    imputer_values = None if fit_imputer else load_imputer_values(imputer_path)
+    if imputer_values is None:
+        imputer_values = fit_imputer_values(df)
+    if impute:
+        df = df.fillna(imputer_values)
+
+    X = df.drop(TARGET, axis=1)
+    y = df[TARGET]
+    train_idx, test_idx = split_indices(y, digest, test_size, random_state, cache_dir)
+    return PreparedData(X, y, train_idx, test_idx, imputer_values, digest)
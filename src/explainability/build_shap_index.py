@@ -0,0 +1,84 @@
+"""
+Builds the nearest-neighbour SHAP index used by the API when SHAP_APPROXIMATION=1.
+
+Reference set: the training split plus jittered synthetic copies of it. Exact
+SHAP for the reference set and the test split comes from the chunked SHAP cache
+(``shap_cache.py``), so rebuilding for an unchanged model is cheap. The test split
+validates the approximation and calibrates the fallback distance; the report is
+printed and saved next to the index.
+"""
+
+import argparse
+import json
+import os
+import sys
+
+import joblib
+import numpy as np
+import pandas as pd
+import shap
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from src.data.prepare import prepare_data
+from src.explainability.shap_cache import compute_shap_values
+from backend.app.shap_index import ShapIndex, file_hash, infer_output, DEFAULT_K, DEFAULT_TOLERANCE
+
+MODEL_DIR = 'backend/app/model'
+MODEL_PATH = os.path.join(MODEL_DIR, 'water_quality_model.pkl')
+INDEX_PATH = os.path.join(MODEL_DIR, 'shap_index.pkl')
+REPORT_PATH = os.path.join(MODEL_DIR, 'shap_index_report.json')
+RANDOM_STATE = 42
+
+
+def synthetic_samples(X, copies, jitter, rng):
+    """``copies`` jittered copies of every row; noise is ``jitter`` x the feature's std."""
+    if copies <= 0:
+        return X.iloc[:0]
+    base = np.repeat(X.to_numpy(), copies, axis=0)
+    noise = rng.normal(size=base.shape) * X.std().to_numpy() * jitter
+    return pd.DataFrame(base + noise, columns=X.columns)
+
+
+def positive_class(values):
+    return values[:, :, 1] if values.shape[2] > 1 else values[:, :, 0]
+
+
+def build_index(copies=1, jitter=0.1, k=DEFAULT_K, tolerance=DEFAULT_TOLERANCE, n_jobs=-1):
+    model = joblib.load(MODEL_PATH)
+    data = prepare_data()
+    rng = np.random.default_rng(RANDOM_STATE)
+
+    X_reference = pd.concat([data.X_train, synthetic_samples(data.X_train, copies, jitter, rng)],
+                            ignore_index=True)
+    print(f"Exact SHAP for {len(X_reference)} reference rows and {len(data.X_test)} validation rows...")
+    reference_values, computed = compute_shap_values(model, X_reference, MODEL_PATH, n_jobs=n_jobs)
+    validation_values, computed_val = compute_shap_values(model, data.X_test, MODEL_PATH, n_jobs=n_jobs)
+    print(f"Computed {computed + computed_val} rows, reused the rest from the cache.")
+
+    # Positive-class base value on the explainer's output scale (probability for forests, log-odds for boosting)
+    base_value = np.atleast_1d(shap.TreeExplainer(model).expected_value)[-1]
+    validation_scores = model.predict_proba(data.X_test)[:, 1]
+    output = infer_output(base_value, positive_class(validation_values), validation_scores)
+    index = ShapIndex(X_reference, positive_class(reference_values), base_value, data.X.columns,
+                      file_hash(MODEL_PATH), k=k, output=output)
+    report = index.validate(data.X_test, positive_class(validation_values), validation_scores, tolerance)
+    report.update({"synthetic_copies": copies, "jitter": jitter})
+
+    index.save(INDEX_PATH)
+    with open(REPORT_PATH, 'w') as f:
+        json.dump(report, f, indent=4)
+    print(json.dumps(report, indent=4))
+    print(f"Saved {INDEX_PATH}; serve it with SHAP_APPROXIMATION=1")
+    return index
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the nearest-neighbour SHAP approximation index.")
+    parser.add_argument('--copies', type=int, default=1, help="Jittered synthetic copies per training row")
+    parser.add_argument('--jitter', type=float, default=0.1, help="Noise as a fraction of each feature's std")
+    parser.add_argument('--k', type=int, default=DEFAULT_K, help="Neighbours to interpolate")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help="Max per-row absolute SHAP error (95th percentile) to serve approximations")
+    parser.add_argument('--jobs', type=int, default=-1, help="Worker processes for exact SHAP")
+    args = parser.parse_args()
+    build_index(args.copies, args.jitter, args.k, args.tolerance, args.jobs)
@@ -9,36 +9,50 @@ Generates:
 
 import os
 import sys
+import json
 import joblib
 import shap
-import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from src.data.prepare import prepare_data
+from src.explainability.shap_cache import compute_shap_values
+
 # Paths
 MODEL_PATH = 'backend/app/model/water_quality_model.pkl'
 DATA_PATH = 'Data/water_potability.csv'
 OUTPUT_DIR = 'Visualisations/shap'
+GLOBAL_IMPORTANCE_PATH = 'backend/app/model/global_feature_importance.json'
+EXPLAINER_PATH = 'backend/app/model/shap_explainer.pkl'
 
 def load_model_and_data():
     """Load the trained model and dataset."""
     print("Loading model and data...")
     model = joblib.load(MODEL_PATH)
-    df = pd.read_csv(DATA_PATH)
-    
-    # Impute missing values (same as training)
-    df.fillna(df.median(), inplace=True)
-    
-    X = df.drop('Potability', axis=1)
-    y = df['Potability']
+    # Impute missing values with the medians saved at training time (same as the API)
+    data = prepare_data(path=DATA_PATH)
     
-    return model, X, y
+    return model, data.X, data.y
 
 def generate_shap_values(model, X):
-    """Generate SHAP values using TreeExplainer."""
-    print("Calculating SHAP values (this may take a minute)...")
+    """
+    Generate SHAP values using TreeExplainer, in parallel row chunks. Values come
+    from the memory-mapped cache; only rows it has not seen for this model are computed.
+    """
+    print("Calculating SHAP values (cached rows are reused)...")
     explainer = shap.TreeExplainer(model)
-    shap_values = explainer(X)
+    values, computed = compute_shap_values(model, X, MODEL_PATH)
+    print(f"Computed {computed} of {len(X)} rows, reused the rest from the cache.")
+    # Same layout as explainer(X): values (rows, features, classes), base values per row
+    base_values = np.tile(np.atleast_1d(explainer.expected_value), (len(X), 1))
+    # np.asarray: a plain ndarray view of the memmap (shap's slicing does not handle np.memmap)
+    shap_values = shap.Explanation(
+        values=np.asarray(values),
+        base_values=base_values,
+        data=X.to_numpy(),
+        feature_names=list(X.columns)
+    )
     return explainer, shap_values
 
 def save_summary_plot(shap_values, X):
@@ -102,21 +116,15 @@ def main():
     save_dependence_plot(shap_values, X, feature='Sulfate')
     save_waterfall_plot(shap_values, X, sample_idx=0)
     save_waterfall_plot(shap_values, X, sample_idx=100)
-    
 
-    # Save global feature importance data (JSON)
-    # Calculate mean absolute SHAP value for each feature
+    save_global_importance(shap_values, X)
+    save_explainer(explainer)
+
+    print("\n✅ SHAP analysis complete! Visualizations and Data saved.")
+
+def save_global_importance(shap_values, X):
+    """Save global feature importance data (JSON): mean absolute SHAP value per feature."""
     # shap_values[:, :, 1] is for positive class in binary classification
-    vals = shap_values[:, :, 1].values
-    if vals.ndim == 1: # Sometimes comes as just (samples, features) if binary?
-        pass # Handle if needed, but usually binary classifier output depends on implementation
-    
-    # Check shape: (samples, features)
-    # For TreeExplainer on binary class RF, shap_values is usually a list or object with values for both classes
-    # But shap 0.50+ returns an Explanation object.
-    # We accessed shap_values[:, :, 1] in plots which implies it has class dim.
-    
-    # Let's extract values safely
     if len(shap_values.shape) == 3:
         vals = np.abs(shap_values.values[:, :, 1]).mean(0) # Mean across samples
     else:
@@ -132,16 +140,39 @@ def main():
     # Sort
     global_importance.sort(key=lambda x: x['importance'], reverse=True)
     
-    import json
-    with open(os.path.join('backend/app/model', 'global_feature_importance.json'), 'w') as f:
+    with open(GLOBAL_IMPORTANCE_PATH, 'w') as f:
         json.dump(global_importance, f, indent=4)
     print("Saved global_feature_importance.json for API use.")
 
-    print("\n✅ SHAP analysis complete! Visualizations and Data saved.")
-    
-    # Save explainer for API use
-    joblib.dump(explainer, os.path.join('backend/app/model', 'shap_explainer.pkl'))
+def save_explainer(explainer):
+    """Save explainer for API use."""
+    joblib.dump(explainer, EXPLAINER_PATH)
     print("Saved SHAP explainer for API use.")
 
+# Entry points for the artifact pipeline (scripts/build_artifacts.py); each runs in its own process
+
+def build_api_artifacts():
+    """SHAP values (cached), global importance JSON and the explainer."""
+    model, X, y = load_model_and_data()
+    explainer, shap_values = generate_shap_values(model, X)
+    save_global_importance(shap_values, X)
+    save_explainer(explainer)
+
+def build_plot(kind, feature=None, sample_idx=None):
+    """One plot from the cached SHAP values: summary, bar, dependence or waterfall."""
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    model, X, y = load_model_and_data()
+    _, shap_values = generate_shap_values(model, X)
+    if kind == 'summary':
+        save_summary_plot(shap_values, X)
+    elif kind == 'bar':
+        save_bar_plot(shap_values, X)
+    elif kind == 'dependence':
+        save_dependence_plot(shap_values, X, feature=feature)
+    elif kind == 'waterfall':
+        save_waterfall_plot(shap_values, X, sample_idx=sample_idx)
+    else:
+        raise ValueError(f"Unknown plot kind: {kind}")
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,112 @@
+"""
+Parallel, incremental SHAP computation with an on-disk cache.
+
+Exact TreeSHAP over the whole dataset takes about a minute on one core. This
+module splits the rows into chunks and explains them in worker processes. The
+resulting (rows x features x outputs) array is kept as a memory-mapped .npy:
+
+    <cache_dir>/<model hash>/<data hash>.npy       SHAP values, aligned to the data rows
+    <cache_dir>/<model hash>/<data hash>.keys.npy  per-row content hashes
+
+Every cached dataset of the same model is a source of reusable rows. A rerun
+on edited or extended data only explains the rows whose content hash has not
+been seen, and a rerun on unchanged data explains nothing.
+"""
+
+import glob
+import hashlib
+import os
+
+import numpy as np
+from joblib import Parallel, delayed
+
+CACHE_DIR = 'Data/.cache/shap'
+CHUNK_ROWS = 256
+
+
+def model_hash(model_path):
+    digest = hashlib.sha256()
+    with open(model_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def row_keys(X):
+    """128-bit content hash of every row (column order included), as an (n,) bytes array."""
+    values = np.ascontiguousarray(X.to_numpy(dtype=np.float64))
+    header = ",".join(map(str, X.columns)).encode()
+    return np.array([hashlib.blake2b(header + row.tobytes(), digest_size=16).digest() for row in values],
+                    dtype='S16')
+
+
+def data_hash(keys):
+    return hashlib.sha256(keys.tobytes()).hexdigest()
+
+
+def _explain_chunk(model, X_chunk):
+    import shap
+    values = shap.TreeExplainer(model)(X_chunk).values
+    return values if values.ndim == 3 else values[..., None]
+
+
+def _cached_rows(model_dir, exclude):
+    """key -> (values path, row) over every dataset cached for this model."""
+    index = {}
+    for keys_path in glob.glob(os.path.join(model_dir, '*.keys.npy')):
+        values_path = keys_path[:-len('.keys.npy')] + '.npy'
+        if values_path == exclude or not os.path.exists(values_path):
+            continue
+        for row, key in enumerate(np.load(keys_path)):
+            index.setdefault(key, (values_path, row))
+    return index
+
+
+def compute_shap_values(model, X, model_path, cache_dir=CACHE_DIR, n_jobs=-1, chunk_rows=CHUNK_ROWS):
+    """
+    Returns a read-only memmap of SHAP values for X, shaped (rows, features, outputs),
+    computing only the rows missing from the cache. Also returns how many rows were
+    computed.
+    """
+    model_dir = os.path.join(cache_dir, model_hash(model_path))
+    keys = row_keys(X)
+    values_path = os.path.join(model_dir, f"{data_hash(keys)}.npy")
+    if os.path.exists(values_path):
+        return np.load(values_path, mmap_mode='r'), 0
+
+    os.makedirs(model_dir, exist_ok=True)
+    index = _cached_rows(model_dir, values_path)
+    missing = np.array([i for i, key in enumerate(keys) if key not in index], dtype=int)
+
+    computed = None
+    if len(missing):
+        chunks = [missing[i:i + chunk_rows] for i in range(0, len(missing), chunk_rows)]
+        results = Parallel(n_jobs=n_jobs, backend="loky")(
+            delayed(_explain_chunk)(model, X.iloc[chunk]) for chunk in chunks
+        )
+        computed = np.concatenate(results)
+
+    n_outputs = computed.shape[2] if computed is not None else np.load(
+        next(iter(index.values()))[0], mmap_mode='r').shape[2]
+    tmp_path = f"{values_path}.{os.getpid()}.tmp"
+    out = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.float64,
+                                    shape=(len(X), X.shape[1], n_outputs))
+    if computed is not None:
+        out[missing] = computed
+    # Copy reused rows grouped by source file
+    sources = {}
+    for i, key in enumerate(keys):
+        if key in index:
+            path, row = index[key]
+            sources.setdefault(path, ([], []))
+            sources[path][0].append(i)
+            sources[path][1].append(row)
+    for path, (dest, src) in sources.items():
+        out[dest] = np.load(path, mmap_mode='r')[src]
+    out.flush()
+    del out
+
+    # The rename publishes the values; keys without a values file are skipped as a reuse source
+    np.save(os.path.join(model_dir, f"{data_hash(keys)}.keys.npy"), keys)
+    os.replace(tmp_path, values_path)
+    return np.load(values_path, mmap_mode='r'), len(missing)
@@ -0,0 +1,229 @@
+"""
+Incremental pipeline runner with content-hashed dependency tracking.
+
+A ``Stage`` declares the files it reads, the files it writes, its params and
+the source files its work actually runs (``code``). Stages form a DAG: a stage
+depends on every stage that writes one of its inputs.
+
+Before running a stage, the runner computes a signature from three things: the
+content hashes of its inputs, its params, and the content hashes of its code
+files. Entry points are often thin wrappers in a build script, so hashing only
+the module that defines the function would miss edits to the training or SHAP
+code; ``code`` falls back to that module only when nothing is declared. A
+stage is skipped when its signature matches the
+last successful run and every output still has the hash recorded then. A
+changed CSV therefore reruns training and everything downstream. A changed
+plot param reruns only that plot. Stages whose upstreams are done run in
+parallel worker processes.
+"""
+
+import hashlib
+import inspect
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+STATE_PATH = 'Data/.cache/pipeline_state.json'
+
+
+class Stage:
+    def __init__(self, name, func, inputs=(), outputs=(), params=None, code=()):
+        self.name = name
+        self.func = func
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.params = params or {}
+        self.code = list(code)
+
+    def code_files(self):
+        """Source files whose content is part of the signature."""
+        if self.code:
+            return self.code
+        path = inspect.getsourcefile(self.func)
+        return [path] if path else []
+
+
+def _run_stage(func, params):
+    start = time.perf_counter()
+    func(**params)
+    return time.perf_counter() - start
+
+
+class Pipeline:
+    def __init__(self, stages, state_path=STATE_PATH):
+        self.stages = {s.name: s for s in stages}
+        self.state_path = state_path
+        producers = {}
+        for stage in stages:
+            missing = [p for p in stage.code if not os.path.exists(p)]
+            if missing:
+                raise ValueError(f"{stage.name} declares missing code files: {', '.join(missing)}")
+            for path in stage.outputs:
+                if path in producers:
+                    raise ValueError(f"{path} is written by both {producers[path]} and {stage.name}")
+                producers[path] = stage.name
+        self.upstream = {s.name: {producers[p] for p in s.inputs if p in producers} for s in stages}
+        self._check_acyclic()
+        self._hashes = {}
+
+    def _check_acyclic(self):
+        visiting, done = set(), set()
+
+        def visit(name):
+            if name in done:
+                return
+            if name in visiting:
+                raise ValueError(f"Pipeline has a cycle through {name}")
+            visiting.add(name)
+            for up in self.upstream[name]:
+                visit(up)
+            visiting.discard(name)
+            done.add(name)
+
+        for name in self.stages:
+            visit(name)
+
+    # ---- Signatures ---------------------------------------------------------
+
+    def file_hash(self, path):
+        """SHA-256 of a file, memoised per (size, mtime) for this run; None if missing."""
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        key = (path, st.st_size, st.st_mtime_ns)
+        if key not in self._hashes:
+            digest = hashlib.sha256()
+            with open(path, 'rb') as f:
+                for block in iter(lambda: f.read(1 << 20), b''):
+                    digest.update(block)
+            self._hashes[key] = digest.hexdigest()
+        return self._hashes[key]
+
+    def signature(self, stage):
+        payload = {
+            "inputs": {p: self.file_hash(p) for p in stage.inputs},
+            "params": stage.params,
+            "code": {p: self.file_hash(p) for p in stage.code_files()} or stage.func.__qualname__,
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+    def is_up_to_date(self, stage, state):
+        record = state.get(stage.name)
+        if not record or record.get("signature") != self.signature(stage):
+            return False
+        return all(self.file_hash(p) is not None and self.file_hash(p) == record["outputs"].get(p)
+                   for p in stage.outputs)
+
+    # ---- State --------------------------------------------------------------
+
+    def load_state(self):
+        if not os.path.exists(self.state_path):
+            return {}
+        with open(self.state_path) as f:
+            return json.load(f)
+
+    def _save_state(self, state):
+        os.makedirs(os.path.dirname(self.state_path) or ".", exist_ok=True)
+        tmp_path = f"{self.state_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f, indent=2)
+        os.replace(tmp_path, self.state_path)
+
+    # ---- Running ------------------------------------------------------------
+
+    def required(self, targets=None):
+        """The targets and everything upstream of them (all stages by default)."""
+        if not targets:
+            return set(self.stages)
+        needed, stack = set(), list(targets)
+        while stack:
+            name = stack.pop()
+            if name not in self.stages:
+                raise KeyError(f"Unknown stage: {name}")
+            if name not in needed:
+                needed.add(name)
+                stack.extend(self.upstream[name])
+        return needed
+
+    def run(self, targets=None, force=False, jobs=None, dry_run=False, log=print):
+        """
+        Runs out-of-date stages among ``targets`` (and their upstreams); returns
+        {stage: "ran" | "skipped" | "failed" | "blocked" | "would run"}.
+        ``jobs`` == 1 runs stages in this process; otherwise in up to ``jobs`` spawned workers.
+        """
+        needed = self.required(targets)
+        state = self.load_state()
+        status = {}
+        jobs = jobs or os.cpu_count() or 1
+        executor = None
+        if jobs > 1 and not dry_run:
+            executor = ProcessPoolExecutor(max_workers=jobs, mp_context=multiprocessing.get_context("spawn"))
+        running = {}  # future -> stage name
+
+        def ready():
+            return [n for n in sorted(needed) if n not in status and n not in running.values()
+                    and all(status.get(u) in ("ran", "skipped", "would run") for u in self.upstream[n])]
+
+        def finish(name, seconds=None, error=None):
+            if error is not None:
+                status[name] = "failed"
+                log(f"[failed]  {name}: {error}")
+                return
+            stage = self.stages[name]
+            missing = [p for p in stage.outputs if not os.path.exists(p)]
+            if missing:
+                status[name] = "failed"
+                log(f"[failed]  {name}: did not write {', '.join(missing)}")
+                return
+            state[name] = {
+                "signature": self.signature(stage),
+                "outputs": {p: self.file_hash(p) for p in stage.outputs},
+                "seconds": round(seconds, 3),
+                "finished_at": time.time(),
+            }
+            self._save_state(state)
+            status[name] = "ran"
+            log(f"[ran]     {name} ({seconds:.1f}s)")
+
+        try:
+            while True:
+                batch = ready()
+                for name in batch:
+                    stage = self.stages[name]
+                    upstream_pending = any(status.get(u) == "would run" for u in self.upstream[name])
+                    if not force and not upstream_pending and self.is_up_to_date(stage, state):
+                        status[name] = "skipped"
+                        log(f"[skipped] {name}")
+                    elif dry_run:
+                        status[name] = "would run"
+                        log(f"[would run] {name}")
+                    elif executor is None:
+                        try:
+                            finish(name, _run_stage(stage.func, stage.params))
+                        except Exception as e:
+                            finish(name, error=e)
+                    else:
+                        running[executor.submit(_run_stage, stage.func, stage.params)] = name
+                        log(f"[started] {name}")
+                if running:
+                    done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                    for future in done:
+                        name = running.pop(future)
+                        try:
+                            finish(name, future.result())
+                        except Exception as e:
+                            finish(name, error=e)
+                elif not batch:
+                    break
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        # Stages never reached had a failed upstream
+        for name in needed - set(status):
+            status[name] = "blocked"
+            log(f"[blocked] {name}")
+        return status
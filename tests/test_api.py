@@ -69,24 +69,77 @@ async def test_predict_endpoint_invalid_input():
 
 
 @pytest.mark.asyncio
-async def test_stats_endpoint():
-    """Test the stats endpoint returns model metrics."""
+async def test_stats_endpoint(sample_input, tmp_path, monkeypatch):
+    """Test the stats endpoint reports live metrics of predictions joined with their labels."""
+    from backend.app import feedback
+    from backend.app.feedback import FeedbackStore
+    monkeypatch.setattr(feedback, "feedback_store", FeedbackStore(str(tmp_path)))
+
     transport = ASGITransport(app=app)
     async with AsyncClient(transport=transport, base_url="http://test") as client:
+        before = (await client.get("/api/stats")).json()
+        prediction = (await client.post("/api/predict", json=sample_input)).json()
+        await client.post("/api/feedback", json={
+            **sample_input, "potable": True, "prediction_id": prediction["prediction_id"]
+        })
         response = await client.get("/api/stats")
-    
+
     assert response.status_code == 200
     data = response.json()
     
     # Check response structure
-    assert "r2_score" in data
-    assert "rmse" in data
-    assert "recall_optimized" in data
     assert "model_name" in data
+    assert data["threshold"] == prediction["threshold_used"]
+    assert set(data["windows"]) == {"1h", "24h", "7d", "lifetime"}
     
-    # Check values (from resume)
-    assert data["r2_score"] == pytest.approx(0.8329, rel=0.01)
-    assert data["recall_optimized"] >= 0.90
+    # The labeled prediction is counted in every window
+    for name in ("1h", "lifetime"):
+        window, previous = data["windows"][name], before["windows"][name]
+        assert window["labeled"] == previous["labeled"] + 1
+        hit = "tp" if prediction["is_potable"] else "fn"
+        assert window[hit] == previous[hit] + 1
+        assert len(window["calibration"]) == 10
+    assert data["predictions"] == before["predictions"] + 1
+
+
+@pytest.mark.asyncio
+async def test_feedback_rejects_out_of_range_score(sample_input):
+    """Test that feedback with a predicted score outside [0, 1] is rejected before it is scored."""
+    from backend.app.online_eval import online_evaluator
+    lifetime = online_evaluator.lifetime.copy()
+
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        for score in (-0.5, 1.5):
+            response = await client.post("/api/feedback", json={
+                **sample_input, "potable": True, "predicted_score": score
+            })
+            assert response.status_code == 422
+
+    assert (online_evaluator.lifetime == lifetime).all()
+
+
+@pytest.mark.asyncio
+async def test_stats_conditional_get(sample_input):
+    """Test that /stats and /feature-importance answer a matching If-None-Match with 304."""
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        first = await client.get("/api/stats")
+        etag = first.headers["etag"]
+        cached = await client.get("/api/stats", headers={"If-None-Match": etag})
+        await client.post("/api/predict", json=sample_input)
+        changed = await client.get("/api/stats", headers={"If-None-Match": etag})
+
+        importance = await client.get("/api/feature-importance")
+        importance_cached = await client.get("/api/feature-importance",
+                                             headers={"If-None-Match": importance.headers["etag"]})
+
+    assert first.status_code == 200
+    assert cached.status_code == 304 and cached.content == b""
+    # A new prediction changes the stats, so the old tag no longer matches
+    assert changed.status_code == 200 and changed.headers["etag"] != etag
+    assert importance.status_code == 200
+    assert importance_cached.status_code == 304
 
 
 @pytest.mark.asyncio
@@ -159,3 +212,39 @@ async def test_ph_forecast_endpoint():
     assert "trend" in data
     assert "confidence" in data
     assert data["trend"] == "increasing"  # Values are increasing
+
+
+@pytest.mark.asyncio
+async def test_network_ph_forecast():
+    """Test next-step pH forecasts for every location of the spatio-temporal network."""
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        latest = await client.get("/api/predict-ph/network")
+        past = await client.get("/api/predict-ph/network", params={"date_index": 500})
+        invalid = await client.get("/api/predict-ph/network", params={"date_index": 2})
+
+    assert latest.status_code == 200
+    data = latest.json()
+    assert len(data["forecasts"]) == 37
+    assert data["forecasts"][0]["actual_ph"] is None
+    # The model must beat carrying the last value forward on the test period
+    assert data["model_metrics"]["rmse"] < data["model_metrics"]["persistence_rmse"]
+
+    assert past.status_code == 200
+    assert all(f["actual_ph"] is not None for f in past.json()["forecasts"])
+    assert invalid.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_network_ph_forecast_logs_over_budget(monkeypatch, caplog):
+    """Test that a network forecast over its latency budget is logged as a warning."""
+    from backend.app import api
+    monkeypatch.setattr(api, "PH_FORECAST_BUDGET_MS", -1.0)
+
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        with caplog.at_level("WARNING", logger="backend.app.api"):
+            response = await client.get("/api/predict-ph/network")
+
+    assert response.status_code == 200
+    assert any("budget" in r.getMessage() for r in caplog.records)
@@ -0,0 +1,735 @@
+"""
+Unit tests for the DataLab session pipeline.
+"""
+
+import asyncio
+import glob
+import gzip
+import io
+import os
+import pickle
+import shutil
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.metrics import accuracy_score
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from fastapi.testclient import TestClient
+
+from backend.app.main import app
+from backend.app.columnar import (
+    ColumnarWriter, write_columnar, read_columnar, read_schema, columnar_exists, iter_columnar_chunks, take_columnar
+)
+from backend.app.session_store import SessionDatasetStore, TEMP_DATA_DIR, RAW, CLEANED
+from backend.app.eda_engine import (
+    compute_eda, compute_eda_streaming, compute_eda_sampled, compute_eda_progressive, TargetStrata
+)
+from backend.app.analysis_cache import AnalysisCache
+from backend.app.jobs import JobManager, Job, job_manager, RUNNING, CANCELLED
+from backend.app.session_lifecycle import SessionLifecycleManager, session_ref
+from backend.app.upload_stream import CSVUploadStream, RecordSplitter
+from backend.app.hyperparameter_search import rung_schedule
+from backend.app.training import load_training_data, split_data, train_session_model
+from backend.app.routers import datalab
+from backend.app.serialization import to_columnar, dumps
+from backend.app.http_cache import (
+    negotiate, make_etag, is_fresh, not_modified, cache_headers, CompressionMiddleware
+)
+
+
+def _make_frame(rows=50):
+    rng = np.random.default_rng(0)
+    return pd.DataFrame({
+        "ph": rng.normal(7, 1, rows),
+        "Hardness": rng.normal(200, 30, rows),
+        "Potability": rng.integers(0, 2, rows),
+    })
+
+
+@pytest.fixture
+def client():
+    # Context manager keeps one event loop alive, so background tasks survive between requests
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def sample_session(client):
+    """Creates a DataLab session from the bundled sample and removes its files afterwards."""
+    response = client.post("/api/datalab/use_sample")
+    assert response.status_code == 200
+    session_id = response.json()["session_id"]
+    yield session_id
+    for path in glob.glob(os.path.join(TEMP_DATA_DIR, f"{session_id}_*")):
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        else:
+            os.remove(path)
+
+
+def test_store_caches_parsed_frame(tmp_path):
+    """Test that a legacy CSV session is converted once and then served from memory."""
+    _make_frame().to_csv(tmp_path / "s1_raw.csv", index=False)
+    store = SessionDatasetStore(data_dir=str(tmp_path))
+
+    first = store.get("s1", RAW)
+    second = store.get("s1", RAW)
+
+    assert first is second
+    assert store.stats()["misses"] == 1
+    assert columnar_exists(store.path_for("s1", RAW))
+    assert not (tmp_path / "s1_raw.csv").exists()
+
+
+def test_store_deduplicates_identical_content(tmp_path):
+    """Test that sessions ingesting the same file share one stored dataset."""
+    csv_path = tmp_path / "upload.csv"
+    _make_frame().to_csv(csv_path, index=False)
+    store = SessionDatasetStore(data_dir=str(tmp_path))
+
+    store.ingest_csv("s1", RAW, str(csv_path))
+    store.ingest_csv("s2", RAW, str(csv_path))
+
+    assert store.dataset_key("s1", RAW) == store.dataset_key("s2", RAW)
+    assert store.get("s1", RAW) is store.get("s2", RAW)
+    assert len(os.listdir(tmp_path / "datasets")) == 1
+
+
+def test_columnar_round_trip(tmp_path):
+    """Test that the columnar format preserves values, nulls and text columns."""
+    df = _make_frame(20)
+    df.loc[3, "ph"] = np.nan
+    df["Source"] = ["well", None] * 10
+    write_columnar(df, str(tmp_path / "ds"))
+
+    loaded = read_columnar(str(tmp_path / "ds"))
+    pd.testing.assert_frame_equal(loaded, df, check_dtype=False)
+    # Integer target fits in a single byte
+    assert loaded["Potability"].dtype == np.int8
+
+    subset = read_columnar(str(tmp_path / "ds"), columns=["Hardness"])
+    assert list(subset.columns) == ["Hardness"]
+
+
+def test_columnar_text_size_follows_content(tmp_path):
+    """Test that one long text value does not widen every row, and non-ASCII text round-trips."""
+    df = pd.DataFrame({"note": ["ok"] * 999 + ["x" * 10_000], "site": ["Zürich", None] * 500})
+    write_columnar(df, str(tmp_path / "ds"))
+
+    assert os.path.getsize(tmp_path / "ds" / "0.npy") < 20_000
+    pd.testing.assert_frame_equal(read_columnar(str(tmp_path / "ds")), df)
+    chunks = list(iter_columnar_chunks(str(tmp_path / "ds"), 300))
+    pd.testing.assert_frame_equal(pd.concat(chunks, ignore_index=True), df)
+    rows = np.array([0, 1, 998, 999])
+    pd.testing.assert_frame_equal(take_columnar(str(tmp_path / "ds"), rows), df.iloc[rows].reset_index(drop=True))
+
+
+def test_store_evicts_least_recently_used(tmp_path):
+    """Test that the byte budget evicts the least recently used dataset."""
+    df = _make_frame()
+    nbytes = int(df.memory_usage(index=True, deep=True).sum())
+    store = SessionDatasetStore(data_dir=str(tmp_path), max_bytes=int(nbytes * 2.5))
+
+    for key in ["a", "b", "c"]:
+        store.put(key, df.copy())
+
+    assert store.stats()["entries"] == 2
+    assert store.stats()["bytes"] <= store.max_bytes
+    # "a" was evicted and is not on disk either
+    with pytest.raises(FileNotFoundError):
+        store.get_dataset("a")
+
+
+def test_store_save_replaces_cleaned_version(tmp_path):
+    """Test that saving a new cleaned version repoints the session at it."""
+    store = SessionDatasetStore(data_dir=str(tmp_path))
+    store.save("s1", CLEANED, _make_frame(10))
+    store.save("s1", CLEANED, _make_frame(20))
+    assert len(store.get("s1", CLEANED)) == 20
+
+    store.invalidate("s1")
+    misses = store.stats()["misses"]
+    assert len(store.get("s1", CLEANED)) == 20
+    assert store.stats()["misses"] == misses + 1
+
+
+@pytest.mark.asyncio
+async def test_analysis_cache_coalesces_concurrent_requests():
+    """Test that concurrent identical analyses run once and share the result."""
+    cache = AnalysisCache()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.05)
+        return {"value": 42}
+
+    results = await asyncio.gather(*[cache.get_or_compute(("eda", "k"), compute) for _ in range(5)])
+
+    assert len(calls) == 1
+    assert all(r == {"value": 42} for r in results)
+    assert await cache.get_or_compute(("eda", "k"), compute) == {"value": 42}
+    assert cache.stats()["coalesced"] == 4
+
+
+@pytest.mark.asyncio
+async def test_analysis_cache_survives_cancelled_owner():
+    """Test that cancelling the request that started a computation does not strand its waiters."""
+    cache = AnalysisCache()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        if len(calls) == 1:
+            time.sleep(0.2)
+        return {"value": len(calls)}
+
+    owner = asyncio.create_task(cache.get_or_compute(("eda", "k"), compute))
+    await asyncio.sleep(0.05)
+    waiter = asyncio.create_task(cache.get_or_compute(("eda", "k"), compute))
+    await asyncio.sleep(0.01)
+    owner.cancel()
+
+    # The waiter takes over and computes on its own
+    assert await asyncio.wait_for(waiter, timeout=5) == {"value": 2}
+    with pytest.raises(asyncio.CancelledError):
+        await owner
+    assert cache.stats()["in_flight"] == 0
+
+
+def test_datalab_flow_on_sample(client, sample_session):
+    """Test the preview -> EDA -> impute -> compare -> train flow on the sample dataset."""
+    preview = client.get(f"/api/datalab/preview/{sample_session}")
+    assert preview.status_code == 200
+    assert len(preview.json()["rows"]) == 5
+
+    eda = client.get(f"/api/datalab/eda/{sample_session}")
+    assert eda.status_code == 200
+    assert eda.json()["target_col"] == "Potability"
+    # Served from the analysis cache the second time
+    assert client.get(f"/api/datalab/eda/{sample_session}").json() == eda.json()
+
+    impute = client.post(f"/api/datalab/impute/{sample_session}", json={"ph": "median", "Sulfate": "mean"})
+    assert impute.status_code == 200
+    assert impute.json()["remaining_nulls"]["ph"] == 0
+
+    compare = client.get(f"/api/datalab/compare/{sample_session}")
+    assert compare.status_code == 200
+    assert "ph" in compare.json()["comparisons"]
+
+    export = client.get(f"/api/datalab/export/{sample_session}")
+    assert export.status_code == 200
+    assert export.text.splitlines()[0].startswith("ph,Hardness")
+
+    train = client.post(f"/api/datalab/train/{sample_session}",
+                        json={"model_type": "Logistic Regression", "params": {}})
+    assert train.status_code == 200
+    assert 0 <= train.json()["accuracy"] <= 1
+
+
+def test_streaming_eda_matches_in_memory():
+    """Test that the chunked two-pass EDA reproduces the in-memory result."""
+    df = pd.read_csv("Data/water_potability.csv")
+    exact = compute_eda(df)
+    chunks = lambda: (df.iloc[i:i + 500] for i in range(0, len(df), 500))
+    streamed = compute_eda_streaming(chunks)
+
+    assert streamed["total_rows"] == exact["total_rows"]
+    assert streamed["null_counts"] == exact["null_counts"]
+    assert streamed["histograms"] == exact["histograms"]
+    assert streamed["class_distribution"] == exact["class_distribution"]
+    for col, stats in exact["description"].items():
+        for key, value in stats.items():
+            assert streamed["description"][col][key] == pytest.approx(value, rel=1e-9)
+    for col, stats in exact["boxplot_data"].items():
+        assert streamed["boxplot_data"][col] == pytest.approx(stats)
+    exact_corr = [c["value"] for c in exact["correlation_matrix"]]
+    streamed_corr = [c["value"] for c in streamed["correlation_matrix"]]
+    assert streamed_corr == pytest.approx(exact_corr, abs=1e-9)
+
+
+def test_sampled_eda_bounds():
+    """Test that sampled EDA scales counts, keeps exact class counts and reports error bounds."""
+    df = pd.read_csv("Data/water_potability.csv")
+    exact = compute_eda(df)
+
+    approx = compute_eda_sampled(df, 1000)
+    assert approx["approximate"] is True
+    assert approx["sample_size"] == pytest.approx(1000, abs=2)
+    assert approx["class_distribution"] == exact["class_distribution"]
+    for col, bound in approx["error_bounds"]["mean"].items():
+        assert abs(approx["description"][col]["mean"] - exact["description"][col]["mean"]) <= 2 * bound
+
+    full = compute_eda_sampled(df, len(df))
+    assert full["approximate"] is False
+    assert full["error_bounds"]["correlation"] == pytest.approx(0.0, abs=1e-12)
+
+
+def test_progressive_eda_reads_only_sampled_rows(tmp_path):
+    """Test that progressive EDA stratifies once and never loads the whole dataset."""
+    csv_path = tmp_path / "upload.csv"
+    pd.read_csv("Data/water_potability.csv").to_csv(csv_path, index=False)
+    SessionDatasetStore(data_dir=str(tmp_path)).ingest_csv("s1", RAW, str(csv_path))
+    store = SessionDatasetStore(data_dir=str(tmp_path))
+
+    strata = TargetStrata(store.get("s1", RAW, columns=["Potability"])["Potability"])
+    sizes = []
+
+    def take(rows):
+        sizes.append(len(rows))
+        return store.take("s1", rows, RAW)
+
+    result = compute_eda_progressive(strata, take, time_budget=60, initial_sample=500)
+    assert sizes[0] == pytest.approx(500, abs=2) and sizes[-1] == 3276
+    assert result["approximate"] is False
+    # No round loaded (and cached) the whole frame
+    assert store.stats()["entries"] == 0
+    assert result["class_distribution"] == compute_eda(store.get("s1", RAW))["class_distribution"]
+
+
+def test_progressive_eda_refines_in_background(client, sample_session):
+    """Test that progressive EDA answers from a sample and the exact result becomes available."""
+    approx = client.get(f"/api/datalab/eda/{sample_session}", params={"mode": "progressive", "budget_ms": 1})
+    assert approx.status_code == 200
+    assert approx.json()["total_rows"] == 3276
+
+    status = client.get(f"/api/datalab/eda/{sample_session}/status", params={"wait_ms": 5000})
+    assert status.json()["status"] == "complete"
+    assert status.json()["result"]["total_rows"] == 3276
+
+
+def test_training_job_lifecycle(client, sample_session):
+    """Test that a background training job reports progress and returns the /train result."""
+    submitted = client.post(f"/api/datalab/jobs/train/{sample_session}",
+                            json={"model_type": "Random Forest", "params": {"n_estimators": 20}})
+    assert submitted.status_code == 202
+    job_id = submitted.json()["job_id"]
+
+    job = job_manager.wait(job_id, timeout=120)
+    assert job.status == "succeeded", job.error
+
+    status = client.get(f"/api/datalab/jobs/{job_id}").json()
+    assert status["progress"] == 1.0
+    result = client.get(f"/api/datalab/jobs/{job_id}/result").json()
+    assert 0 <= result["accuracy"] <= 1
+    assert client.get(f"/api/datalab/download_model/{sample_session}").status_code == 200
+
+
+def test_training_job_cancellation(client, sample_session):
+    """Test that a running job can be cancelled."""
+    submitted = client.post(f"/api/datalab/jobs/train/{sample_session}",
+                            json={"model_type": "Random Forest", "params": {"n_estimators": 5000}})
+    job_id = submitted.json()["job_id"]
+
+    cancelled = client.delete(f"/api/datalab/jobs/{job_id}")
+    assert cancelled.status_code == 200
+    assert cancelled.json()["status"] == "cancelled"
+    assert client.get(f"/api/datalab/jobs/{job_id}/result").status_code == 500
+
+
+def test_cancel_joins_worker_outside_the_lock():
+    """Test that cancelling a job waits for its worker without holding the manager lock."""
+    manager = JobManager()
+
+    class SlowWorker:
+        joined_with_lock_free = None
+        pid = None
+
+        def is_alive(self):
+            return True
+
+        def terminate(self):
+            pass
+
+        def join(self, timeout=None):
+            free = manager._lock.acquire(blocking=False)
+            if free:
+                manager._lock.release()
+            SlowWorker.joined_with_lock_free = free
+
+    job = Job("train", print, (), {}, 60, {})
+    job.status, job.process = RUNNING, SlowWorker()
+    manager._jobs[job.id] = job
+
+    assert manager.cancel(job.id)
+    assert job.status == CANCELLED
+    assert SlowWorker.joined_with_lock_free is True
+
+
+def _pid_after(seconds):
+    time.sleep(seconds)
+    return os.getpid()
+
+
+def _pool_job(progress):
+    """Job target that starts a two-worker loky pool and keeps it busy."""
+    from joblib.externals.loky import get_reusable_executor
+    executor = get_reusable_executor(max_workers=2)
+    pids = sorted({f.result() for f in [executor.submit(_pid_after, 1) for _ in range(2)]})
+    progress(0.5, "pool", pids=pids)
+    executor.submit(time.sleep, 300)
+    time.sleep(300)
+
+
+def _process_alive(pid):
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            return f.read().rsplit(")", 1)[1].split()[0] != "Z"
+    except FileNotFoundError:
+        return False
+
+
+@pytest.mark.skipif(not os.path.isdir("/proc") or not hasattr(os, "killpg"), reason="needs POSIX process groups")
+def test_cancel_stops_pool_workers_of_a_job():
+    """Test that cancelling a job also stops the joblib/loky workers it started."""
+    manager = JobManager()
+    job = manager.submit("pool", _pool_job)
+    deadline = time.time() + 60
+    while "pids" not in job.details and time.time() < deadline:
+        time.sleep(0.1)
+    pids = job.details["pids"]
+    assert pids and all(_process_alive(pid) for pid in pids)
+
+    assert manager.cancel(job.id)
+    deadline = time.time() + 10
+    while any(_process_alive(pid) for pid in pids) and time.time() < deadline:
+        time.sleep(0.1)
+    assert not any(_process_alive(pid) for pid in pids)
+
+
+def test_train_compare_ranks_candidates(client, sample_session):
+    """Test that several configurations are trained on one split and ranked."""
+    response = client.post(f"/api/datalab/train_compare/{sample_session}", json={
+        "configs": [
+            {"model_type": "Random Forest", "params": {"n_estimators": 30}},
+            {"model_type": "Gradient Boosting", "params": {"n_estimators": 30}},
+            {"model_type": "Logistic Regression", "params": {}},
+        ],
+        "n_jobs": 2,
+        "rank_by": "f1_score",
+    })
+    assert response.status_code == 200
+    data = response.json()
+
+    assert [r["rank"] for r in data["ranking"]] == [1, 2, 3]
+    scores = [r["f1_score"] for r in data["ranking"]]
+    assert scores == sorted(scores, reverse=True)
+    assert len(data["history"]) >= 3
+    assert data["worker_processes"] >= 1
+
+
+def test_hist_gradient_boosting_trains_on_missing_values(client, sample_session):
+    """Test that histogram boosting trains on unimputed data and reports the usual metrics."""
+    response = client.post(f"/api/datalab/train/{sample_session}",
+                           json={"model_type": "Histogram Gradient Boosting", "params": {"max_iter": 50}})
+    assert response.status_code == 200
+    data = response.json()
+
+    assert 0 <= data["auc_score"] <= 1
+    assert len(data["threshold_curves"]) == 21
+    assert len(data["feature_importance"]) > 0
+    assert client.get(f"/api/datalab/download_model/{sample_session}").status_code == 200
+
+
+def test_sweeper_expires_idle_sessions_and_collects_datasets(tmp_path):
+    """Test TTL expiry, reference-counted dataset GC and LRU eviction under the quota."""
+    store = SessionDatasetStore(data_dir=str(tmp_path))
+    lifecycle = SessionLifecycleManager(store=store, ttl_s=3600, quota_bytes=10 ** 9)
+    shared, own = _make_frame(100), _make_frame(200)
+    store.save("old", RAW, shared)
+    store.save("old", CLEANED, own)
+    store.save("new", RAW, shared)
+    shared_key, own_key = store.dataset_key("old", RAW), store.dataset_key("old", CLEANED)
+
+    now = time.time()
+    os.utime(store.manifest_path("old"), (now - 7200, now - 7200))
+    result = lifecycle.sweep(now=now)
+
+    assert result["expired"] == [session_ref("old")]
+    assert not os.path.exists(store.manifest_path("old"))
+    # Still referenced by "new"
+    assert columnar_exists(store.dataset_path(shared_key))
+    assert not os.path.exists(store.dataset_path(own_key))
+    assert result["datasets_removed"] == 1
+
+    # Files without a session manifest (e.g. legacy CSVs) are neither counted nor removed
+    legacy = tmp_path / "legacy_raw.csv"
+    legacy.write_text("a,b\n1,2\n")
+    os.utime(legacy, (now - 7200, now - 7200))
+    lifecycle.quota_bytes = 0
+    assert lifecycle.sweep(now=now)["evicted"] == [session_ref("new")]
+    assert lifecycle.usage()["total_bytes"] == 0
+    assert legacy.exists()
+
+
+def test_admin_usage_requires_token_and_hides_session_ids(client, sample_session, monkeypatch):
+    """Test that admin endpoints need the admin token and never expose raw session IDs."""
+    assert client.get("/api/datalab/admin/usage").status_code == 403
+    monkeypatch.setattr(datalab, "ADMIN_TOKEN", "secret")
+    assert client.get("/api/datalab/admin/usage").status_code == 401
+    assert client.post("/api/datalab/admin/sweep", headers={"X-Admin-Token": "wrong"}).status_code == 401
+
+    response = client.get("/api/datalab/admin/usage", headers={"X-Admin-Token": "secret"})
+    assert response.status_code == 200
+    assert sample_session not in response.text
+    usage = response.json()
+    row = next(r for r in usage["sessions"] if r["session_ref"] == session_ref(sample_session))
+    assert row["dataset_bytes"] > 0
+    assert usage["total_bytes"] >= row["bytes"] + row["dataset_bytes"]
+
+
+def test_upload_stream_parses_in_chunks(tmp_path):
+    """Test that tiny chunks, quoted newlines and mixed chunk dtypes parse like one read_csv."""
+    csv = b'a,b,c\n1,"x\ny",1\n2,z,2.5\n3,w,\n4,v,7'
+    writer = ColumnarWriter(str(tmp_path))
+    stream = CSVUploadStream("t.csv", max_bytes=10 ** 6, writer=writer, batch_bytes=1)
+    for i in range(0, len(csv), 3):
+        stream.feed(csv[i:i + 3])
+    stream.finish()
+    writer.commit(str(tmp_path / "ds"))
+
+    assert stream.rows == 4
+    assert stream.dtypes() == {"a": "int", "b": "text", "c": "float"}
+    expected = pd.read_csv(io.BytesIO(csv))
+    pd.testing.assert_frame_equal(read_columnar(str(tmp_path / "ds")), expected, check_dtype=False)
+
+
+def test_columnar_writer_matches_write_columnar(tmp_path):
+    """Test that a dataset appended in chunks is stored exactly like the concatenated frame."""
+    chunks = [
+        pd.DataFrame({"i": [1, 2], "f": [0.5, 1.5], "t": ["a", "b"], "m": [1, 2], "e": [True, False]}),
+        pd.DataFrame({"i": [3, 400], "f": [np.nan, 2.0], "t": [None, "é"], "m": ["x", None], "e": [False, True]}),
+        pd.DataFrame({"i": [5, 6], "f": [np.nan, np.nan], "t": ["c", "d"], "m": [3.5, 4.0], "e": [True, True]}),
+    ]
+    writer = ColumnarWriter(str(tmp_path))
+    for chunk in chunks:
+        writer.append(chunk)
+    assert writer.kinds() == {"i": "int", "f": "float", "t": "text", "m": "text", "e": "bool"}
+    writer.commit(str(tmp_path / "streamed"))
+
+    df = pd.concat(chunks, ignore_index=True)
+    df["m"] = df["m"].map(lambda v: None if pd.isna(v) else str(v))
+    write_columnar(df, str(tmp_path / "whole"))
+    assert read_schema(str(tmp_path / "streamed")) == read_schema(str(tmp_path / "whole"))
+    pd.testing.assert_frame_equal(read_columnar(str(tmp_path / "streamed")), read_columnar(str(tmp_path / "whole")))
+    assert sorted(os.listdir(tmp_path)) == ["streamed", "whole"]
+
+
+def test_record_splitter_scans_each_byte_once():
+    """Test that a quoted field spanning many blocks is split in linear time."""
+    splitter = RecordSplitter()
+    assert splitter.feed(b'a,b\n1,"') == b"a,b\n"
+    # 20 MB quoted field in 1 KB blocks: re-counting quotes from the start would take minutes
+    block = b"x\n" * 512
+    start = time.perf_counter()
+    for _ in range(20 * 1024):
+        assert splitter.feed(block) == b""
+    assert time.perf_counter() - start < 10
+    assert splitter.feed(b'""y"\n2,z') == b'1,"' + block * 20 * 1024 + b'""y"\n'
+    assert splitter.rest() == b"2,z"
+
+
+def test_upload_gzip_dedups_with_plain_and_enforces_limits(client, monkeypatch):
+    """Test gzip uploads, content-keyed dedup, early header rejection and the size limit."""
+    with open("Data/water_potability.csv", "rb") as f:
+        raw = f.read()
+    plain = client.post("/api/datalab/upload", files={"file": ("w.csv", raw)})
+    packed = client.post("/api/datalab/upload", files={"file": ("w.csv.gz", gzip.compress(raw))})
+    assert plain.status_code == packed.status_code == 200
+    assert packed.json()["compression"] == "gzip"
+    assert packed.json()["rows"] == 3276
+    assert packed.json()["dtypes"]["Potability"] == "int"
+    sessions = [plain.json()["session_id"], packed.json()["session_id"]]
+    assert datalab.session_store.dataset_key(sessions[0], RAW) == datalab.session_store.dataset_key(sessions[1], RAW)
+
+    bad = client.post("/api/datalab/upload", files={"file": ("bad.csv", b"onlyone\n1\n")})
+    assert bad.status_code == 400
+
+    body = client.post("/api/datalab/upload", params={"filename": "w.csv.gz"}, content=gzip.compress(raw),
+                       headers={"Content-Type": "application/octet-stream"})
+    assert body.status_code == 200
+    sessions.append(body.json()["session_id"])
+    assert datalab.session_store.dataset_key(sessions[2], RAW) == datalab.session_store.dataset_key(sessions[0], RAW)
+    assert client.post("/api/datalab/upload", files={"file": ("w.txt", raw)}).status_code == 400
+
+    monkeypatch.setattr(datalab, "MAX_UPLOAD_BYTES", 1000)
+    assert client.post("/api/datalab/upload", files={"file": ("w.csv", raw)}).status_code == 413
+    # Rejected uploads leave no staging directories behind
+    assert not [d for d in os.listdir(os.path.join(TEMP_DATA_DIR, "datasets")) if d.startswith(".")]
+
+    for session_id in sessions:
+        for path in glob.glob(os.path.join(TEMP_DATA_DIR, f"{session_id}_*")):
+            os.remove(path)
+
+
+def test_train_with_cross_validation(client, sample_session):
+    """Test that k-fold mode reports mean and std per metric and reuses cached folds."""
+    config = {"model_type": "Logistic Regression", "params": {}, "cv_folds": 4}
+    first = client.post(f"/api/datalab/train/{sample_session}", json=config)
+    assert first.status_code == 200
+    cv = first.json()["cross_validation"]
+
+    assert cv["folds"] == 4
+    assert len(cv["fold_metrics"]) == 4
+    for name in ["accuracy", "f1_score", "precision", "recall", "auc_score"]:
+        assert 0 <= cv["metrics"][name]["mean"] <= 1
+        assert cv["metrics"][name]["std"] >= 0
+
+    # Same folds, same deterministic model: identical fold scores
+    second = client.post(f"/api/datalab/train/{sample_session}", json=config).json()["cross_validation"]
+    assert second["fold_metrics"] == cv["fold_metrics"]
+
+
+def test_cross_validation_runs_inside_training_job(client, sample_session):
+    """Test that fold workers can be started from a background job process."""
+    submitted = client.post(f"/api/datalab/jobs/train/{sample_session}",
+                            json={"model_type": "Random Forest", "params": {"n_estimators": 10}, "cv_folds": 3})
+    job = job_manager.wait(submitted.json()["job_id"], timeout=120)
+    assert job.status == "succeeded", job.error
+    assert job.result["cross_validation"]["folds"] == 3
+    # The worker left its fold assignment beside the dataset for later jobs
+    store = datalab.session_store
+    dataset_dir = store.path_for(sample_session, store.latest_version(sample_session))
+    assert glob.glob(os.path.join(dataset_dir, "folds_3_*.npy"))
+
+    # With a two-core budget the folds run in a pool started by the job, not inline
+    job = job_manager.submit("train", train_session_model,
+                             args=(sample_session, "Random Forest", {"n_estimators": 10}, 2, 3))
+    job = job_manager.wait(job.id, timeout=120)
+    assert job.status == "succeeded", job.error
+    assert job.result["cross_validation"]["worker_processes"] >= 1
+
+
+def test_rung_schedule_halves_trials():
+    """Test that each rung keeps 1/eta of the trials on eta times the data."""
+    assert rung_schedule(27, 3, 27_000) == [(27, 1000), (9, 3000), (3, 9000), (1, 27_000)]
+    # Rungs too small to rank anything are skipped
+    assert rung_schedule(27, 3, 2000)[0] == (27, 223)
+
+
+def test_hyperparameter_search_job(client, sample_session):
+    """Test that a search job streams a leaderboard and returns the retrained winner."""
+    submitted = client.post(f"/api/datalab/jobs/search/{sample_session}",
+                            json={"model_type": "Logistic Regression", "n_trials": 9, "eta": 3, "n_jobs": 2})
+    assert submitted.status_code == 202
+    job = job_manager.wait(submitted.json()["job_id"], timeout=180)
+    assert job.status == "succeeded", job.error
+
+    result = client.get(f"/api/datalab/jobs/{job.id}/result").json()
+    assert "C" in result["best_params"]
+    assert result["leaderboard"][0]["params"] == result["best_params"]
+    assert result["compute_fraction"] < 1
+    assert 0 <= result["auc_score"] <= 1
+    status = client.get(f"/api/datalab/jobs/{job.id}").json()
+    assert len(status["details"]["leaderboard"]) > 0
+    # Trials ran in a process pool started by the job, not one by one inside it
+    assert result["trial_processes"] >= 1
+
+    # Reported metrics are the winner's on the hold-out split, which selection never saw
+    X, y, _ = load_training_data(sample_session)
+    _, X_test, _, y_test = split_data(X, y)
+    with open(result["model_path"], "rb") as f:
+        model = pickle.load(f)
+    assert result["accuracy"] == pytest.approx(accuracy_score(y_test, model.predict(X_test)))
+
+
+def test_to_columnar_layout():
+    """Test that uniform record lists become parallel arrays and correlations a matrix."""
+    result = {
+        "roc_curve": [{"fpr": 0.0, "tpr": 0.0}, {"fpr": 1.0, "tpr": 1.0}],
+        "correlation_matrix": [{"x": a, "y": b, "value": 1.0 if a == b else 0.5}
+                               for a in ("ph", "Sulfate") for b in ("ph", "Sulfate")],
+        "histograms": {"ph": [{"name": "0-1", "count": 3}], "empty": []},
+        "mixed": [{"a": 1}, {"b": 2}],
+    }
+    columnar = to_columnar(result)
+    assert columnar["roc_curve"] == {"fpr": [0.0, 1.0], "tpr": [0.0, 1.0]}
+    assert columnar["correlation_matrix"] == {"columns": ["ph", "Sulfate"], "values": [[1.0, 0.5], [0.5, 1.0]]}
+    assert columnar["histograms"] == {"ph": {"name": ["0-1"], "count": [3]}, "empty": []}
+    assert columnar["mixed"] == [{"a": 1}, {"b": 2}]
+    # The input (possibly a cached result) is left untouched
+    assert isinstance(result["roc_curve"], list)
+    assert dumps({"v": np.float32(0.5), "a": np.arange(2)}) == b'{"v":0.5,"a":[0,1]}'
+
+
+def test_columnar_format_matches_rows(client, sample_session):
+    """Test that format=columnar carries the same EDA and training data in parallel arrays."""
+    rows = client.get(f"/api/datalab/eda/{sample_session}").json()
+    columnar = client.get(f"/api/datalab/eda/{sample_session}", params={"format": "columnar"})
+    assert columnar.status_code == 200
+    columnar = columnar.json()
+    assert columnar["format"] == "columnar"
+
+    matrix = columnar["correlation_matrix"]
+    n = len(matrix["columns"])
+    assert len(rows["correlation_matrix"]) == n * n
+    for cell in rows["correlation_matrix"][:n + 1]:
+        i, j = matrix["columns"].index(cell["x"]), matrix["columns"].index(cell["y"])
+        assert matrix["values"][i][j] == pytest.approx(cell["value"])
+    assert columnar["histograms"]["ph"]["count"] == [b["count"] for b in rows["histograms"]["ph"]]
+
+    train = client.post(f"/api/datalab/train/{sample_session}", params={"format": "columnar"},
+                        json={"model_type": "Logistic Regression", "params": {}})
+    assert train.status_code == 200
+    curves = train.json()["threshold_curves"]
+    assert set(curves) == {"threshold", "precision", "recall", "f1"}
+    assert len(curves["threshold"]) == len(curves["f1"]) > 0
+
+    assert client.get(f"/api/datalab/eda/{sample_session}", params={"format": "xml"}).status_code == 422
+
+
+def test_eda_etag_and_compression(client, sample_session):
+    """Test that EDA is gzip-compressed, tagged per encoding and revalidated with a 304."""
+    first = client.get(f"/api/datalab/eda/{sample_session}", headers={"Accept-Encoding": "gzip"})
+    assert first.status_code == 200
+    assert first.headers["content-encoding"] == "gzip"
+    assert first.headers["etag"].endswith('-gzip"')
+    assert "Accept-Encoding" in first.headers["vary"]
+
+    cached = client.get(f"/api/datalab/eda/{sample_session}", headers={"If-None-Match": first.headers["etag"]})
+    assert cached.status_code == 304
+    assert cached.content == b""
+    assert cached.headers["etag"] == first.headers["etag"]
+
+    # Another format is another representation
+    columnar = client.get(f"/api/datalab/eda/{sample_session}", params={"format": "columnar"},
+                          headers={"If-None-Match": first.headers["etag"]})
+    assert columnar.status_code == 200
+
+    plain = client.get(f"/api/datalab/eda/{sample_session}", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in plain.headers
+    assert plain.json() == first.json()
+
+
+def test_uncompressed_small_body_keeps_its_etag_on_304():
+    """Test that a body below the compression threshold is revalidated under the same plain ETag."""
+    small = FastAPI()
+
+    @small.get("/small")
+    def small_response(request: Request):
+        etag = make_etag("small")
+        if is_fresh(request, etag):
+            return not_modified(etag)
+        return JSONResponse({"ok": True}, headers=cache_headers(etag))
+
+    small.add_middleware(CompressionMiddleware)
+    with TestClient(small) as small_client:
+        first = small_client.get("/small", headers={"Accept-Encoding": "gzip"})
+        cached = small_client.get("/small", headers={"Accept-Encoding": "gzip",
+                                                     "If-None-Match": first.headers["etag"]})
+
+    assert "content-encoding" not in first.headers
+    assert cached.status_code == 304
+    assert cached.headers["etag"] == first.headers["etag"] == make_etag("small")
+
+
+def test_negotiate_accept_encoding():
+    """Test that Accept-Encoding q-values are honoured and unknown encodings ignored."""
+    assert negotiate("gzip, deflate") == "gzip"
+    assert negotiate("deflate") is None
+    assert negotiate("") is None
+    assert negotiate("gzip;q=0") is None
+    assert negotiate("*") in ("br", "gzip")
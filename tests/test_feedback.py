@@ -0,0 +1,94 @@
+"""
+Unit tests for labeled feedback and incremental model refresh.
+"""
+
+import json
+
+import joblib
+import pandas as pd
+import pytest
+from httpx import AsyncClient, ASGITransport
+from sklearn.ensemble import RandomForestClassifier
+
+from backend.app import feedback
+from backend.app.feedback import FeedbackStore, refresh_model, FEATURES
+from backend.app.main import app
+
+
+@pytest.fixture
+def model_dir(tmp_path):
+    """A small production-style model directory trained on the first half of the dataset."""
+    df = pd.read_csv("Data/water_potability.csv")
+    imputer_values = df.median().to_dict()
+    df = df.fillna(imputer_values).iloc[:1500]
+    model = RandomForestClassifier(n_estimators=40, max_depth=6, random_state=42, class_weight='balanced')
+    model.fit(df[FEATURES], df["Potability"])
+
+    joblib.dump(model, tmp_path / "water_quality_model.pkl")
+    (tmp_path / "imputer_values.json").write_text(json.dumps(imputer_values))
+    (tmp_path / "optimal_threshold.json").write_text(json.dumps({"threshold": 0.5}))
+    return tmp_path
+
+
+def _feed(store, rows):
+    for _, row in rows.iterrows():
+        store.append(row[FEATURES].to_dict(), row["Potability"])
+
+
+def test_refresh_grows_forest_and_retires_oldest_trees(model_dir, tmp_path):
+    """Test that a refresh adds trees fit on new feedback and keeps the forest size."""
+    store = FeedbackStore(str(tmp_path / "feedback"))
+    df = pd.read_csv("Data/water_potability.csv")
+    original = joblib.load(model_dir / "water_quality_model.pkl")
+
+    _feed(store, df.iloc[1500:1700])
+    result = refresh_model(store, str(model_dir), trees_per_refresh=10, rebuild_explainer=False)
+
+    assert result["status"] == "refreshed"
+    assert result["new_rows"] == 200
+    assert result["train_rows"] == 160
+    assert result["trees_retired"] == 10
+    model = joblib.load(model_dir / "water_quality_model.pkl")
+    assert len(model.estimators_) == 40
+    # The ten oldest trees were dropped
+    assert (model.estimators_[0].tree_.threshold == original.estimators_[10].tree_.threshold).all()
+    assert result["threshold"] is not None
+
+    # Only rows added after the refresh are read next time
+    assert refresh_model(store, str(model_dir), rebuild_explainer=False)["status"] == "skipped"
+    _feed(store, df.iloc[1700:1730])
+    new_rows, _ = store.unconsumed()
+    assert len(new_rows) == 30
+    assert store.state()["consumed_rows"] == 200
+
+
+def test_unconsumed_stops_at_last_complete_row(tmp_path):
+    """Test that a partially written row is left for the next refresh instead of being split."""
+    store = FeedbackStore(str(tmp_path / "feedback"))
+    df = pd.read_csv("Data/water_potability.csv").fillna(0)
+    _feed(store, df.iloc[:3])
+    with open(store.samples_path, "ab") as f:
+        f.write(b"7.1,200")  # an append in progress
+    rows, end = store.unconsumed()
+    assert len(rows) == 3
+    store.mark_consumed(end, len(rows))
+
+    with open(store.samples_path, "ab") as f:
+        f.write(b",20000,7,300,400,15,60,4,1,0.5,1700000000\n")
+    rows, _ = store.unconsumed()
+    assert len(rows) == 1 and rows.iloc[0]["ph"] == 7.1
+
+
+@pytest.mark.asyncio
+async def test_feedback_endpoint_stores_sample(tmp_path, monkeypatch):
+    """Test that the feedback endpoint appends to the retraining store."""
+    monkeypatch.setattr(feedback, "feedback_store", FeedbackStore(str(tmp_path)))
+    sample = {f: 1.0 for f in FEATURES}
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        response = await client.post("/api/feedback", json={**sample, "potable": True})
+        status = await client.get("/api/feedback/status")
+
+    assert response.status_code == 200
+    assert response.json()["pending_rows"] == 1
+    assert status.json()["pending_rows"] == 1
@@ -81,3 +81,31 @@ def test_imputer_has_all_columns():
     
     for col in expected_cols:
         assert col in imputer, f"Missing imputer value for {col}"
+
+
+def test_threshold_analysis_matches_sklearn():
+    """Test that the vectorised threshold sweep agrees with sklearn at every threshold."""
+    import numpy as np
+    from sklearn.metrics import precision_score, recall_score, f1_score
+    from backend.app.threshold_analysis import ThresholdAnalysis
+
+    rng = np.random.default_rng(0)
+    y_true = rng.integers(0, 2, 300)
+    # Rounded scores produce ties, like forest vote fractions
+    y_score = np.round(np.clip(0.3 * y_true + rng.random(300) * 0.7, 0, 1), 2)
+    analysis = ThresholdAnalysis(y_true, y_score)
+
+    assert len(analysis.thresholds) == len(np.unique(y_score))
+    grid = np.linspace(0, 1, 21)
+    for t, point in zip(grid, analysis.at(grid)):
+        y_pred = (y_score >= t).astype(int)
+        assert point["precision"] == pytest.approx(precision_score(y_true, y_pred, zero_division=0))
+        assert point["recall"] == pytest.approx(recall_score(y_true, y_pred, zero_division=0))
+        assert point["f1"] == pytest.approx(f1_score(y_true, y_pred, zero_division=0))
+
+    best = analysis.optimal_threshold(min_recall=0.9)
+    brute = max((f1_score(y_true, (y_score >= t).astype(int)), -t) for t in np.unique(y_score)
+                if recall_score(y_true, (y_score >= t).astype(int)) >= 0.9)
+    assert best["f1"] == pytest.approx(brute[0])
+    assert best["threshold"] == pytest.approx(-brute[1])
+    assert best["recall"] >= 0.9
@@ -0,0 +1,86 @@
+"""
+Unit tests for the sliding-window online evaluation of live predictions.
+"""
+
+import pytest
+
+from backend.app.online_eval import OnlineEvaluator
+
+
+def test_join_metrics_and_calibration():
+    """Test that labels join their predictions and drive windowed metrics and calibration."""
+    ev = OnlineEvaluator(windows={"1h": 3600})
+    ev.record_prediction("a", 0.9, 0.5, now=0)
+    ev.record_prediction("b", 0.2, 0.5, now=0)
+    ev.record_prediction("c", 0.7, 0.5, now=0)
+
+    assert ev.record_label(True, "a", now=10) == 0.9
+    ev.record_label(True, "b", now=10)
+    ev.record_label(False, "c", now=10)
+    # Unknown id without a score cannot be evaluated; with a score it can
+    assert ev.record_label(True, "zzz", now=10) is None
+    ev.record_label(False, score=0.1, threshold=0.5, now=10)
+
+    w = ev.snapshot(now=20)["windows"]["1h"]
+    assert (w["tp"], w["fp"], w["fn"], w["tn"]) == (1, 1, 1, 1)
+    assert w["recall"] == 0.5 and w["precision"] == 0.5
+    assert w["brier_score"] == pytest.approx((0.1 ** 2 + 0.8 ** 2 + 0.7 ** 2 + 0.1 ** 2) / 4)
+    top = w["calibration"][9]
+    assert top["count"] == 1 and top["observed_rate"] == 1.0
+    snapshot = ev.snapshot(now=20)
+    assert snapshot["awaiting_label"] == 0 and snapshot["unmatched_labels"] == 1
+
+
+def test_invalid_scores_do_not_corrupt_aggregates():
+    """Test that out-of-range scores fall in the edge bins and non-finite scores are not counted."""
+    ev = OnlineEvaluator(windows={"1h": 3600})
+    ev.record_label(False, score=-0.5, now=0)
+    ev.record_label(True, score=1.5, now=0)
+    assert ev.record_label(True, score=float("nan"), now=0) is None
+    assert ev.record_label(True, score=float("inf"), now=0) is None
+
+    w = ev.snapshot(now=10)["windows"]["1h"]
+    assert (w["tp"], w["fp"], w["fn"], w["tn"]) == (1, 0, 0, 1)
+    assert w["brier_score"] == 0.0
+    assert w["calibration"][0]["count"] == 1 and w["calibration"][9]["count"] == 1
+    assert ev.snapshot(now=10)["unmatched_labels"] == 2
+
+
+def test_window_expiry_keeps_lifetime():
+    """Test that old labels leave the rolling window but stay in lifetime totals."""
+    ev = OnlineEvaluator(windows={"1h": 3600})
+    for i in range(50):
+        ev.record_label(True, score=0.8, now=i * 60)  # one label a minute for 50 minutes
+    assert ev.snapshot(now=3000)["windows"]["1h"]["labeled"] == 50
+
+    # At minute 80 only minutes 21-49 are inside the hour (one-minute buckets)
+    w = ev.snapshot(now=80 * 60)["windows"]
+    assert w["1h"]["labeled"] == 29
+    assert w["lifetime"]["labeled"] == 50
+    # Long after, the window is empty and reports no ratios
+    empty = ev.snapshot(now=10 * 3600)["windows"]["1h"]
+    assert empty["labeled"] == 0 and empty["recall"] is None
+
+
+def test_pending_predictions_are_bounded():
+    """Test that unlabeled predictions are capped in number and expire after their TTL."""
+    ev = OnlineEvaluator(pending_max=3, pending_ttl_s=100)
+    for i in range(5):
+        ev.record_prediction(str(i), 0.5, 0.5, now=i)
+    assert list(ev.pending) == ["2", "3", "4"]
+    ev.record_prediction("late", 0.5, 0.5, now=200)
+    assert list(ev.pending) == ["late"]
+
+
+def test_version_tracks_snapshot_changes():
+    """Test that the version changes exactly when the snapshot can change."""
+    ev = OnlineEvaluator(windows={"1h": 3600}, pending_ttl_s=100)
+    v0 = ev.version(now=0)
+    assert ev.version(now=30) == v0  # same one-minute bucket, nothing happened
+    ev.record_prediction("a", 0.9, 0.5, now=30)
+    v1 = ev.version(now=30)
+    assert v1 != v0
+    # Bucket turnover and pending expiry both change the version
+    assert ev.version(now=61) != v1
+    ev.version(now=200)
+    assert ev.snapshot(now=200)["awaiting_label"] == 0
@@ -0,0 +1,124 @@
+"""
+Tests for the incremental DAG pipeline runner.
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+from src.pipeline.dag import Pipeline, Stage
+
+
+def copy_upper(src, dst, log):
+    with open(log, 'a') as f:
+        f.write(f"{os.path.basename(dst)}\n")
+    with open(src) as f, open(dst, 'w') as out:
+        out.write(f.read().upper())
+
+
+def concat(srcs, dst, log, sep=""):
+    with open(log, 'a') as f:
+        f.write(f"{os.path.basename(dst)}\n")
+    parts = []
+    for src in srcs:
+        with open(src) as f:
+            parts.append(f.read())
+    with open(dst, 'w') as out:
+        out.write(sep.join(parts))
+
+
+def fail():
+    raise RuntimeError("boom")
+
+
+def _pipeline(tmp_path, sep=""):
+    p = {name: str(tmp_path / name) for name in ["raw.txt", "a.txt", "b.txt", "ab.txt", "log.txt"]}
+    stages = [
+        Stage("a", copy_upper, inputs=[p["raw.txt"]], outputs=[p["a.txt"]],
+              params={"src": p["raw.txt"], "dst": p["a.txt"], "log": p["log.txt"]}),
+        Stage("b", copy_upper, inputs=[p["raw.txt"]], outputs=[p["b.txt"]],
+              params={"src": p["raw.txt"], "dst": p["b.txt"], "log": p["log.txt"]}),
+        Stage("ab", concat, inputs=[p["a.txt"], p["b.txt"]], outputs=[p["ab.txt"]],
+              params={"srcs": [p["a.txt"], p["b.txt"]], "dst": p["ab.txt"], "log": p["log.txt"], "sep": sep}),
+    ]
+    return Pipeline(stages, state_path=str(tmp_path / "state.json")), p
+
+
+def _ran(p):
+    with open(p["log.txt"]) as f:
+        ran = f.read().split()
+    os.remove(p["log.txt"])
+    return sorted(ran)
+
+
+def test_runs_in_dependency_order_and_skips_up_to_date_stages(tmp_path):
+    """Test that stages run in dependency order and only rerun when inputs, params or outputs change."""
+    pipeline, p = _pipeline(tmp_path)
+    assert pipeline.upstream["ab"] == {"a", "b"}
+    (tmp_path / "raw.txt").write_text("x")
+
+    status = pipeline.run(jobs=2, log=lambda msg: None)
+    assert set(status.values()) == {"ran"}
+    assert (tmp_path / "ab.txt").read_text() == "XX"
+    assert _ran(p) == ["a.txt", "ab.txt", "b.txt"]
+
+    # Nothing changed: nothing runs
+    assert set(pipeline.run(jobs=1, log=lambda msg: None).values()) == {"skipped"}
+
+    # Param change reruns only that stage
+    pipeline, p = _pipeline(tmp_path, sep="-")
+    assert pipeline.run(jobs=1, log=lambda msg: None)["ab"] == "ran"
+    assert _ran(p) == ["ab.txt"]
+
+    # Changed data reruns everything downstream of it
+    (tmp_path / "raw.txt").write_text("y")
+    pipeline.run(jobs=1, log=lambda msg: None)
+    assert _ran(p) == ["a.txt", "ab.txt", "b.txt"]
+
+    # Rewriting identical content (new mtime) changes no hash, so nothing runs
+    (tmp_path / "raw.txt").write_text("y")
+    assert set(pipeline.run(jobs=1, log=lambda msg: None).values()) == {"skipped"}
+
+    # A deleted output is rebuilt
+    os.remove(p["b.txt"])
+    status = pipeline.run(jobs=1, log=lambda msg: None)
+    assert status["b"] == "ran" and status["a"] == "skipped"
+
+
+def test_declared_code_files_drive_reruns(tmp_path):
+    """Test that editing a stage's declared code file reruns it and a missing one is rejected."""
+    p = {name: str(tmp_path / name) for name in ["raw.txt", "a.txt", "log.txt", "helper.py"]}
+    (tmp_path / "raw.txt").write_text("x")
+    (tmp_path / "helper.py").write_text("VERSION = 1\n")
+
+    def pipeline():
+        return Pipeline([Stage("a", copy_upper, inputs=[p["raw.txt"]], outputs=[p["a.txt"]],
+                               params={"src": p["raw.txt"], "dst": p["a.txt"], "log": p["log.txt"]},
+                               code=[p["helper.py"]])],
+                        state_path=str(tmp_path / "state.json"))
+
+    assert pipeline().run(jobs=1, log=lambda msg: None) == {"a": "ran"}
+    assert pipeline().run(jobs=1, log=lambda msg: None) == {"a": "skipped"}
+    (tmp_path / "helper.py").write_text("VERSION = 2\n")
+    assert pipeline().run(jobs=1, log=lambda msg: None) == {"a": "ran"}
+
+    with pytest.raises(ValueError):
+        Pipeline([Stage("b", fail, outputs=[str(tmp_path / "b")], code=[str(tmp_path / "missing.py")])])
+
+
+def test_failure_blocks_downstream_and_cycles_are_rejected(tmp_path):
+    """Test that a failed stage blocks its downstream stages and cyclic pipelines are rejected."""
+    out = str(tmp_path / "out.txt")
+    pipeline = Pipeline([
+        Stage("broken", fail, outputs=[out]),
+        Stage("after", copy_upper, inputs=[out], outputs=[str(tmp_path / "after.txt")],
+              params={"src": out, "dst": str(tmp_path / "after.txt"), "log": str(tmp_path / "log")}),
+    ], state_path=str(tmp_path / "state.json"))
+    status = pipeline.run(jobs=1, log=lambda msg: None)
+    assert status == {"broken": "failed", "after": "blocked"}
+
+    with pytest.raises(ValueError):
+        Pipeline([Stage("x", fail, inputs=["b"], outputs=["a"]), Stage("y", fail, inputs=["a"], outputs=["b"])])
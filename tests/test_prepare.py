@@ -0,0 +1,68 @@
+"""
+Tests for the shared data-preparation layer used by the training scripts.
+"""
+
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+from sklearn.model_selection import train_test_split
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+from src.data import prepare
+from src.data.prepare import prepare_data
+
+
+def _write_dataset(path, n=60, seed=0):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        "ph": rng.normal(7, 1, n),
+        "Sulfate": rng.normal(330, 40, n),
+        "Potability": rng.integers(0, 2, n),
+    })
+    df.loc[::7, "ph"] = np.nan
+    df.to_csv(path, index=False)
+    return df
+
+
+def test_binary_cache_round_trip_and_invalidation(tmp_path):
+    """Test that the binary cache reproduces the CSV and is re-keyed when the CSV changes."""
+    csv, cache = tmp_path / "data.csv", tmp_path / "cache"
+    df = _write_dataset(csv)
+
+    first, digest = prepare.load_dataset(str(csv), str(cache))
+    assert os.path.exists(cache / f"{digest}.npz")
+    # Served from the .npz, not the CSV
+    prepare._frames.clear()
+    second, _ = prepare.load_dataset(str(csv), str(cache))
+    pd.testing.assert_frame_equal(second, df)
+    assert second["Potability"].dtype == df["Potability"].dtype
+
+    # Editing the CSV changes the key
+    _write_dataset(csv, seed=1)
+    _, new_digest = prepare.load_dataset(str(csv), str(cache))
+    assert new_digest != digest
+
+
+def test_persisted_imputer_values_and_split(tmp_path):
+    """Test that persisted imputer values are applied, refitting uses the medians and the split is stratified."""
+    csv, cache, imputer = tmp_path / "data.csv", tmp_path / "cache", tmp_path / "imputer.json"
+    df = _write_dataset(csv)
+    imputer.write_text(json.dumps({"ph": 99.0, "Sulfate": 1.0, "Potability": 0.0}))
+
+    data = prepare_data(path=str(csv), imputer_path=str(imputer), cache_dir=str(cache))
+    assert not data.X.isna().any().any()
+    assert (data.X.loc[df["ph"].isna(), "ph"] == 99.0).all()
+
+    fitted = prepare_data(fit_imputer=True, path=str(csv), imputer_path=str(imputer), cache_dir=str(cache))
+    assert fitted.imputer_values["ph"] == df["ph"].median()
+
+    # Same partition as train_test_split on the frame itself
+    X_train, X_test, _, _ = train_test_split(
+        df.drop("Potability", axis=1), df["Potability"], test_size=0.2, random_state=42, stratify=df["Potability"]
+    )
+    assert list(data.X_train.index) == list(X_train.index)
+    assert list(data.X_test.index) == list(X_test.index)
@@ -0,0 +1,84 @@
+"""
+Unit tests for shadow scoring of candidate models.
+"""
+
+import json
+import os
+import shutil
+
+import joblib
+import pandas as pd
+import pytest
+from httpx import AsyncClient, ASGITransport
+
+from backend.app.main import app
+from backend.app.shadow import ShadowScorer, shadow_scorer
+
+MODEL_PATH = 'backend/app/model/water_quality_model.pkl'
+
+
+@pytest.fixture
+def sample_input():
+    return {
+        "ph": 7.0, "Hardness": 200.0, "Solids": 20000.0, "Chloramines": 7.0,
+        "Sulfate": 300.0, "Conductivity": 400.0, "Organic_carbon": 10.0,
+        "Trihalomethanes": 60.0, "Turbidity": 4.0
+    }
+
+
+@pytest.mark.asyncio
+async def test_shadow_candidate_scores_live_traffic(sample_input):
+    """Test that a shadowed copy of the production model fully agrees with it."""
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        registered = await client.post("/api/shadow/candidates", json={
+            "name": "copy", "model_file": "water_quality_model.pkl", "fraction": 1.0
+        })
+        assert registered.status_code == 200
+        for i in range(10):
+            response = await client.post("/api/predict", json={**sample_input, "ph": 5.0 + i * 0.3})
+            assert response.status_code == 200
+
+        assert shadow_scorer.wait_idle(timeout=30)
+        stats = (await client.get("/api/shadow/candidates")).json()
+        candidate = next(c for c in stats["candidates"] if c["name"] == "copy")
+
+        # Too few samples to promote
+        assert (await client.post("/api/shadow/candidates/copy/promote")).status_code == 409
+        assert (await client.delete("/api/shadow/candidates/copy")).status_code == 200
+
+    assert candidate["samples"] == 10
+    assert candidate["agreement_rate"] == 1.0
+    assert candidate["max_abs_delta"] == pytest.approx(0.0)
+    assert candidate["latency_ms"]["mean"] is not None
+
+
+def test_promote_replaces_artifact_set_and_keeps_backup(tmp_path):
+    """Test that promotion swaps model, threshold, imputer values and importance together."""
+    (tmp_path / "water_quality_model.pkl").write_bytes(b"old")
+    (tmp_path / "imputer_values.json").write_text('{"ph": 1.0}')
+    (tmp_path / "global_feature_importance.json").write_text('[{"feature": "ph", "importance": 9.0}]')
+    candidate_dir = tmp_path / "candidate"
+    candidate_dir.mkdir()
+    shutil.copy(MODEL_PATH, candidate_dir / "new.pkl")
+    (candidate_dir / "new.imputer_values.json").write_text('{"ph": 7.0}')
+
+    scorer = ShadowScorer()
+    candidate = scorer.register("c", str(candidate_dir / "new.pkl"), fraction=1.0, threshold=0.4)
+    candidate.stats.samples = 5
+    reference = pd.read_csv("Data/water_potability.csv").drop(columns="Potability").fillna(0).head(50)
+
+    scorer.promote("c", str(tmp_path), reference, min_samples=5)
+
+    assert (tmp_path / "water_quality_model.previous.pkl").read_bytes() == b"old"
+    assert hasattr(joblib.load(tmp_path / "water_quality_model.pkl"), "predict_proba")
+    assert json.loads((tmp_path / "optimal_threshold.json").read_text()) == {"threshold": 0.4}
+    assert json.loads((tmp_path / "imputer_values.json").read_text()) == {"ph": 7.0}
+    assert json.loads((tmp_path / "imputer_values.previous.json").read_text()) == {"ph": 1.0}
+    # Importance recomputed for the new model on the reference rows
+    importance = json.loads((tmp_path / "global_feature_importance.json").read_text())
+    assert {i["feature"] for i in importance} == set(reference.columns)
+    assert importance[0]["importance"] != 9.0
+    assert (tmp_path / "shap_explainer.pkl").exists()
+    assert not [p for p in os.listdir(tmp_path) if p.endswith(".tmp")]
+    assert scorer.get("c") is None
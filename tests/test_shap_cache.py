@@ -0,0 +1,43 @@
+"""
+Tests for the chunked, incrementally cached SHAP computation.
+"""
+
+import os
+import sys
+
+import joblib
+import numpy as np
+import pandas as pd
+import shap
+from sklearn.ensemble import RandomForestClassifier
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+from src.explainability.shap_cache import compute_shap_values
+
+
+def test_chunked_values_are_exact_and_only_new_rows_are_computed(tmp_path):
+    """Test that chunked SHAP values match one exact call and cached rows are not recomputed."""
+    rng = np.random.default_rng(0)
+    X = pd.DataFrame(rng.normal(size=(120, 4)), columns=["a", "b", "c", "d"])
+    y = (X["a"] + X["b"] > 0).astype(int)
+    model = RandomForestClassifier(n_estimators=10, max_depth=4, random_state=0).fit(X, y)
+    model_path = tmp_path / "model.pkl"
+    joblib.dump(model, model_path)
+    cache = str(tmp_path / "cache")
+
+    values, computed = compute_shap_values(model, X, str(model_path), cache, n_jobs=2, chunk_rows=32)
+    assert computed == 120
+    assert isinstance(values, np.memmap)
+    np.testing.assert_allclose(values, shap.TreeExplainer(model)(X).values)
+
+    # Unchanged data: nothing to compute
+    _, computed = compute_shap_values(model, X, str(model_path), cache)
+    assert computed == 0
+
+    # One edited and two appended rows: only those three are explained
+    X2 = pd.concat([X, X.iloc[:2] + 1], ignore_index=True)
+    X2.iloc[7, 0] = 5.0
+    values2, computed = compute_shap_values(model, X2, str(model_path), cache, n_jobs=1)
+    assert computed == 3
+    np.testing.assert_allclose(values2, shap.TreeExplainer(model)(X2).values)
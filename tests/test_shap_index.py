@@ -0,0 +1,79 @@
+"""
+Tests for the nearest-neighbour SHAP approximation index.
+"""
+
+import os
+import sys
+
+import joblib
+import numpy as np
+import pandas as pd
+import shap
+import pytest
+from sklearn.ensemble import HistGradientBoostingClassifier, RandomForestClassifier
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+from backend.app.shap_index import ShapIndex, file_hash, infer_output, PROBABILITY, LOG_ODDS
+
+
+def _model_and_data():
+    rng = np.random.default_rng(0)
+    X = pd.DataFrame(rng.normal(size=(1500, 3)), columns=["a", "b", "c"])
+    y = (X["a"] - X["b"] > 0).astype(int)
+    model = RandomForestClassifier(n_estimators=10, max_depth=4, random_state=0).fit(X, y)
+    return model, X
+
+
+def test_approximation_within_tolerance_and_fallback(tmp_path):
+    """Test that validated approximations stay within tolerance and far rows fall back to exact SHAP."""
+    model, X = _model_and_data()
+    explainer = shap.TreeExplainer(model)
+    exact = explainer(X).values[:, :, 1]
+    base_value = explainer.expected_value[1]
+    model_path = tmp_path / "model.pkl"
+    joblib.dump(model, model_path)
+
+    index = ShapIndex(X.iloc[:1200], exact[:1200], base_value, X.columns, file_hash(model_path))
+    scores = model.predict_proba(X.iloc[1200:])[:, 1]
+    assert infer_output(base_value, exact[1200:], scores) == PROBABILITY
+    report = index.validate(X.iloc[1200:], exact[1200:], scores, tolerance=0.08)
+    assert report["coverage"] > 0.5
+    assert report["served_p95_row_max_error"] <= 0.08
+
+    # Corrected approximations keep SHAP's additivity
+    score = model.predict_proba(X.iloc[[1250]])[0, 1]
+    values, _ = index.approximate(X.iloc[[1250]].to_numpy(), [score])
+    assert np.isclose(values.sum(), score - base_value)
+
+    # A far outlier falls back to exact computation
+    assert index.explain(np.array([[40.0, -40.0, 40.0]]), 0.5) is None
+
+    # Saved index only loads for the model it was built for
+    index.save(str(tmp_path / "index.pkl"))
+    assert ShapIndex.load(str(tmp_path / "index.pkl"), str(model_path)) is not None
+    joblib.dump(RandomForestClassifier(n_estimators=2).fit(X, 1 - (X["a"] > 0)), model_path)
+    assert ShapIndex.load(str(tmp_path / "index.pkl"), str(model_path)) is None
+
+
+def test_log_odds_models_stay_additive(tmp_path):
+    """Test that boosting models, explained in log-odds, are corrected on that scale."""
+    _, X = _model_and_data()
+    y = (X["a"] - X["b"] > 0).astype(int)
+    model = HistGradientBoostingClassifier(max_iter=30, random_state=0).fit(X, y)
+    explainer = shap.TreeExplainer(model)
+    exact = explainer(X).values
+    base_value = np.atleast_1d(explainer.expected_value)[-1]
+    scores = model.predict_proba(X)[:, 1]
+    assert infer_output(base_value, exact, scores) == LOG_ODDS
+
+    index = ShapIndex(X.iloc[:1200], exact[:1200], base_value, X.columns, "hash", output=LOG_ODDS)
+    report = index.validate(X.iloc[1200:], exact[1200:], scores[1200:], tolerance=0.5)
+    assert report["additivity_max_error"] < 1e-6
+    values, _ = index.approximate(X.iloc[[1250]].to_numpy(), [scores[1250]])
+    assert np.isclose(values.sum(), np.log(scores[1250] / (1 - scores[1250])) - base_value)
+
+    # Probability-scale bookkeeping for a log-odds model is caught by validate
+    wrong = ShapIndex(X.iloc[:1200], exact[:1200], base_value, X.columns, "hash", output=PROBABILITY)
+    with pytest.raises(ValueError):
+        wrong.validate(X.iloc[1200:], exact[1200:], scores[1200:])
@@ -0,0 +1,49 @@
+"""
+Tests for the memory-mapped spatio-temporal tensor store.
+"""
+
+import os
+import sys
+
+import numpy as np
+import scipy.io
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+from backend.app.spatiotemporal_store import SpatioTemporalStore, MAT_PATH
+
+
+def test_store_matches_mat_layout(tmp_path):
+    """Test that the tensor store holds the .mat train and test data in its layout."""
+    store = SpatioTemporalStore.open(MAT_PATH, str(tmp_path))
+    mat = scipy.io.loadmat(MAT_PATH)
+    n_train = mat['X_tr'].shape[1]
+
+    assert store.shape == (n_train + mat['X_te'].shape[1], 37, 11)
+    assert isinstance(store.features, np.memmap)
+    assert store.n_train_dates == n_train
+    np.testing.assert_array_equal(store.features[5], mat['X_tr'][0][5])
+    np.testing.assert_array_equal(store.features[n_train + 3], mat['X_te'][0][3])
+    np.testing.assert_array_equal(store.ph[:n_train], mat['Y_tr'].T)
+
+    # Flat view reproduces the notebook's concatenation / Fortran-order flattening
+    X_flat, y_flat = store.flat(0, n_train)
+    np.testing.assert_array_equal(X_flat, np.concatenate(list(mat['X_tr'][0]), axis=0))
+    np.testing.assert_array_equal(y_flat, mat['Y_tr'].flatten(order='F'))
+
+
+def test_accessors_are_zero_copy_and_conversion_is_reused(tmp_path):
+    """Test that accessors return views of the memory map and the converted store is reused."""
+    store = SpatioTemporalStore.open(MAT_PATH, str(tmp_path))
+    features, ph = store.window(10, 20, locations=store.location_index(store.location_ids[4]))
+    assert features.shape == (10, 11) and ph.shape == (10,)
+    assert np.shares_memory(features, store.features)
+    assert np.shares_memory(store.flat()[0], store.features)
+    windows, ph_windows = store.sliding_windows(7)
+    assert ph_windows.shape == (store.shape[0] - 6, 37, 7)
+    assert np.shares_memory(windows, store.features)
+
+    mtime = os.path.getmtime(os.path.join(store.directory, 'features.npy'))
+    again = SpatioTemporalStore.open(MAT_PATH, str(tmp_path))
+    assert again.directory == store.directory
+    assert os.path.getmtime(os.path.join(again.directory, 'features.npy')) == mtime